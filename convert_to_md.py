@@ -1,64 +1,302 @@
+import argparse
+import hashlib
+import html
 import json
+import os
 import re
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+URL_PATTERN = re.compile(r'https?://[^\s\"<>\)]+')
+FORMATS = ('md', 'html', 'kb')
+DEFAULT_OUTPUTS = {
+    'md': 'dataset/dataset2.md',
+    'html': 'dataset/dataset2.html',
+    'kb': 'dataset/kb_docs',
+}
+KB_MANIFEST = 'manifest.jsonl'
+HTML_HEADER = ('<!DOCTYPE html>\n<html lang="es">\n<head>\n<meta charset="UTF-8">\n'
+               '<title>Dataset Duoc UC</title>\n</head>\n<body>\n')
+HTML_FOOTER = '</body>\n</html>\n'
+
 
 def extract_url(text):
-    url_pattern = re.compile(r'https?://[^\s\"<>\)]+')
-    matches = url_pattern.findall(str(text))
-    if matches:
-        return matches[0]
+    match = URL_PATTERN.search(str(text))
+    if match:
+        return match.group(0)
     return None
 
-def convert_to_markdown(jsonl_file, output_file):
+
+def record_url(data, text_content):
+    source_value = data.get('source', '')
+    return extract_url(f"{data.get('url') or ''} {source_value} {text_content}")
+
+
+def record_text(data):
+    if 'question' in data and 'answer' in data:
+        return data.get('answer', '')
+    if 'text' in data:
+        return data.get('text', '')
+    return data.get('answer', '')
+
+
+def render_markdown(data):
     md_lines = []
-    
-    with open(jsonl_file, 'r', encoding='utf-8') as f:
-        for line in f:
-            if not line.strip():
-                continue
-                
-            data = json.loads(line)
-            
-            md_lines.append(f"## {data['id']}")
-            md_lines.append("")
-            md_lines.append(f"**ID:** {data['id']}")
-            md_lines.append("")
-            
-            if 'question' in data and 'answer' in data:
-                md_lines.append(f"**Pregunta:** {data['question']}")
-                md_lines.append("")
-                md_lines.append(f"**Respuesta:** {data['answer']}")
-                md_lines.append("")
-                text_content = data.get('answer', '')
-            elif 'text' in data:
-                md_lines.append(f"**Texto:** {data['text']}")
-                md_lines.append("")
-                text_content = data.get('text', '')
-            else:
-                text_content = ''
-            
-            if 'keywords' in data and data['keywords']:
-                md_lines.append(f"**Keywords:** {', '.join(data['keywords'])}")
-                md_lines.append("")
-            
-            if 'alternative_questions' in data and data['alternative_questions']:
-                md_lines.append("**Preguntas Alternativas:**")
-                md_lines.append("")
-                for q in data['alternative_questions']:
-                    md_lines.append(f"- {q}")
-                md_lines.append("")
-            
-            source_value = data.get('source', '')
-            url = extract_url(source_value + ' ' + text_content)
-            
-            md_lines.append(f"**Source:** {url if url else 'No hay fuente'}")
-            md_lines.append("")
-            md_lines.append("---")
-            md_lines.append("")
-    
-    with open(output_file, 'w', encoding='utf-8') as f:
-        f.write('\n'.join(md_lines))
 
-if __name__ == '__main__':
-    convert_to_markdown('dataset/dataset_enriquecido.jsonl', 'dataset/dataset2.md')
-    print("Conversión completada. Archivo creado: dataset/dataset2.md")
+    md_lines.append(f"## {data['id']}")
+    md_lines.append("")
+    md_lines.append(f"**ID:** {data['id']}")
+    md_lines.append("")
+
+    if 'question' in data and 'answer' in data:
+        md_lines.append(f"**Pregunta:** {data['question']}")
+        md_lines.append("")
+        md_lines.append(f"**Respuesta:** {data['answer']}")
+        md_lines.append("")
+    elif 'text' in data:
+        md_lines.append(f"**Texto:** {data['text']}")
+        md_lines.append("")
+    elif 'answer' in data:
+        # Chunks enriquecidos por el scraper: respuesta sin pregunta principal
+        md_lines.append(f"**Respuesta:** {data['answer']}")
+        md_lines.append("")
+    text_content = record_text(data)
+
+    if 'keywords' in data and data['keywords']:
+        md_lines.append(f"**Keywords:** {', '.join(data['keywords'])}")
+        md_lines.append("")
+
+    alternative_questions = data.get('alternative_questions') or data.get('questions')
+    if alternative_questions:
+        md_lines.append("**Preguntas Alternativas:**")
+        md_lines.append("")
+        for q in alternative_questions:
+            md_lines.append(f"- {q}")
+        md_lines.append("")
+
+    url = record_url(data, text_content)
+
+    md_lines.append(f"**Source:** {url if url else 'No hay fuente'}")
+    md_lines.append("")
+    md_lines.append("---")
+    md_lines.append("")
+    return '\n'.join(md_lines)
+
+
+def render_html(data):
+    escape = html.escape
+    text_content = record_text(data)
+    parts = [f'<article id="{escape(str(data["id"]), quote=True)}">', f"<h2>{escape(str(data['id']))}</h2>"]
+
+    if 'question' in data and 'answer' in data:
+        parts.append(f"<p><strong>Pregunta:</strong> {escape(data['question'])}</p>")
+        parts.append(f"<p><strong>Respuesta:</strong> {escape(data['answer'])}</p>")
+    elif text_content:
+        parts.append(f"<p>{escape(text_content)}</p>")
+
+    if data.get('keywords'):
+        parts.append(f"<p><strong>Keywords:</strong> {escape(', '.join(data['keywords']))}</p>")
+
+    alternative_questions = data.get('alternative_questions') or data.get('questions')
+    if alternative_questions:
+        items = ''.join(f"<li>{escape(q)}</li>" for q in alternative_questions)
+        parts.append(f"<p><strong>Preguntas Alternativas:</strong></p><ul>{items}</ul>")
+
+    url = record_url(data, text_content)
+    if url:
+        parts.append(f'<p><strong>Source:</strong> <a href="{escape(url, quote=True)}">{escape(url)}</a></p>')
+    else:
+        parts.append("<p><strong>Source:</strong> No hay fuente</p>")
+    parts.append("</article>")
+    return '\n'.join(parts) + '\n'
+
+
+def kb_metadata(data):
+    """Atributos de metadata en el formato de sidecar de Bedrock Knowledge Bases."""
+    attributes = {
+        'id': str(data['id']),
+        'type': data.get('type'),
+        'category': data.get('category'),
+        'source': data.get('source'),
+        'source_url': record_url(data, record_text(data)),
+        'keywords': data.get('keywords') or None,
+    }
+    return {'metadataAttributes': {key: value for key, value in attributes.items() if value}}
+
+
+def kb_document_name(data):
+    """
+    Nombre estable del documento: id + URL de origen (los ids de chunk se repiten
+    entre páginas). Se mantiene aunque cambie el contenido, así una edición
+    sobrescribe el documento en vez de crear uno nuevo.
+    """
+    safe_id = re.sub(r'[^\w.-]+', '_', str(data['id'])).strip('_')[:80] or 'doc'
+    origin = f"{data['id']}|{data.get('url') or record_url(data, record_text(data)) or ''}"
+    digest = hashlib.sha1(origin.encode('utf-8')).hexdigest()[:10]
+    return f"{safe_id}-{digest}.md"
+
 
+def plan_shards(jsonl_file, shards):
+    """Divide el archivo en rangos de bytes alineados a inicio de línea."""
+    size = os.path.getsize(jsonl_file)
+    shards = max(1, min(shards, size // (64 * 1024) or 1))
+    boundaries = [0]
+    with open(jsonl_file, 'rb') as f:
+        for i in range(1, shards):
+            f.seek(size * i // shards)
+            f.readline()
+            position = f.tell()
+            if boundaries[-1] < position < size:
+                boundaries.append(position)
+    boundaries.append(size)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def part_path(path, index):
+    return f"{path}.part{index:04d}"
+
+
+def export_shard(jsonl_file, start, end, outputs, index):
+    """Exporta los registros entre los bytes `start` y `end` a archivos parciales."""
+    writers = {}
+    manifest = None
+    written_documents = set()
+    count = 0
+    try:
+        if 'md' in outputs:
+            writers['md'] = open(part_path(outputs['md'], index), 'w', encoding='utf-8')
+        if 'html' in outputs:
+            writers['html'] = open(part_path(outputs['html'], index), 'w', encoding='utf-8')
+        if 'kb' in outputs:
+            manifest = open(part_path(os.path.join(outputs['kb'], KB_MANIFEST), index), 'w', encoding='utf-8')
+
+        with open(jsonl_file, 'rb') as f:
+            f.seek(start)
+            position = start
+            while position < end:
+                raw_line = f.readline()
+                if not raw_line:
+                    break
+                position += len(raw_line)
+                if not raw_line.strip():
+                    continue
+
+                data = json.loads(raw_line)
+                markdown = render_markdown(data)
+                if 'md' in writers:
+                    writers['md'].write(markdown + '\n')
+                if 'html' in writers:
+                    writers['html'].write(render_html(data))
+                if manifest:
+                    name = kb_document_name(data)
+                    if name in written_documents:
+                        count += 1
+                        continue
+                    written_documents.add(name)
+                    metadata = kb_metadata(data)
+                    document_path = os.path.join(outputs['kb'], name)
+                    with open(document_path, 'w', encoding='utf-8') as doc:
+                        doc.write(markdown)
+                    with open(document_path + '.metadata.json', 'w', encoding='utf-8') as sidecar:
+                        json.dump(metadata, sidecar, ensure_ascii=False)
+                    manifest.write(json.dumps({'id': data['id'], 'file': name, **metadata},
+                                              ensure_ascii=False) + '\n')
+                count += 1
+    finally:
+        for writer in writers.values():
+            writer.close()
+        if manifest:
+            manifest.close()
+    return count
+
+
+def merge_parts(path, parts, header='', footer='', trim_last_newline=False):
+    with open(path, 'wb') as out:
+        out.write(header.encode('utf-8'))
+        for part in parts:
+            with open(part, 'rb') as f:
+                shutil.copyfileobj(f, out)
+            os.remove(part)
+        if trim_last_newline and out.tell() > len(header):
+            # Mantiene el formato histórico: registros unidos por '\n', sin salto final
+            out.seek(out.tell() - 1)
+            out.truncate()
+        out.write(footer.encode('utf-8'))
+
+
+def merge_manifest(path, parts):
+    """Une los manifiestos parciales, una entrada por documento (los duplicados comparten archivo)."""
+    seen = set()
+    with open(path, 'w', encoding='utf-8') as out:
+        for part in parts:
+            with open(part, 'r', encoding='utf-8') as f:
+                for line in f:
+                    name = json.loads(line)['file']
+                    if name not in seen:
+                        seen.add(name)
+                        out.write(line)
+            os.remove(part)
+
+
+def export(jsonl_file, outputs, workers=1):
+    """
+    Exporta un JSONL a uno o más formatos en una sola pasada y en streaming.
+
+    Args:
+        jsonl_file: Dataset de entrada (un registro JSON por línea)
+        outputs: Formato -> destino, p. ej. {'md': 'x.md', 'html': 'x.html', 'kb': 'kb_docs/'}
+        workers: Procesos en paralelo; el archivo se divide en rangos de bytes
+
+    Returns:
+        Cantidad de registros exportados
+    """
+    unknown = set(outputs) - set(FORMATS)
+    if unknown:
+        raise ValueError(f"Formatos no soportados: {', '.join(sorted(unknown))}")
+    if 'kb' in outputs:
+        os.makedirs(outputs['kb'], exist_ok=True)
+
+    shards = plan_shards(jsonl_file, workers)
+    if len(shards) == 1:
+        counts = [export_shard(jsonl_file, 0, shards[0][1], outputs, 0)]
+    else:
+        with ProcessPoolExecutor(max_workers=len(shards)) as executor:
+            futures = [executor.submit(export_shard, jsonl_file, start, end, outputs, index)
+                       for index, (start, end) in enumerate(shards)]
+            counts = [future.result() for future in futures]
+
+    indexes = range(len(shards))
+    if 'md' in outputs:
+        merge_parts(outputs['md'], [part_path(outputs['md'], i) for i in indexes], trim_last_newline=True)
+    if 'html' in outputs:
+        merge_parts(outputs['html'], [part_path(outputs['html'], i) for i in indexes], HTML_HEADER, HTML_FOOTER)
+    if 'kb' in outputs:
+        manifest_path = os.path.join(outputs['kb'], KB_MANIFEST)
+        merge_manifest(manifest_path, [part_path(manifest_path, i) for i in indexes])
+    return sum(counts)
+
+
+def convert_to_markdown(jsonl_file, output_file):
+    return export(jsonl_file, {'md': output_file})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta un dataset JSONL a Markdown, HTML y documentos para la KB")
+    parser.add_argument('input', nargs='?', default='dataset/dataset_enriquecido.jsonl')
+    parser.add_argument('--formats', default='md', help="Formatos separados por coma: md,html,kb")
+    parser.add_argument('--md', default=DEFAULT_OUTPUTS['md'], help="Archivo Markdown de salida")
+    parser.add_argument('--html', default=DEFAULT_OUTPUTS['html'], help="Archivo HTML de salida")
+    parser.add_argument('--kb', default=DEFAULT_OUTPUTS['kb'], help="Directorio de documentos + sidecars de metadata")
+    parser.add_argument('--workers', type=int, default=1, help="Procesos para dividir el archivo de entrada")
+    args = parser.parse_args()
+
+    formats = [name.strip() for name in args.formats.split(',') if name.strip()]
+    outputs = {name: getattr(args, name) for name in formats if name in FORMATS}
+    total = export(args.input, outputs, args.workers)
+    print(f"Conversión completada: {total} registros.")
+    for name, path in outputs.items():
+        print(f"  {name}: {path}")
+
+
+if __name__ == '__main__':
+    main()
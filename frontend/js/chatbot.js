@@ -5,6 +5,11 @@ document.addEventListener('DOMContentLoaded', () => {
             this.messages = [];
             this.MAX_MESSAGES = 10;
             this.STORAGE_KEY = 'duocChatHistory';
+            this.SYNC_STORAGE_KEY = 'duocChatHistorySync';
+            // Protocolo compacto: el servidor guarda el historial hasta `token`;
+            // solo se envían los mensajes posteriores (`unsynced`)
+            this.token = null;
+            this.unsynced = [];
             this.loadFromStorage();
         }
         
@@ -13,16 +18,35 @@ document.addEventListener('DOMContentLoaded', () => {
             if (this.messages.length > this.MAX_MESSAGES) {
                 this.messages = this.messages.slice(-this.MAX_MESSAGES);
             }
+            this.unsynced.push({ role, content });
             this.saveToStorage();
         }
         
         getHistory() {
             return this.messages;
         }
+
+        // Campos de historial para la solicitud: token + delta, o el historial completo
+        getRequestHistory() {
+            if (this.token) {
+                return { history_token: this.token, history: this.unsynced };
+            }
+            return { history: this.messages };
+        }
+
+        // Token de la última respuesta (cubre todo el historial actual); null = enviar completo
+        setToken(token) {
+            this.token = token || null;
+            this.unsynced = [];
+            this.saveToStorage();
+        }
         
         clear() {
             this.messages = [];
+            this.token = null;
+            this.unsynced = [];
             sessionStorage.removeItem(this.STORAGE_KEY);
+            sessionStorage.removeItem(this.SYNC_STORAGE_KEY);
         }
         
         saveToStorage() {
@@ -31,6 +55,10 @@ document.addEventListener('DOMContentLoaded', () => {
                     this.STORAGE_KEY, 
                     JSON.stringify(this.messages)
                 );
+                sessionStorage.setItem(
+                    this.SYNC_STORAGE_KEY,
+                    JSON.stringify({ token: this.token, unsynced: this.unsynced })
+                );
             } catch (e) {
                 console.warn('Could not save history:', e);
             }
@@ -42,13 +70,106 @@ document.addEventListener('DOMContentLoaded', () => {
                 if (stored) {
                     this.messages = JSON.parse(stored);
                 }
+                const sync = JSON.parse(sessionStorage.getItem(this.SYNC_STORAGE_KEY) || 'null');
+                if (sync) {
+                    this.token = sync.token || null;
+                    this.unsynced = sync.unsynced || [];
+                }
             } catch (e) {
                 console.warn('Could not load history:', e);
                 this.messages = [];
+                this.token = null;
+                this.unsynced = [];
             }
         }
     }
-    
+
+    // Caché de respuestas para preguntas sin contexto (chips y FAQ del bundle estático)
+    class AnswerCache {
+        constructor() {
+            this.entries = {};
+            this.allowed = new Set();
+            this.STORAGE_KEY = 'duocChatAnswerCache';
+            this.DEFAULT_TTL_MS = 30 * 60 * 1000;
+            this.MAX_ENTRIES = 50;
+            this.loadFromStorage();
+        }
+
+        normalize(question) {
+            return question
+                .toLowerCase()
+                .normalize('NFD')
+                .replace(/[\u0300-\u036f]/g, '')
+                .replace(/[¿?¡!.,;:]/g, ' ')
+                .replace(/\s+/g, ' ')
+                .trim();
+        }
+
+        // Solo se cachean preguntas conocidas: su respuesta no depende del historial
+        allow(questions) {
+            questions.forEach(question => this.allowed.add(this.normalize(question)));
+        }
+
+        isCacheable(question) {
+            return this.allowed.has(this.normalize(question));
+        }
+
+        get(question) {
+            const key = this.normalize(question);
+            const entry = this.entries[key];
+            if (!entry) return null;
+            if (entry.expires < Date.now()) {
+                delete this.entries[key];
+                this.saveToStorage();
+                return null;
+            }
+            return { answer: entry.answer, sources: entry.sources };
+        }
+
+        set(question, data, ttlMs = this.DEFAULT_TTL_MS, version = null) {
+            if (!data || !data.answer || data.degraded) return;
+            this.entries[this.normalize(question)] = {
+                answer: data.answer,
+                sources: data.sources || [],
+                expires: Date.now() + ttlMs,
+                version
+            };
+            const keys = Object.keys(this.entries);
+            if (keys.length > this.MAX_ENTRIES) {
+                keys
+                    .sort((a, b) => this.entries[a].expires - this.entries[b].expires)
+                    .slice(0, keys.length - this.MAX_ENTRIES)
+                    .forEach(key => delete this.entries[key]);
+            }
+            this.saveToStorage();
+        }
+
+        hasVersion(question, version) {
+            const entry = this.entries[this.normalize(question)];
+            return Boolean(entry && entry.version === version && entry.expires >= Date.now());
+        }
+
+        saveToStorage() {
+            try {
+                sessionStorage.setItem(this.STORAGE_KEY, JSON.stringify(this.entries));
+            } catch (e) {
+                console.warn('Could not save answer cache:', e);
+            }
+        }
+
+        loadFromStorage() {
+            try {
+                const stored = sessionStorage.getItem(this.STORAGE_KEY);
+                if (stored) {
+                    this.entries = JSON.parse(stored);
+                }
+            } catch (e) {
+                console.warn('Could not load answer cache:', e);
+                this.entries = {};
+            }
+        }
+    }
+
     const chatbot = {
         elements: {
             toggle: document.getElementById('chatbot-toggle'),
@@ -71,11 +192,20 @@ document.addEventListener('DOMContentLoaded', () => {
             cancelSuggestions: document.getElementById('cancel-suggestions')
         },
         apiUrl: 'https://bddoqdk2ti.execute-api.us-east-1.amazonaws.com/ask',
+        // Respuestas precalculadas (scripts/build_chip_answers.py), servidas desde el mismo sitio S3
+        answersBundleUrl: 'data/chip-answers.json',
+        // Pedir a la API los chips que el bundle no cubre al abrir el chat (una llamada RAG por chip)
+        prefetchChipsFromApi: false,
         sessionId: null,
         history: null,
+        answerCache: null,
+        pendingAnswers: new Map(),
+        prefetchStarted: false,
 
         init() {
             this.history = new ChatHistory();
+            this.answerCache = new AnswerCache();
+            this.answerCache.allow(this.getChipQuestions());
             this.getOrCreateSessionId();
             this.loadHistoryToUI();
             this.addEventListeners();
@@ -130,7 +260,10 @@ document.addEventListener('DOMContentLoaded', () => {
         },
 
         addEventListeners() {
-            this.elements.toggle.addEventListener('click', () => this.elements.window.classList.toggle('active'));
+            this.elements.toggle.addEventListener('click', () => {
+                this.elements.window.classList.toggle('active');
+                if (this.elements.window.classList.contains('active')) this.prefetchChipAnswers();
+            });
             this.elements.close.addEventListener('click', () => this.elements.window.classList.remove('active'));
             this.elements.send.addEventListener('click', () => this.sendMessage());
             this.elements.input.addEventListener('keypress', (e) => {
@@ -158,6 +291,99 @@ document.addEventListener('DOMContentLoaded', () => {
             });
         },
 
+        getChipQuestions() {
+            if (!this.elements.chipsContainer) return [];
+            return Array.from(this.elements.chipsContainer.querySelectorAll('.chip')).map(chip => chip.textContent.trim());
+        },
+
+        // Al abrir el chat: carga el bundle estático y, si prefetchChipsFromApi, pide en segundo plano los chips que no cubra
+        async prefetchChipAnswers() {
+            if (this.prefetchStarted) return;
+            this.prefetchStarted = true;
+
+            await this.loadAnswersBundle();
+            if (!this.prefetchChipsFromApi) return;
+            for (const question of this.getChipQuestions()) {
+                if (this.answerCache.get(question)) continue;
+                try {
+                    await this.fetchAnswer(question, { history: [] });
+                } catch (e) {
+                    console.warn('Could not prefetch chip answer:', e);
+                }
+            }
+        },
+
+        async loadAnswersBundle() {
+            try {
+                // no-cache: revalida con ETag, solo descarga el bundle si cambió
+                const response = await fetch(this.answersBundleUrl, { cache: 'no-cache' });
+                if (!response.ok) return;
+                const bundle = await response.json();
+                const ttlMs = bundle.ttl_seconds ? bundle.ttl_seconds * 1000 : undefined;
+                (bundle.answers || []).forEach(item => {
+                    this.answerCache.allow([item.question]);
+                    if (!this.answerCache.hasVersion(item.question, bundle.version)) {
+                        this.answerCache.set(item.question, item, ttlMs, bundle.version);
+                    }
+                });
+            } catch (e) {
+                console.warn('Could not load answers bundle:', e);
+            }
+        },
+
+        // Sin contexto previo: sin token y el historial solo contiene esta misma pregunta
+        isStandaloneRequest(question, historyFields) {
+            const key = this.answerCache.normalize(question);
+            return !historyFields.history_token && (historyFields.history || []).every(
+                msg => msg.role === 'user' && this.answerCache.normalize(msg.content) === key
+            );
+        },
+
+        // Las preguntas cacheables en vuelo se comparten (un clic durante el prefetch no repite la llamada).
+        // Solo se cachean respuestas sin contexto: a mitad de conversación la respuesta depende del historial
+        fetchAnswer(question, historyFields) {
+            const key = this.answerCache.normalize(question);
+            const cacheable = this.answerCache.isCacheable(question) && this.isStandaloneRequest(question, historyFields);
+            if (cacheable && this.pendingAnswers.has(key)) {
+                return this.pendingAnswers.get(key).then(result => ({ ...result, shared: true }));
+            }
+
+            const request = fetch(this.apiUrl, {
+                method: 'POST',
+                headers: { 
+                    'Content-Type': 'application/json'
+                },
+                body: JSON.stringify({ 
+                    query: question,
+                    ...historyFields
+                }),
+                mode: 'cors',
+                credentials: 'omit'
+            }).then(async response => {
+                const data = await response.json().catch(() => ({ error: 'Error desconocido' }));
+                if (response.ok && cacheable) {
+                    this.answerCache.set(question, data);
+                }
+                return { ok: response.ok, status: response.status, data };
+            }).finally(() => {
+                if (cacheable) this.pendingAnswers.delete(key);
+            });
+
+            if (cacheable) this.pendingAnswers.set(key, request);
+            return request;
+        },
+
+        showAnswer(data) {
+            this.addMessage(data.answer, 'bot');
+            
+            if (data.sources && data.sources.length > 0) {
+                this.displaySources(data.sources);
+            }
+            
+            // Solo agregar la respuesta del asistente al historial después de recibirla
+            this.history.addMessage('assistant', data.answer);
+        },
+
         addClearHistoryListener() {
             if (this.elements.clearHistory) {
                 this.elements.clearHistory.addEventListener('click', () => {
@@ -178,8 +404,12 @@ document.addEventListener('DOMContentLoaded', () => {
             // Esto previene race conditions cuando el usuario envía múltiples mensajes rápidamente
             this.history.addMessage('user', message);
             
-            // Obtener una copia del historial actualizado para esta petición
-            const historyForRequest = this.history.getHistory();
+            // Respuesta cacheada (chip o FAQ): se muestra sin llamar a la API, solo sin contexto previo
+            const cached = this.isStandaloneRequest(message, this.history.getRequestHistory()) && this.answerCache.get(message);
+            if (cached) {
+                this.showAnswer(cached);
+                return;
+            }
             
             this.addTypingIndicator();
 
@@ -188,21 +418,15 @@ document.addEventListener('DOMContentLoaded', () => {
             this.elements.send.disabled = true;
 
             try {
-                const response = await fetch(this.apiUrl, {
-                    method: 'POST',
-                    headers: { 
-                        'Content-Type': 'application/json'
-                    },
-                    body: JSON.stringify({ 
-                        query: message,
-                        history: historyForRequest
-                    }),
-                    mode: 'cors',
-                    credentials: 'omit'
-                });
+                let response = await this.fetchAnswer(message, this.history.getRequestHistory());
+                if (response.status === 409 && response.data.error === 'history_required') {
+                    // El servidor ya no tiene el historial de este token: reenviar completo
+                    this.history.setToken(null);
+                    response = await this.fetchAnswer(message, this.history.getRequestHistory());
+                }
 
                 if (!response.ok) {
-                    const errorData = await response.json().catch(() => ({ error: 'Error desconocido' }));
+                    const errorData = response.data;
                     const errorMessage = this.getErrorMessage(response.status, errorData.error);
                     this.addMessage(errorMessage, 'bot');
                     // Agregar el mensaje de error al historial también
@@ -211,15 +435,9 @@ document.addEventListener('DOMContentLoaded', () => {
                     return;
                 }
                 
-                const data = await response.json();
-                this.addMessage(data.answer, 'bot');
-                
-                if (data.sources && data.sources.length > 0) {
-                    this.displaySources(data.sources);
-                }
-                
-                // Solo agregar la respuesta del asistente al historial después de recibirla
-                this.history.addMessage('assistant', data.answer);
+                this.showAnswer(response.data);
+                // Una respuesta compartida con el prefetch no corresponde a este historial
+                this.history.setToken(response.shared ? null : response.data.history_token);
 
             } catch (error) {
                 // Manejo específico de errores CORS
@@ -589,7 +807,9 @@ document.addEventListener('DOMContentLoaded', () => {
         confirmClearHistoryAction() {
             // A. Borrar el sessionStorage
             sessionStorage.clear();
-            this.history.messages = [];
+            this.history.clear();
+            // Las respuestas cacheadas no son parte de la conversación: se conservan
+            this.answerCache.saveToStorage();
             
             // Regenerar ID de sesión
             this.getOrCreateSessionId();
@@ -1,10 +1,17 @@
+import base64
+import functools
+import gzip
 import json
 import os
 import logging
+import random
 import re
+import threading
+import time
 from typing import Dict, List, Any, Optional, Tuple
 import boto3
-from botocore.exceptions import ClientError
+from botocore.config import Config
+from botocore.exceptions import ClientError, HTTPClientError
 
 # Configuración del logger para una mejor observabilidad en CloudWatch
 logger = logging.getLogger()
@@ -19,6 +26,32 @@ except ImportError:
     LLM_GUARD_AVAILABLE = False
     logger.warning("LLM Guard no está disponible. Instalar con: pip install llm-guard")
 
+from bedrock_cassette import CassetteStore, RecordingClient, ReplayClient
+from coalescing import DynamoDBCoalescingStore, MemoryCoalescingStore, RequestCoalescer, coalescing_key
+from conversation_store import DynamoDBConversationStore, MemoryConversationStore
+from lexical_faq import LexicalFaqIndex, load_faq_records
+from prompt_templates import DEFAULT_VERSION as DEFAULT_PROMPT_TEMPLATE_VERSION, get_templates
+
+# Detector de prompt injection sobre ONNX Runtime (opcional, requiere numpy, onnxruntime y tokenizers)
+try:
+    from injection_scanner import ONNX_AVAILABLE, OnnxPromptInjectionScanner
+except ImportError:
+    ONNX_AVAILABLE = False
+
+# Compresión brotli de respuestas (opcional, sin brotli se usa gzip)
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+# Índice semántico local (opcional, requiere numpy en el paquete o en una layer)
+try:
+    from semantic_index import SemanticAnswerCache, SemanticIndex
+    SEMANTIC_INDEX_AVAILABLE = True
+except ImportError:
+    SEMANTIC_INDEX_AVAILABLE = False
+
 # --- Variables de Entorno (Configurar en la consola de Lambda) ---
 # Se obtienen las configuraciones del entorno para evitar hardcodear valores.
 KNOWLEDGE_BASE_ID = os.environ.get('KNOWLEDGE_BASE_ID')
@@ -32,6 +65,25 @@ MODEL_ARN = None
 if MODEL_ID:
     MODEL_ARN = f'arn:aws:bedrock:{AWS_REGION}::foundation-model/{MODEL_ID}'
 
+# Model tiering: modelo rápido para consultas simples y modelo fuerte para complejas.
+# Se aceptan ARNs completos (*_MODEL_ARN) o IDs de modelo (*_MODEL_ID); el modelo fuerte
+# por defecto es MODEL_ARN y, sin modelo rápido configurado, todo va al modelo fuerte.
+MODEL_TIERING_ENABLED = os.environ.get('MODEL_TIERING_ENABLED', 'false').lower() == 'true'
+FAST_MODEL_ID = os.environ.get('FAST_MODEL_ID')
+STRONG_MODEL_ID = os.environ.get('STRONG_MODEL_ID')
+FAST_MODEL_ARN = os.environ.get('FAST_MODEL_ARN') or (
+    f'arn:aws:bedrock:{AWS_REGION}::foundation-model/{FAST_MODEL_ID}' if FAST_MODEL_ID else None
+)
+STRONG_MODEL_ARN = os.environ.get('STRONG_MODEL_ARN') or (
+    f'arn:aws:bedrock:{AWS_REGION}::foundation-model/{STRONG_MODEL_ID}' if STRONG_MODEL_ID else MODEL_ARN
+)
+MODEL_ROUTER_MAX_SIMPLE_CHARS = int(os.environ.get('MODEL_ROUTER_MAX_SIMPLE_CHARS', '120'))
+MODEL_ROUTER_MAX_SIMPLE_WORDS = int(os.environ.get('MODEL_ROUTER_MAX_SIMPLE_WORDS', '18'))
+MODEL_ROUTER_MAX_SIMPLE_HISTORY = int(os.environ.get('MODEL_ROUTER_MAX_SIMPLE_HISTORY', '4'))
+
+# Namespace de CloudWatch para métricas en Embedded Metric Format (EMF)
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'DuocAsistente')
+
 # Variables opcionales con valores por defecto
 TEMPERATURE = float(os.environ.get('TEMPERATURE'))
 TOP_P = float(os.environ.get('TOP_P'))  # Valor recomendado para controlar la masa hilada
@@ -41,25 +93,356 @@ MAX_CONTEXT_MESSAGES = int(os.environ.get('MAX_CONTEXT_MESSAGES'))
 
 # Validar que TEMPERATURE esté en rango válido (0.0 a 1.0)
 if not 0.0 <= TEMPERATURE <= 1.0:
-    logger.warning(f"TEMPERATURE fuera de rango válido ({TEMPERATURE}), usando valor por defecto 0.2")
+    logger.warning("TEMPERATURE fuera de rango válido (%s), usando valor por defecto 0.2", TEMPERATURE)
     TEMPERATURE = 0.2
 
-# Inicializar el cliente de Bedrock Agent Runtime fuera del handler para reutilización
-bedrock_agent_runtime = boto3.client(
-    'bedrock-agent-runtime',
-    region_name=AWS_REGION
-)
-
 # Variable de entorno para timeout mínimo (segundos)
 MIN_TIMEOUT_SECONDS = float(os.environ.get('MIN_TIMEOUT_SECONDS', '5.0'))
 
+# Variables de entorno para el cliente de Bedrock (pool, reintentos y presupuesto de tiempo)
+BEDROCK_MAX_POOL_CONNECTIONS = int(os.environ.get('BEDROCK_MAX_POOL_CONNECTIONS', '25'))
+BEDROCK_MAX_ATTEMPTS = int(os.environ.get('BEDROCK_MAX_ATTEMPTS', '3'))
+BEDROCK_CONNECT_TIMEOUT = float(os.environ.get('BEDROCK_CONNECT_TIMEOUT', '2.0'))
+BEDROCK_READ_TIMEOUT = float(os.environ.get('BEDROCK_READ_TIMEOUT', '25.0'))  # Tope por intento
+BEDROCK_MIN_CALL_SECONDS = float(os.environ.get('BEDROCK_MIN_CALL_SECONDS', '3.0'))
+BEDROCK_DEADLINE_MARGIN_SECONDS = float(os.environ.get('BEDROCK_DEADLINE_MARGIN_SECONDS', '1.0'))
+BEDROCK_BACKOFF_BASE_SECONDS = float(os.environ.get('BEDROCK_BACKOFF_BASE_SECONDS', '0.25'))
+BEDROCK_BACKOFF_MAX_SECONDS = float(os.environ.get('BEDROCK_BACKOFF_MAX_SECONDS', '4.0'))
+
+# Cassettes de Bedrock para pruebas y benchmarks sin red (ver bedrock_cassette.py); 'off' en producción
+BEDROCK_CASSETTE_MODE = os.environ.get('BEDROCK_CASSETTE_MODE', 'off').lower()  # off | record | replay
+BEDROCK_CASSETTE_PATH = os.environ.get('BEDROCK_CASSETTE_PATH')  # .jsonl.gz
+BEDROCK_REPLAY_LATENCY_SCALE = float(os.environ.get('BEDROCK_REPLAY_LATENCY_SCALE', '1.0'))
+BEDROCK_REPLAY_THROTTLE_RATE = float(os.environ.get('BEDROCK_REPLAY_THROTTLE_RATE', '0'))
+BEDROCK_REPLAY_CITATION_DROP_RATE = float(os.environ.get('BEDROCK_REPLAY_CITATION_DROP_RATE', '0'))
+
+# Variables de entorno para el circuit breaker de Bedrock
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = int(os.environ.get('CIRCUIT_BREAKER_FAILURE_THRESHOLD', '5'))
+CIRCUIT_BREAKER_RESET_SECONDS = float(os.environ.get('CIRCUIT_BREAKER_RESET_SECONDS', '30.0'))
+
+# Admission control: presupuesto de solicitudes RAG concurrentes por contenedor
+ADMISSION_CONTROL_ENABLED = os.environ.get('ADMISSION_CONTROL_ENABLED', 'true').lower() == 'true'
+RAG_MAX_CONCURRENCY = int(os.environ.get('RAG_MAX_CONCURRENCY', '8'))
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT_SECONDS', '0.5'))  # Espera máxima por un cupo
+ADMISSION_RETRY_AFTER_SECONDS = int(os.environ.get('ADMISSION_RETRY_AFTER_SECONDS', '5'))
+SHED_FALLBACK_MIN_SCORE = float(os.environ.get('SHED_FALLBACK_MIN_SCORE', '0.6'))  # FAQ léxica al descartar
+# FAQ curadas para el respaldo léxico (sin índice semántico). Vacío = la copia dentro del
+# paquete (lambda/dataset_enriquecido.jsonl, sincronizada con scripts/sync_lambda_faq.py)
+# o, si no está, dataset/dataset_enriquecido.jsonl del repositorio.
+SHED_FALLBACK_FAQ_PATH = os.environ.get('SHED_FALLBACK_FAQ_PATH') or None
+SHED_FALLBACK_FAQ_CANDIDATES = [
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dataset_enriquecido.jsonl'),
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'dataset', 'dataset_enriquecido.jsonl'),
+]
+
+# Contabilidad de tokens y costo por solicitud, con presupuesto por minuto (por contenedor)
+ACCOUNTING_ENABLED = os.environ.get('ACCOUNTING_ENABLED', 'true').lower() == 'true'
+TOKEN_BUDGET_PER_MINUTE = int(os.environ.get('TOKEN_BUDGET_PER_MINUTE', '0'))  # Entrada + salida; 0 = sin presupuesto
+TOKEN_BUDGET_SOFT_RATIO = float(os.environ.get('TOKEN_BUDGET_SOFT_RATIO', '0.8'))  # Desde aquí se reduce el gasto
+TOKEN_BUDGET_MIN_MAX_TOKENS = int(os.environ.get('TOKEN_BUDGET_MIN_MAX_TOKENS', '256'))
+TOKEN_BUDGET_MIN_CONTEXT_MESSAGES = int(os.environ.get('TOKEN_BUDGET_MIN_CONTEXT_MESSAGES', '2'))
+INPUT_TOKEN_PRICE_PER_1K = float(os.environ.get('INPUT_TOKEN_PRICE_PER_1K', '0'))  # USD, según el modelo en Bedrock
+OUTPUT_TOKEN_PRICE_PER_1K = float(os.environ.get('OUTPUT_TOKEN_PRICE_PER_1K', '0'))
+GUARDRAIL_PRICE_PER_1K_UNITS = float(os.environ.get('GUARDRAIL_PRICE_PER_1K_UNITS', '0'))
+GUARDRAIL_TEXT_UNIT_CHARS = 1000  # Bedrock Guardrails cobra por unidad de texto de hasta 1.000 caracteres
+
+# Códigos de error de Bedrock que justifican un reintento con backoff
+RETRYABLE_ERROR_CODES = {
+    'ThrottlingException',
+    'TooManyRequestsException',
+    'ServiceUnavailableException',
+    'InternalServerException',
+    'ModelNotReadyException',
+}
+THROTTLING_ERROR_CODES = {'ThrottlingException', 'TooManyRequestsException'}
+
+# Respuesta degradada cuando Bedrock no está disponible (circuito abierto o sin tiempo)
+DEGRADED_ANSWER = (
+    "En este momento el asistente está recibiendo una alta demanda y no puede consultar "
+    "la base de conocimientos. Por favor, intenta nuevamente en unos minutos o visita "
+    "https://www.duoc.cl/ para más información."
+)
+
+
+class BedrockUnavailableError(Exception):
+    """
+    Bedrock no puede atender la solicitud: circuito abierto, presupuesto de tiempo
+    agotado o errores transitorios persistentes tras los reintentos.
+    """
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker para llamadas a Bedrock.
+    Tras CIRCUIT_BREAKER_FAILURE_THRESHOLD fallos consecutivos se abre y rechaza llamadas
+    durante CIRCUIT_BREAKER_RESET_SECONDS; luego deja pasar una llamada de prueba (half-open).
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = None, reset_seconds: float = None):
+        self.failure_threshold = failure_threshold or CIRCUIT_BREAKER_FAILURE_THRESHOLD
+        self.reset_seconds = reset_seconds if reset_seconds is not None else CIRCUIT_BREAKER_RESET_SECONDS
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._half_open_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        """
+        Indica si se permite llamar a Bedrock según el estado del circuito.
+
+        Returns:
+            True si la llamada puede realizarse, False si el circuito está abierto
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_seconds:
+                    return False
+                self.state = self.HALF_OPEN
+                self._half_open_in_flight = False
+
+            # HALF_OPEN: solo una llamada de prueba a la vez
+            if self._half_open_in_flight:
+                return False
+            self._half_open_in_flight = True
+            return True
+
+    def record_success(self) -> None:
+        """Registra una llamada exitosa y cierra el circuito."""
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info("Circuit breaker de Bedrock cerrado tras llamada exitosa")
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self._half_open_in_flight = False
+
+    def release(self) -> None:
+        """Libera la llamada de prueba (half-open) sin registrar éxito ni fallo."""
+        with self._lock:
+            self._half_open_in_flight = False
+
+    def record_failure(self) -> None:
+        """Registra un fallo transitorio y abre el circuito si se supera el umbral."""
+        with self._lock:
+            self.consecutive_failures += 1
+            self._half_open_in_flight = False
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(
+                        "Circuit breaker de Bedrock abierto tras %d fallos consecutivos", self.consecutive_failures,
+                        extra={'consecutive_failures': self.consecutive_failures}
+                    )
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class BedrockClientManager:
+    """
+    Administra los clientes de Bedrock Agent Runtime con pool de conexiones ajustado,
+    modo de reintentos adaptativo, timeouts por llamada derivados del tiempo restante
+    de Lambda, backoff consciente de throttling y circuit breaker.
+    """
+    def __init__(self, client_factory=None, circuit_breaker: CircuitBreaker = None):
+        self._client_factory = client_factory or self._create_client
+        self._clients: Dict[int, Any] = {}
+        self._lock = threading.Lock()
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+
+    def _create_client(self, read_timeout: int) -> Any:
+        """
+        Crea un cliente boto3 con pool ampliado y reintentos adaptativos.
+        Los reintentos de botocore se limitan a un intento: el backoff lo controla
+        call_with_budget() para respetar el deadline de Lambda.
+        """
+        config = Config(
+            region_name=AWS_REGION,
+            max_pool_connections=BEDROCK_MAX_POOL_CONNECTIONS,
+            connect_timeout=BEDROCK_CONNECT_TIMEOUT,
+            read_timeout=read_timeout,
+            tcp_keepalive=True,
+            retries={'mode': 'adaptive', 'total_max_attempts': 1},
+        )
+        return boto3.client('bedrock-agent-runtime', config=config)
+
+    def get_client(self, read_timeout: float = None) -> Any:
+        """
+        Obtiene (o crea) un cliente para el timeout de lectura indicado.
+        Los timeouts se agrupan en segundos enteros para reutilizar pocos clientes
+        (y sus conexiones) entre invocaciones calientes.
+
+        Args:
+            read_timeout: Timeout de lectura en segundos (default: BEDROCK_READ_TIMEOUT)
+
+        Returns:
+            Cliente de Bedrock Agent Runtime
+        """
+        if read_timeout is None:
+            read_timeout = BEDROCK_READ_TIMEOUT
+        bucket = max(1, int(min(read_timeout, BEDROCK_READ_TIMEOUT)))
+
+        client = self._clients.get(bucket)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(bucket)
+                if client is None:
+                    client = self._client_factory(bucket)
+                    self._clients[bucket] = client
+        return client
+
+    def _backoff_seconds(self, attempt: int, throttled: bool) -> float:
+        """
+        Backoff exponencial con full jitter; el throttling parte de una base mayor.
+        """
+        base = BEDROCK_BACKOFF_BASE_SECONDS * (4 if throttled else 1)
+        return random.uniform(0, min(BEDROCK_BACKOFF_MAX_SECONDS, base * (2 ** attempt)))
+
+    def call_with_budget(self, operation: str, context: Any = None, **kwargs) -> Dict[str, Any]:
+        """
+        Invoca una operación de Bedrock respetando el presupuesto de tiempo de Lambda.
+
+        Args:
+            operation: Nombre de la operación del cliente (ej: 'retrieve_and_generate')
+            context: Contexto de Lambda (opcional) para derivar el deadline
+            **kwargs: Parámetros de la operación
+
+        Returns:
+            Respuesta de Bedrock
+
+        Raises:
+            BedrockUnavailableError: Circuito abierto, presupuesto agotado o fallos de transporte
+            ClientError: Errores no transitorios o throttling persistente
+        """
+        if not self.circuit_breaker.allow_request():
+            raise BedrockUnavailableError('Circuit breaker abierto')
+
+        remaining = get_remaining_seconds(context)
+        deadline = None
+        if remaining is not None:
+            deadline = time.monotonic() + remaining - BEDROCK_DEADLINE_MARGIN_SECONDS
+
+        try:
+            return self._call_until_deadline(operation, deadline, **kwargs)
+        except BaseException:
+            # Cualquier salida con error (incluidas excepciones no previstas) libera la
+            # llamada de prueba; si no, el circuito queda half-open sin admitir llamadas.
+            self.circuit_breaker.release()
+            raise
+
+    def _call_until_deadline(self, operation: str, deadline: Optional[float], **kwargs) -> Dict[str, Any]:
+        """Reintentos con backoff hasta BEDROCK_MAX_ATTEMPTS o hasta el deadline."""
+        attempt = 0
+        while True:
+            budget = BEDROCK_READ_TIMEOUT if deadline is None else deadline - time.monotonic()
+            if budget < BEDROCK_MIN_CALL_SECONDS:
+                # La falta de tiempo no es culpa de Bedrock: no se penaliza el circuito
+                raise BedrockUnavailableError(f'Presupuesto de tiempo insuficiente ({budget:.2f}s)')
+
+            client = self.get_client(min(budget, BEDROCK_READ_TIMEOUT))
+            try:
+                response = getattr(client, operation)(**kwargs)
+                self.circuit_breaker.record_success()
+                return response
+            except ClientError as e:
+                error_code = e.response.get('Error', {}).get('Code', '')
+                if error_code not in RETRYABLE_ERROR_CODES:
+                    # Errores de validación/permisos no indican que Bedrock esté caído
+                    self.circuit_breaker.record_success()
+                    raise
+                throttled = error_code in THROTTLING_ERROR_CODES
+                last_error: Exception = e
+            except HTTPClientError as e:
+                # Timeouts, conexión rechazada/cerrada, SSL y proxy: fallos de transporte
+                throttled = False
+                last_error = e
+
+            attempt += 1
+            delay = self._backoff_seconds(attempt, throttled)
+            time_left = None if deadline is None else deadline - time.monotonic()
+            can_retry = attempt < BEDROCK_MAX_ATTEMPTS and (
+                time_left is None or time_left - delay >= BEDROCK_MIN_CALL_SECONDS
+            )
+            logger.warning(
+                "Fallo transitorio de Bedrock en intento %d/%d: %s (reintento: %s, backoff: %.2fs)",
+                attempt, BEDROCK_MAX_ATTEMPTS, type(last_error).__name__, can_retry, delay,
+                extra={'attempt': attempt, 'throttled': throttled, 'backoff_seconds': delay}
+            )
+            if not can_retry:
+                self.circuit_breaker.record_failure()
+                if isinstance(last_error, ClientError):
+                    raise last_error
+                raise BedrockUnavailableError(str(last_error)) from last_error
+            time.sleep(delay)
+
+    def retrieve_and_generate(self, context: Any = None, **kwargs) -> Dict[str, Any]:
+        """Atajo para RetrieveAndGenerate con presupuesto de tiempo."""
+        return self.call_with_budget('retrieve_and_generate', context=context, **kwargs)
+
+
+def create_bedrock_client_manager() -> BedrockClientManager:
+    """
+    Crea el administrador del cliente de Bedrock. Con BEDROCK_CASSETTE_MODE=record
+    las llamadas reales se graban en BEDROCK_CASSETTE_PATH; con replay se responden
+    desde el cassette sin red (con latencia, throttling y citas parciales inyectables).
+    
+    Returns:
+        BedrockClientManager
+    """
+    if BEDROCK_CASSETTE_MODE == 'off':
+        return BedrockClientManager()
+    if BEDROCK_CASSETTE_MODE not in ('record', 'replay') or not BEDROCK_CASSETTE_PATH:
+        logger.warning(
+            "BEDROCK_CASSETTE_MODE=%s requiere record|replay y BEDROCK_CASSETTE_PATH, se usa Bedrock real",
+            BEDROCK_CASSETTE_MODE
+        )
+        return BedrockClientManager()
+
+    store = CassetteStore(BEDROCK_CASSETTE_PATH)
+    if BEDROCK_CASSETTE_MODE == 'replay':
+        replay_client = ReplayClient(
+            store,
+            latency_scale=BEDROCK_REPLAY_LATENCY_SCALE,
+            throttle_rate=BEDROCK_REPLAY_THROTTLE_RATE,
+            citation_drop_rate=BEDROCK_REPLAY_CITATION_DROP_RATE
+        )
+        logger.warning("Bedrock en modo replay: %d respuestas grabadas en %s", len(store), BEDROCK_CASSETTE_PATH)
+        return BedrockClientManager(client_factory=lambda read_timeout: replay_client)
+
+    manager = BedrockClientManager()
+    create_client = manager._create_client
+    manager._client_factory = lambda read_timeout: RecordingClient(create_client(read_timeout), store)
+    logger.warning("Bedrock en modo record: grabando en %s", BEDROCK_CASSETTE_PATH)
+    return manager
+
+
+# Inicializar el administrador del cliente de Bedrock fuera del handler para reutilización
+bedrock_client_manager = create_bedrock_client_manager()
+bedrock_agent_runtime = bedrock_client_manager.get_client()
+
+# Tracing por spans en formato EMF (una línea JSON por solicitud)
+TRACING_ENABLED = os.environ.get('TRACING_ENABLED', 'true').lower() == 'true'
+
 # Variables de entorno para Citation Validation
 MIN_CITATION_SCORE = float(os.environ.get('MIN_CITATION_SCORE', '0.7'))
 MAX_CITATIONS = int(os.environ.get('MAX_CITATIONS', '5'))
+SOURCE_EXCERPT_MAX_CHARS = int(os.environ.get('SOURCE_EXCERPT_MAX_CHARS', '150'))  # chatbot.js muestra 150; 0 = texto completo
 
 # Variables de entorno para LLM Guard
 LLM_GUARD_ENABLED = os.environ.get('LLM_GUARD_ENABLED', 'false').lower() == 'true'
 LLM_GUARD_THRESHOLD = float(os.environ.get('LLM_GUARD_THRESHOLD', '0.5'))
+LLM_GUARD_BACKEND = os.environ.get('LLM_GUARD_BACKEND', 'llm_guard').lower()  # llm_guard | onnx
+LLM_GUARD_ONNX_MODEL_DIR = os.environ.get(
+    'LLM_GUARD_ONNX_MODEL_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'prompt_injection')
+)  # Generado por scripts/build_injection_model.py
+LLM_GUARD_ONNX_QUANTIZED = os.environ.get('LLM_GUARD_ONNX_QUANTIZED', 'true').lower() == 'true'
+LLM_GUARD_ONNX_THREADS = int(os.environ.get('LLM_GUARD_ONNX_THREADS', '0'))  # 0 = automático
+LLM_GUARD_MAX_LENGTH = int(os.environ.get('LLM_GUARD_MAX_LENGTH', '512'))
+LLM_GUARD_SCAN_CACHE_SIZE = int(os.environ.get('LLM_GUARD_SCAN_CACHE_SIZE', '2048'))
 
 # --- NUEVO: CONFIGURACIÓN DE GUARDRAILS DE BEDROCK ---
 # ID del Guardrail: Duoc_uc_agente
@@ -67,12 +450,56 @@ GUARDRAIL_ID = os.environ.get('GUARDRAIL_ID', '0vix46kwrtvl')
 # Versión del Guardrail (Use 'DRAFT' mientras prueba, luego cambie a '1')
 GUARDRAIL_VERSION = os.environ.get('GUARDRAIL_VERSION', 'DRAFT')
 
+# Moderación por niveles: un filtro local decide qué solicitudes llevan el guardrail de Bedrock
+MODERATION_MODE = os.environ.get('MODERATION_MODE', 'always').lower()  # always (guardrail siempre) | tiered
+MODERATION_RISK_THRESHOLD = float(os.environ.get('MODERATION_RISK_THRESHOLD', '0.3'))  # Desde aquí: riesgo ambiguo
+MODERATION_GUARDRAIL_SAMPLE_RATE = float(os.environ.get('MODERATION_GUARDRAIL_SAMPLE_RATE', '0.05'))  # Bajo riesgo con guardrail (medir acuerdo)
+MODERATION_LONG_TEXT_CHARS = int(os.environ.get('MODERATION_LONG_TEXT_CHARS', '1500'))
+
+# Versión de los prompt templates de orquestación y generación (ver prompt_templates.py)
+PROMPT_TEMPLATE_VERSION = os.environ.get('PROMPT_TEMPLATE_VERSION', DEFAULT_PROMPT_TEMPLATE_VERSION)
+
 # Variables de entorno para Query Optimization (Phase 2)
 QUERY_OPTIMIZATION_ENABLED = os.environ.get('QUERY_OPTIMIZATION_ENABLED', 'true').lower() == 'true'
 QUERY_EXPANSION_ENABLED = os.environ.get('QUERY_EXPANSION_ENABLED', 'true').lower() == 'true'
 HYBRID_SEARCH_ENABLED = os.environ.get('HYBRID_SEARCH_ENABLED', 'true').lower() == 'true'
 QUERY_DECOMPOSITION_ENABLED = os.environ.get('QUERY_DECOMPOSITION_ENABLED', 'true').lower() == 'true'
 MAX_QUERY_EXPANSIONS = int(os.environ.get('MAX_QUERY_EXPANSIONS', '3'))
+QUERY_TABLES_ENABLED = os.environ.get('QUERY_TABLES_ENABLED', 'true').lower() == 'true'
+QUERY_TABLES_PATH = os.environ.get(
+    'QUERY_TABLES_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'query_tables.json')
+)  # Tablas minadas por scripts/mine_query_tables.py; sin archivo se usan las tablas fijas
+QUERY_TABLES_VERSION = 1
+
+# Variables de entorno para el índice semántico (deflexión de FAQ y caché de respuestas)
+SEMANTIC_INDEX_ENABLED = os.environ.get('SEMANTIC_INDEX_ENABLED', 'false').lower() == 'true'
+SEMANTIC_INDEX_PATH = os.environ.get(
+    'SEMANTIC_INDEX_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'semantic_index')
+)  # Ruta sin extensión (.npy + .json), generada por scripts/build_semantic_index.py
+SEMANTIC_QUERY_CACHE_SIZE = int(os.environ.get('SEMANTIC_QUERY_CACHE_SIZE', '1024'))
+FAQ_DEFLECTION_THRESHOLD = float(os.environ.get('FAQ_DEFLECTION_THRESHOLD', '0.9'))
+SEMANTIC_CACHE_ENABLED = os.environ.get('SEMANTIC_CACHE_ENABLED', 'false').lower() == 'true'
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get('SEMANTIC_CACHE_THRESHOLD', '0.95'))
+SEMANTIC_CACHE_SIZE = int(os.environ.get('SEMANTIC_CACHE_SIZE', '256'))
+SEMANTIC_CACHE_TTL_SECONDS = float(os.environ.get('SEMANTIC_CACHE_TTL_SECONDS', '3600'))
+
+# Variables de entorno para coalescing de consultas idénticas en vuelo
+COALESCING_ENABLED = os.environ.get('COALESCING_ENABLED', 'false').lower() == 'true'
+COALESCING_STORE = os.environ.get('COALESCING_STORE', 'none').lower()  # none (solo en proceso) | memory | dynamodb
+COALESCING_TABLE = os.environ.get('COALESCING_TABLE')
+COALESCING_LOCK_TTL_SECONDS = float(os.environ.get('COALESCING_LOCK_TTL_SECONDS', '30'))
+COALESCING_RESULT_TTL_SECONDS = float(os.environ.get('COALESCING_RESULT_TTL_SECONDS', '5'))
+COALESCING_MAX_WAIT_SECONDS = float(os.environ.get('COALESCING_MAX_WAIT_SECONDS', '20'))
+COALESCING_POLL_SECONDS = float(os.environ.get('COALESCING_POLL_SECONDS', '0.1'))
+
+# Protocolo compacto: historial por token + delta (ver conversation_store.py) y compresión de respuestas
+CONVERSATION_STORE = os.environ.get('CONVERSATION_STORE', 'none').lower()  # none (historial completo) | memory | dynamodb
+CONVERSATION_TABLE = os.environ.get('CONVERSATION_TABLE')
+CONVERSATION_TTL_SECONDS = float(os.environ.get('CONVERSATION_TTL_SECONDS', '3600'))
+CONVERSATION_CACHE_SIZE = int(os.environ.get('CONVERSATION_CACHE_SIZE', '1024'))
+# Requiere que API Gateway entregue el body binario (binaryMediaTypes en REST API; HTTP API y Function URL lo hacen siempre)
+RESPONSE_COMPRESSION_ENABLED = os.environ.get('RESPONSE_COMPRESSION_ENABLED', 'false').lower() == 'true'
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.environ.get('RESPONSE_COMPRESSION_MIN_BYTES', '1024'))
 
 
 class PromptInjectionFilter:
@@ -215,7 +642,7 @@ class OutputValidator:
             return "No puedo proporcionar esa información por razones de seguridad."
         
         if len(response) > max_length:
-            logger.warning(f"Output exceeds maximum length: {len(response)}")
+            logger.warning("Output exceeds maximum length: %d", len(response))
             return response[:max_length] + "..."
         
         return response
@@ -227,20 +654,253 @@ output_validator = OutputValidator()
 
 # Inicializar LLM Guard scanner (si está disponible y habilitado)
 llm_guard_scanner = None
-if LLM_GUARD_AVAILABLE and LLM_GUARD_ENABLED:
+if LLM_GUARD_ENABLED and LLM_GUARD_BACKEND == 'onnx':
+    if ONNX_AVAILABLE:
+        # El modelo se carga en el primer escaneo, no en el cold start
+        llm_guard_scanner = OnnxPromptInjectionScanner(
+            LLM_GUARD_ONNX_MODEL_DIR,
+            threshold=LLM_GUARD_THRESHOLD,
+            quantized=LLM_GUARD_ONNX_QUANTIZED,
+            max_length=LLM_GUARD_MAX_LENGTH,
+            cache_size=LLM_GUARD_SCAN_CACHE_SIZE,
+            threads=LLM_GUARD_ONNX_THREADS,
+        )
+        logger.info("LLM Guard (ONNX) habilitado con threshold: %s", LLM_GUARD_THRESHOLD)
+    else:
+        logger.warning("LLM Guard ONNX habilitado pero no disponible. Instalar con: pip install onnxruntime tokenizers")
+elif LLM_GUARD_AVAILABLE and LLM_GUARD_ENABLED:
     try:
         llm_guard_scanner = PromptInjection(
             threshold=LLM_GUARD_THRESHOLD,
             match_type=MatchType.FULL
         )
-        logger.info(f"LLM Guard habilitado con threshold: {LLM_GUARD_THRESHOLD}")
+        logger.info("LLM Guard habilitado con threshold: %s", LLM_GUARD_THRESHOLD)
     except Exception as e:
-        logger.warning(f"Error inicializando LLM Guard: {str(e)}. Usando filtro manual.")
+        logger.warning("Error inicializando LLM Guard: %s. Usando filtro manual.", e)
         llm_guard_scanner = None
 elif LLM_GUARD_ENABLED and not LLM_GUARD_AVAILABLE:
     logger.warning("LLM Guard habilitado pero no disponible. Instalar con: pip install llm-guard")
 
 
+def load_semantic_index() -> Tuple[Optional[Any], Optional[Any]]:
+    """
+    Abre el índice semántico en el cold start (memory-map, sin copiar la matriz)
+    y crea la caché de respuestas por similitud.
+
+    Returns:
+        Tupla (índice, caché de respuestas); None en lo que no esté disponible
+    """
+    if not SEMANTIC_INDEX_ENABLED:
+        return None, None
+    if not SEMANTIC_INDEX_AVAILABLE:
+        logger.warning("Índice semántico habilitado pero numpy no está disponible")
+        return None, None
+    try:
+        index = SemanticIndex(SEMANTIC_INDEX_PATH, query_cache_size=SEMANTIC_QUERY_CACHE_SIZE)
+    except (OSError, ValueError) as e:
+        logger.warning("No se pudo cargar el índice semántico (%s): %s", SEMANTIC_INDEX_PATH, e)
+        return None, None
+
+    answer_cache = None
+    if SEMANTIC_CACHE_ENABLED:
+        answer_cache = SemanticAnswerCache(
+            dim=index.matrix.shape[1],
+            capacity=SEMANTIC_CACHE_SIZE,
+            threshold=SEMANTIC_CACHE_THRESHOLD,
+            ttl_seconds=SEMANTIC_CACHE_TTL_SECONDS
+        )
+    logger.info("Índice semántico cargado: %d filas, %d ítems", len(index), len(index.items))
+    return index, answer_cache
+
+
+# Inicializar índice semántico (si está habilitado)
+semantic_index, semantic_answer_cache = load_semantic_index()
+
+
+def create_request_coalescer() -> Optional[RequestCoalescer]:
+    """
+    Crea el coalescer de consultas en vuelo según COALESCING_STORE.
+    
+    Returns:
+        RequestCoalescer o None si el coalescing está deshabilitado
+    """
+    if not COALESCING_ENABLED:
+        return None
+    store = None
+    if COALESCING_STORE == 'memory':
+        store = MemoryCoalescingStore()
+    elif COALESCING_STORE == 'dynamodb':
+        if COALESCING_TABLE:
+            store = DynamoDBCoalescingStore(COALESCING_TABLE, region=AWS_REGION)
+        else:
+            logger.warning("COALESCING_STORE=dynamodb sin COALESCING_TABLE, coalescing solo en proceso")
+    elif COALESCING_STORE != 'none':
+        logger.warning("COALESCING_STORE desconocido: %s, coalescing solo en proceso", COALESCING_STORE)
+    return RequestCoalescer(
+        store=store,
+        lock_ttl_seconds=COALESCING_LOCK_TTL_SECONDS,
+        result_ttl_seconds=COALESCING_RESULT_TTL_SECONDS,
+        max_wait_seconds=COALESCING_MAX_WAIT_SECONDS,
+        poll_interval_seconds=COALESCING_POLL_SECONDS
+    )
+
+
+request_coalescer = create_request_coalescer()
+
+
+def create_conversation_store() -> Optional[Any]:
+    """
+    Crea el store de historiales según CONVERSATION_STORE.
+    
+    Returns:
+        Store con put/get, o None si los clientes deben enviar el historial completo
+    """
+    if CONVERSATION_STORE == 'memory':
+        return MemoryConversationStore(CONVERSATION_CACHE_SIZE, CONVERSATION_TTL_SECONDS)
+    if CONVERSATION_STORE == 'dynamodb':
+        if CONVERSATION_TABLE:
+            return DynamoDBConversationStore(
+                CONVERSATION_TABLE, CONVERSATION_TTL_SECONDS, region=AWS_REGION, cache_size=CONVERSATION_CACHE_SIZE
+            )
+        logger.warning("CONVERSATION_STORE=dynamodb sin CONVERSATION_TABLE, se usa el historial completo")
+    elif CONVERSATION_STORE != 'none':
+        logger.warning("CONVERSATION_STORE desconocido: %s, se usa el historial completo", CONVERSATION_STORE)
+    return None
+
+
+conversation_store = create_conversation_store()
+
+
+class AdmissionController:
+    """
+    Control de admisión para la ruta RAG, la única costosa.
+    Las rutas baratas (safety, chit-chat, FAQ) no pasan por aquí. Una solicitud RAG
+    se admite si queda tiempo suficiente antes del timeout y hay un cupo libre en el
+    presupuesto de concurrencia del contenedor (relevante en el modo servidor con
+    hilos); si no, se descarta rápido en vez de esperar hasta el timeout.
+    """
+    SERVED = 'served'
+    DOWNGRADED = 'downgraded'
+    SHED = 'shed'
+
+    def __init__(self, max_concurrent: int = None, queue_timeout_seconds: float = None):
+        self.max_concurrent = max_concurrent or RAG_MAX_CONCURRENCY
+        self.queue_timeout_seconds = (
+            queue_timeout_seconds if queue_timeout_seconds is not None else ADMISSION_QUEUE_TIMEOUT_SECONDS
+        )
+        self.in_flight = 0
+        self._slots = threading.BoundedSemaphore(self.max_concurrent)
+        self._lock = threading.Lock()
+
+    def admit(self, context: Any) -> Optional[str]:
+        """
+        Intenta admitir una solicitud RAG.
+
+        Args:
+            context: Contexto de Lambda (para el deadline)
+
+        Returns:
+            None si fue admitida (debe llamarse release() al terminar), o el motivo
+            del rechazo: 'deadline' o 'concurrency'
+        """
+        if not check_timeout_remaining(context):
+            return 'deadline'
+        if not self._slots.acquire(timeout=self.queue_timeout_seconds):
+            return 'concurrency'
+        with self._lock:
+            self.in_flight += 1
+        return None
+
+    def release(self) -> None:
+        """Libera el cupo de una solicitud admitida."""
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def record(self, decision: str, reason: str = None, request_id: str = None) -> None:
+        """
+        Emite la decisión de admisión (served / downgraded / shed) para medir el descarte.
+
+        Args:
+            decision: SERVED, DOWNGRADED o SHED
+            reason: Motivo del descarte ('deadline' o 'concurrency')
+            request_id: Request ID para correlación (opcional)
+        """
+        emit_metrics(
+            {'Admission': decision},
+            {'Requests': (1, 'Count'), 'RagInFlight': (self.in_flight, 'Count')},
+            {'reason': reason, 'request_id': request_id}
+        )
+
+
+admission_controller = AdmissionController() if ADMISSION_CONTROL_ENABLED else None
+
+
+def load_lexical_faq_index() -> Optional[LexicalFaqIndex]:
+    """
+    Carga las FAQ curadas para el respaldo léxico del admission control.
+
+    Returns:
+        Índice léxico, o None si el admission control está deshabilitado o no hay FAQ
+    """
+    if admission_controller is None:
+        return None
+    candidates = [SHED_FALLBACK_FAQ_PATH] if SHED_FALLBACK_FAQ_PATH else SHED_FALLBACK_FAQ_CANDIDATES
+    path = next((candidate for candidate in candidates if os.path.exists(candidate)), None)
+    index = None
+    if path:
+        try:
+            index = LexicalFaqIndex(load_faq_records(path))
+        except (OSError, ValueError) as e:
+            logger.warning("No se pudieron cargar las FAQ de respaldo (%s): %s", path, e)
+    if index:
+        logger.info("FAQ de respaldo léxico cargadas desde %s: %d", path, len(index))
+        return index
+    if semantic_index is None:
+        logger.warning(
+            "Admission control sin respaldo: no hay índice semántico ni FAQ en %s; "
+            "las solicitudes descartadas recibirán 503", ', '.join(candidates)
+        )
+    return None
+
+
+lexical_faq_index = load_lexical_faq_index()
+
+
+def shed_fallback_answer(query: str) -> Optional[Dict[str, Any]]:
+    """
+    Respuesta de respaldo para una solicitud descartada: la FAQ más parecida del
+    índice semántico local o, sin él, de la búsqueda léxica sobre las FAQ curadas
+    (ambos sin red), con un umbral menor que el de la deflexión normal.
+
+    Args:
+        query: Consulta del usuario
+
+    Returns:
+        Diccionario con answer y sources, o None si no hay una FAQ suficientemente parecida
+    """
+    match = None
+    if semantic_index is not None:
+        matches = semantic_index.search(query, k=1, kind='faq')
+        match = matches[0] if matches else None
+    elif lexical_faq_index is not None:
+        match = lexical_faq_index.search(query)
+    if not match or match[0] < SHED_FALLBACK_MIN_SCORE:
+        return None
+    score, faq = match
+    return {'answer': faq['answer'], 'sources': faq_sources(faq, score)}
+
+
+def faq_sources(faq: Dict[str, Any], score: float) -> List[Dict[str, Any]]:
+    """Fuente de una respuesta FAQ del índice local (misma forma que format_sources)."""
+    if not faq.get('url'):
+        return []
+    source = {'url': faq['url'], 'excerpt': truncate_excerpt(faq['answer']), 'score': round(score, 4)}
+    if faq.get('id'):
+        source['id'] = str(faq['id'])
+    return [source]
+
+
 def extract_request_id(event: Dict[str, Any]) -> str:
     """
     Extrae el request ID del evento para tracking y correlación.
@@ -258,6 +918,26 @@ def extract_request_id(event: Dict[str, Any]) -> str:
     )
 
 
+def get_remaining_seconds(context: Any) -> Optional[float]:
+    """
+    Obtiene los segundos restantes antes del timeout de Lambda.
+    
+    Args:
+        context: Contexto de Lambda
+        
+    Returns:
+        Segundos restantes o None si no hay contexto disponible
+    """
+    if context is None:
+        return None
+    
+    try:
+        return context.get_remaining_time_in_millis() / 1000.0
+    except Exception as e:
+        logger.warning("Error obteniendo tiempo restante: %s", e)
+        return None
+
+
 def check_timeout_remaining(context: Any, min_seconds: float = None) -> bool:
     """
     Verifica que quede suficiente tiempo antes del timeout de Lambda.
@@ -281,14 +961,14 @@ def check_timeout_remaining(context: Any, min_seconds: float = None) -> bool:
         
         if remaining_seconds < min_seconds:
             logger.warning(
-                f"Low remaining time: {remaining_seconds:.2f}s (minimum: {min_seconds}s)",
+                "Low remaining time: %.2fs (minimum: %ss)", remaining_seconds, min_seconds,
                 extra={'remaining_seconds': remaining_seconds, 'min_seconds': min_seconds}
             )
             return False
         
         return True
     except Exception as e:
-        logger.warning(f"Error checking timeout: {str(e)}")
+        logger.warning("Error checking timeout: %s", e)
         return True  # En caso de error, permitir continuar
 
 
@@ -335,21 +1015,118 @@ def validate_cors_origin(event: Dict[str, Any], allowed_origin: str) -> bool:
     
     if not is_valid:
         logger.warning(
-            f"CORS validation failed: origin '{origin}' does not match allowed '{allowed_origin}'",
+            "CORS validation failed: origin '%s' does not match allowed '%s'", origin, allowed_origin,
             extra={'requested_origin': origin, 'allowed_origin': allowed_origin}
         )
     else:
-        logger.debug(f"CORS validation passed: origin '{origin}' matches allowed origin")
+        logger.debug("CORS validation passed: origin '%s' matches allowed origin", origin)
     
     return is_valid
 
 
+WORD_PATTERN = re.compile(r'\b\w+\b')
+
+# Saludos simples que no deben recibir keywords de búsqueda híbrida
+GREETINGS = frozenset([
+    'hola', 'hi', 'hey', 'buenos días', 'buenas tardes', 'buenas noches',
+    'saludos', 'buen día', 'holi', 'qué tal', 'qué hubo'
+])
+
+# Indicadores de pregunta (substrings del query en minúsculas)
+QUESTION_MARKERS = ('qué', 'cuál', 'cuándo', 'dónde', 'cómo', 'por qué', 'quién', 'cuánto',
+                    'cuánta', 'cuántos', 'cuántas', '?')
+
+
+class AhoCorasick:
+    """
+    Autómata Aho-Corasick: encuentra en una sola pasada sobre el texto todos los
+    patrones que aparecen como substring, sin importar cuántos patrones haya.
+    """
+    def __init__(self, patterns):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[Tuple[str, ...]] = [()]
+        for pattern in patterns:
+            if not pattern:
+                continue
+            state = 0
+            for char in pattern:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][char] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(())
+                state = next_state
+            self.output[state] += (pattern,)
+        
+        # Enlaces de falla por BFS; cada estado hereda las salidas de su enlace
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for char, next_state in self.goto[state].items():
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                self.output[next_state] += self.output[self.fail[next_state]]
+                queue.append(next_state)
+
+    def find(self, text: str) -> set:
+        """
+        Args:
+            text: Texto donde buscar
+            
+        Returns:
+            Conjunto de patrones presentes en el texto
+        """
+        goto, fail, output = self.goto, self.fail, self.output
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found.update(output[state])
+        return found
+
+
+class SubstringMatcher:
+    """Misma interfaz que AhoCorasick con búsquedas `in` (rápidas en C para pocas tablas)."""
+    def __init__(self, patterns):
+        self.patterns = tuple(pattern for pattern in patterns if pattern)
+
+    def find(self, text: str) -> set:
+        return {pattern for pattern in self.patterns if pattern in text}
+
+
+# Desde este número de patrones el autómata (una pasada en Python) supera a N búsquedas `in`
+AHO_CORASICK_MIN_PATTERNS = 160
+
+
+def build_matcher(patterns) -> Any:
+    """
+    Crea el buscador de substrings más rápido para el tamaño de la tabla.
+    
+    Args:
+        patterns: Patrones a buscar
+        
+    Returns:
+        Objeto con find(text) -> conjunto de patrones presentes
+    """
+    patterns = list(dict.fromkeys(pattern for pattern in patterns if pattern))
+    if len(patterns) < AHO_CORASICK_MIN_PATTERNS:
+        return SubstringMatcher(patterns)
+    return AhoCorasick(patterns)
+
+
 class QueryOptimizer:
     """
     Optimizador de queries para mejorar la recuperación de información.
     Implementa Phase 2: Query Optimization.
     """
-    def __init__(self):
+    def __init__(self, tables: Dict[str, Any] = None):
         self.synonyms_dict = {
             'matrícula': ['inscripción', 'registro', 'matriculación'],
             'arancel': ['costo', 'precio', 'tarifa', 'pago', 'cuota'],
@@ -381,7 +1158,116 @@ class QueryOptimizer:
             'cuánto', 'cuánta', 'cuántos', 'cuántas',
             'más', 'menos', 'mejor', 'peor',
         ]
+        
+        # Boost por término (tablas minadas): keywords específicas para queries cortos
+        self.boost_dict: Dict[str, List[str]] = {}
+        
+        if tables:
+            self.load_tables(tables)
+        self._build_indexes()
     
+    def load_tables(self, tables: Dict[str, Any]) -> None:
+        """
+        Reemplaza las tablas fijas por las minadas del corpus (scripts/mine_query_tables.py).
+        
+        Args:
+            tables: Documento con 'synonyms', 'boost' y 'keyword_boost_terms'
+        """
+        self.synonyms_dict = {term: list(related) for term, related in tables.get('synonyms', {}).items()}
+        self.boost_dict = {term: list(related) for term, related in tables.get('boost', {}).items()}
+        self.keyword_boost_terms = list(tables.get('keyword_boost_terms', []))
+        self._build_indexes()
+    
+    def _build_indexes(self) -> None:
+        """
+        Precalcula las estructuras de búsqueda a partir de las tablas:
+        candidatos de expansión por término (los dos primeros sinónimos), tokens de
+        cada sinónimo y buscadores de substrings (Aho-Corasick si la tabla es grande)
+        para saber qué sinónimos ya están en el query y qué términos aparecen en el contexto.
+        """
+        self._expansion_candidates = {term: synonyms[:2] for term, synonyms in self.synonyms_dict.items()}
+        candidates = {synonym for synonyms in self._expansion_candidates.values() for synonym in synonyms}
+        self._synonym_tokens = {synonym: WORD_PATTERN.findall(synonym.lower()) for synonym in candidates}
+        self._synonym_matcher = build_matcher(sorted(candidates))
+        self._context_terms = list(self.synonyms_dict.keys())
+        self._context_matcher = build_matcher(self._context_terms)
+
+    def _expansion_terms(self, query_lower: str, words: List[str]) -> List[str]:
+        """
+        Sinónimos a agregar, en el orden en que se descubren.
+        
+        Args:
+            query_lower: Query en minúsculas
+            words: Tokens del query (en orden)
+            
+        Returns:
+            Lista de sinónimos (como máximo MAX_QUERY_EXPANSIONS)
+        """
+        added_synonyms: List[str] = []
+        present = None
+        for word in words:
+            if len(added_synonyms) >= MAX_QUERY_EXPANSIONS:
+                break
+            candidates = self._expansion_candidates.get(word)
+            if not candidates:
+                continue
+            if present is None:
+                present = self._synonym_matcher.find(query_lower)
+            for synonym in candidates:
+                if synonym not in present and synonym not in added_synonyms:
+                    added_synonyms.append(synonym)
+                    if len(added_synonyms) >= MAX_QUERY_EXPANSIONS:
+                        break
+        return added_synonyms
+
+    def _keyword_terms(self, query_lower: str, query_words: set, query_tokens: List[str], query: str = '') -> List[str]:
+        """
+        Keywords a agregar para búsqueda híbrida (ver enhance_with_keywords).
+        
+        Args:
+            query_lower: Query en minúsculas y sin espacios en los extremos
+            query_words: Conjunto de tokens del query
+            query_tokens: Tokens del query en orden
+            query: Query original (solo para logging)
+            
+        Returns:
+            Lista de keywords (vacía si no corresponde agregar)
+        """
+        # Lista de saludos simples que no deben ser expandidos
+        if query_lower in GREETINGS:
+            logger.debug("Query es un saludo simple, no se agregarán keywords: '%s'", query)
+            return []
+        
+        query_is_short = len(query_words) < 3
+        if not query_is_short:
+            return []
+        
+        # Boost por término: keywords asociadas a las palabras del query (no requiere que sea pregunta)
+        relevant_keywords = []
+        for token in query_tokens:
+            for keyword in self.boost_dict.get(token, ()):
+                if keyword not in query_words and keyword not in query_lower and keyword not in relevant_keywords:
+                    relevant_keywords.append(keyword)
+                    if len(relevant_keywords) >= 2:
+                        return relevant_keywords
+        if relevant_keywords or not self.keyword_boost_terms:
+            return relevant_keywords
+        
+        # Solo agregar keywords si el query corto parece ser una pregunta real
+        # (contiene palabras interrogativas); si no, probablemente es un saludo o frase simple
+        is_question = any(word in query_lower for word in QUESTION_MARKERS)
+        if not is_question:
+            logger.debug("Query muy corto sin indicadores de pregunta, no se agregarán keywords: '%s'", query)
+            return []
+        
+        relevant_keywords = []
+        for keyword in self.keyword_boost_terms:
+            if keyword not in query_words and keyword not in query_lower:
+                relevant_keywords.append(keyword)
+                if len(relevant_keywords) >= 2:
+                    break
+        return relevant_keywords
+
     def expand_query(self, query: str) -> str:
         """
         Expande el query agregando sinónimos relevantes.
@@ -396,28 +1282,11 @@ class QueryOptimizer:
             return query
         
         query_lower = query.lower()
-        expanded_terms = []
-        added_synonyms = set()
-        
-        words = re.findall(r'\b\w+\b', query_lower)
+        added_synonyms = self._expansion_terms(query_lower, WORD_PATTERN.findall(query_lower))
         
-        for word in words:
-            expanded_terms.append(word)
-            
-            if word in self.synonyms_dict and len(added_synonyms) < MAX_QUERY_EXPANSIONS:
-                synonyms = self.synonyms_dict[word]
-                for synonym in synonyms[:2]:
-                    if synonym not in query_lower and synonym not in added_synonyms:
-                        expanded_terms.append(synonym)
-                        added_synonyms.add(synonym)
-                        if len(added_synonyms) >= MAX_QUERY_EXPANSIONS:
-                            break
-        
-        if len(added_synonyms) > 0:
-            expanded_query = query
-            for synonym in added_synonyms:
-                expanded_query += f" {synonym}"
-            logger.info(f"Query expandido: '{query}' -> '{expanded_query}' (sinónimos agregados: {len(added_synonyms)})")
+        if added_synonyms:
+            expanded_query = query + ''.join(f" {synonym}" for synonym in added_synonyms)
+            logger.info("Query expandido: '%s' -> '%s' (sinónimos agregados: %d)", query, expanded_query, len(added_synonyms))
             return expanded_query
         
         return query
@@ -441,45 +1310,12 @@ class QueryOptimizer:
             return query
         
         query_lower = query.lower().strip()
-        query_words = set(re.findall(r'\b\w+\b', query_lower))
-        
-        # Lista de saludos simples que no deben ser expandidos
-        greetings = ['hola', 'hi', 'hey', 'buenos días', 'buenas tardes', 'buenas noches', 
-                     'saludos', 'buen día', 'holi', 'qué tal', 'qué hubo']
-        
-        # Si es un saludo simple, no agregar keywords
-        if query_lower in greetings or (len(query_words) == 1 and query_lower in greetings):
-            logger.debug(f"Query es un saludo simple, no se agregarán keywords: '{query}'")
-            return query
-        
-        query_is_short = len(query_words) < 3
-        
-        # Solo agregar keywords si:
-        # 1. El query es corto (< 3 palabras)
-        # 2. No es un saludo simple
-        # 3. El query parece ser una pregunta real (contiene palabras interrogativas)
-        is_question = any(word in query_lower for word in ['qué', 'cuál', 'cuándo', 'dónde', 
-                                                            'cómo', 'por qué', 'quién', 'cuánto', 
-                                                            'cuánta', 'cuántos', 'cuántas', '?'])
-        
-        # Si no es una pregunta y es muy corto, probablemente sea un saludo o frase simple
-        if query_is_short and not is_question:
-            logger.debug(f"Query muy corto sin indicadores de pregunta, no se agregarán keywords: '{query}'")
-            return query
-        
-        if not query_is_short:
-            return query
-        
-        relevant_keywords = []
-        for keyword in self.keyword_boost_terms:
-            if keyword not in query_words and keyword not in query_lower:
-                relevant_keywords.append(keyword)
-                if len(relevant_keywords) >= 2:
-                    break
+        query_tokens = WORD_PATTERN.findall(query_lower)
+        relevant_keywords = self._keyword_terms(query_lower, set(query_tokens), query_tokens, query)
         
         if relevant_keywords:
             enhanced_query = f"{query} {' '.join(relevant_keywords)}"
-            logger.debug(f"Query mejorado con keywords para búsqueda híbrida: '{enhanced_query}'")
+            logger.debug("Query mejorado con keywords para búsqueda híbrida: '%s'", enhanced_query)
             return enhanced_query
         
         return query
@@ -545,71 +1381,507 @@ class QueryOptimizer:
                     sub_queries.extend([part.strip() + '?' for part in parts if part.strip()])
         
         if len(sub_queries) > 1:
-            logger.info(f"Query descompuesto: '{query}' -> {len(sub_queries)} sub-queries")
+            logger.info("Query descompuesto: '%s' -> %d sub-queries", query, len(sub_queries))
             return sub_queries
         
         return [query]
     
     def optimize_query(self, query: str, history: List[Dict[str, str]] = None) -> str:
         """
-        Optimiza un query aplicando todas las técnicas de optimización.
+        Optimiza un query aplicando todas las técnicas de optimización.
+        
+        Args:
+            query: Query original del usuario
+            history: Historial de conversación (opcional)
+            
+        Returns:
+            Query optimizado
+        """
+        if not QUERY_OPTIMIZATION_ENABLED:
+            return query
+        
+        optimized_query = self._optimize(query, self._context_for(query, history))
+        if optimized_query != query:
+            logger.debug("Query optimizado: '%s'", optimized_query)
+        return optimized_query
+
+    def optimize_queries(self, queries: List[str], histories: List[Optional[List[Dict[str, str]]]] = None) -> List[str]:
+        """
+        Versión por lotes de optimize_query, con el mismo resultado query a query.
+        Cada query se tokeniza una sola vez y los pares (query, contexto) repetidos
+        se calculan una vez; pensado para evaluación offline, replay y benchmarks.
+        
+        Args:
+            queries: Queries originales
+            histories: Historial de cada query (opcional, misma longitud que queries)
+            
+        Returns:
+            Queries optimizados, en el mismo orden
+        """
+        if not QUERY_OPTIMIZATION_ENABLED:
+            return list(queries)
+        if histories is None:
+            histories = [None] * len(queries)
+        elif len(histories) != len(queries):
+            raise ValueError("queries y histories deben tener la misma longitud")
+        
+        results: Dict[Tuple[str, Optional[str]], str] = {}
+        optimized = []
+        for query, history in zip(queries, histories):
+            key = (query, self._context_for(query, history))
+            if key not in results:
+                results[key] = self._optimize(*key)
+            optimized.append(results[key])
+        return optimized
+
+    def _context_for(self, query: str, history: Optional[List[Dict[str, str]]]) -> Optional[str]:
+        """Último mensaje del asistente, si el query es corto y puede depender de él."""
+        if not history or len(query.split()) >= 5:
+            return None
+        for msg in reversed(history):
+            if msg.get('role') == 'assistant':
+                return msg.get('content', '') or None
+        return None
+
+    def _optimize(self, query: str, context: Optional[str]) -> str:
+        """Expansión + keywords + contexto con una sola tokenización del query."""
+        optimized_query = query
+        query_lower = query.lower()
+        words = WORD_PATTERN.findall(query_lower)
+        query_words = set(words)
+        
+        if QUERY_EXPANSION_ENABLED:
+            added_synonyms = self._expansion_terms(query_lower, words)
+            if added_synonyms:
+                suffix = ''.join(f" {synonym}" for synonym in added_synonyms)
+                optimized_query += suffix
+                query_lower += suffix.lower()
+                for synonym in added_synonyms:
+                    words = words + self._synonym_tokens[synonym]
+                    query_words.update(self._synonym_tokens[synonym])
+        
+        if HYBRID_SEARCH_ENABLED:
+            relevant_keywords = self._keyword_terms(query_lower.strip(), query_words, words, query)
+            if relevant_keywords:
+                optimized_query = f"{optimized_query} {' '.join(relevant_keywords)}"
+        
+        if context:
+            context_keywords = self._extract_keywords_from_context(context)
+            if context_keywords:
+                optimized_query = f"{optimized_query} {context_keywords}"
+        
+        return optimized_query
+    
+    def _extract_keywords_from_context(self, context: str) -> str:
+        """
+        Extrae keywords relevantes del contexto de conversación: los dos primeros
+        términos de la tabla de sinónimos (en el orden de la tabla) que aparecen en el texto.
+        
+        Args:
+            context: Contexto de conversación anterior
+            
+        Returns:
+            Keywords extraídos como string
+        """
+        found = self._context_matcher.find(context.lower())
+        if not found:
+            return ''
+        extracted_keywords = [term for term in self._context_terms if term in found][:2]
+        return ' '.join(extracted_keywords)
+
+
+def load_query_tables(path: str) -> Optional[Dict[str, Any]]:
+    """
+    Carga las tablas minadas de sinónimos y boost en el cold start.
+    
+    Args:
+        path: Ruta del JSON generado por scripts/mine_query_tables.py
+        
+    Returns:
+        Tablas o None (se usan las tablas fijas) si no existen o la versión no es compatible
+    """
+    if not QUERY_TABLES_ENABLED or not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            tables = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning("No se pudieron cargar las tablas de query (%s): %s", path, e)
+        return None
+    if tables.get('version') != QUERY_TABLES_VERSION:
+        logger.warning("Versión de tablas de query no soportada: %s", tables.get('version'))
+        return None
+    logger.info(
+        "Tablas de query cargadas: %d sinónimos, %d boosts (%s)",
+        len(tables.get('synonyms', {})), len(tables.get('boost', {})), tables.get('generated_at')
+    )
+    return tables
+
+
+query_optimizer = QueryOptimizer(load_query_tables(QUERY_TABLES_PATH))
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estima la cantidad de tokens de un texto (aprox. 4 caracteres por token).
+    RetrieveAndGenerate no retorna el uso de tokens, por lo que se usa esta heurística.
+    
+    Args:
+        text: Texto a estimar
+        
+    Returns:
+        Cantidad estimada de tokens
+    """
+    if not text:
+        return 0
+    return max(1, (len(text) + 3) // 4)
+
+
+def emit_metrics(dimensions: Dict[str, str], metrics: Dict[str, Tuple[float, str]],
+                 properties: Dict[str, Any] = None) -> None:
+    """
+    Emite métricas a CloudWatch usando Embedded Metric Format (EMF).
+    CloudWatch Logs extrae las métricas del registro JSON escrito en stdout.
+    
+    Args:
+        dimensions: Dimensiones de la métrica (nombre -> valor)
+        metrics: Métricas a emitir (nombre -> (valor, unidad))
+        properties: Propiedades adicionales para búsqueda en Logs Insights (opcional)
+    """
+    record = {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': METRICS_NAMESPACE,
+                'Dimensions': [list(dimensions.keys())],
+                'Metrics': [{'Name': name, 'Unit': unit} for name, (_, unit) in metrics.items()]
+            }]
+        }
+    }
+    record.update(dimensions)
+    record.update({name: value for name, (value, _) in metrics.items()})
+    if properties:
+        record.update(properties)
+    print(json.dumps(record, ensure_ascii=False))
+
+
+class ModelRouter:
+    """
+    Router de complejidad de queries para model tiering.
+    Envía consultas simples al modelo rápido y consultas complejas al modelo fuerte,
+    usando QueryOptimizer.is_complex_query más señales de longitud e historial.
+    """
+    FAST = 'fast'
+    STRONG = 'strong'
+
+    def __init__(self, optimizer: QueryOptimizer, fast_model_arn: str = None, strong_model_arn: str = None,
+                 default_model_arn: str = None, tiering_enabled: bool = None):
+        self.optimizer = optimizer
+        self.fast_model_arn = fast_model_arn
+        self.strong_model_arn = strong_model_arn
+        self.default_model_arn = default_model_arn
+        self.tiering_enabled = MODEL_TIERING_ENABLED if tiering_enabled is None else tiering_enabled
+
+    def classify(self, query: str, history: List[Dict[str, str]] = None) -> str:
+        """
+        Clasifica el query en un tier de modelo.
         
         Args:
-            query: Query original del usuario
+            query: Query del usuario (sanitizado)
             history: Historial de conversación (opcional)
             
         Returns:
-            Query optimizado
+            ModelRouter.FAST o ModelRouter.STRONG
         """
-        if not QUERY_OPTIMIZATION_ENABLED:
-            return query
+        if not self.tiering_enabled or not self.fast_model_arn:
+            return self.STRONG
         
-        optimized_query = query
+        if self.optimizer.is_complex_query(query):
+            return self.STRONG
         
-        if QUERY_EXPANSION_ENABLED:
-            optimized_query = self.expand_query(optimized_query)
+        if len(query) > MODEL_ROUTER_MAX_SIMPLE_CHARS or len(query.split()) > MODEL_ROUTER_MAX_SIMPLE_WORDS:
+            return self.STRONG
         
-        if HYBRID_SEARCH_ENABLED:
-            optimized_query = self.enhance_with_keywords(optimized_query)
+        # Conversaciones largas requieren resolver referencias al contexto anterior
+        if history and len(history) > MODEL_ROUTER_MAX_SIMPLE_HISTORY:
+            return self.STRONG
         
-        if history:
-            last_assistant_msg = None
-            for msg in reversed(history):
-                if msg.get('role') == 'assistant':
-                    last_assistant_msg = msg.get('content', '')
-                    break
+        return self.FAST
+
+    def select_model_arn(self, tier: str) -> str:
+        """
+        Retorna el ARN del modelo para el tier indicado.
+        Sin tiering se usa siempre el modelo por defecto (MODEL_ARN): FAST_MODEL_* y
+        STRONG_MODEL_* solo aplican con MODEL_TIERING_ENABLED=true.
+        
+        Args:
+            tier: Tier de modelo ('fast' o 'strong')
             
-            if last_assistant_msg and len(query.split()) < 5:
-                context_keywords = self._extract_keywords_from_context(last_assistant_msg)
-                if context_keywords:
-                    optimized_query = f"{optimized_query} {context_keywords}"
-                    logger.debug(f"Query mejorado con contexto: '{optimized_query}'")
+        Returns:
+            ARN del modelo
+        """
+        if not self.tiering_enabled and self.default_model_arn:
+            return self.default_model_arn
+        if tier == self.FAST and self.fast_model_arn:
+            return self.fast_model_arn
+        return self.strong_model_arn
+
+    def record(self, tier: str, latency_ms: float, input_text: str, output_text: str, request_id: str = None) -> None:
+        """
+        Emite métricas de latencia y tokens por tier para ajustar la división de tráfico.
         
-        return optimized_query
-    
-    def _extract_keywords_from_context(self, context: str) -> str:
+        Args:
+            tier: Tier usado en la solicitud
+            latency_ms: Latencia de la llamada a Bedrock en milisegundos
+            input_text: Texto enviado a Bedrock (para estimar tokens de entrada)
+            output_text: Respuesta generada (para estimar tokens de salida)
+            request_id: Request ID para correlación (opcional)
+        """
+        emit_metrics(
+            {'ModelTier': tier},
+            {
+                'BedrockLatency': (round(latency_ms, 2), 'Milliseconds'),
+                'InputTokens': (estimate_tokens(input_text), 'Count'),
+                'OutputTokens': (estimate_tokens(output_text), 'Count'),
+            },
+            {'modelArn': self.select_model_arn(tier), 'request_id': request_id}
+        )
+
+
+model_router = ModelRouter(
+    query_optimizer, fast_model_arn=FAST_MODEL_ARN, strong_model_arn=STRONG_MODEL_ARN, default_model_arn=MODEL_ARN
+)
+
+
+class RequestTracer:
+    """
+    Tracer liviano por solicitud con spans nombrados.
+    Cada begin() cierra el span abierto y abre uno nuevo, de modo que los retornos
+    tempranos del handler no requieren cerrar spans explícitamente. emit() publica
+    un único registro EMF por solicitud con la duración de cada span.
+    """
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.route = 'rejected'
+        self.usage: Optional[Dict[str, Any]] = None  # Tokens estimados (ver UsageAccountant.estimate)
+        self.history: Optional[List[Any]] = None  # Historial completo recibido (para emitir el history_token)
+        self.spans: Dict[str, float] = {}
+        self._start = time.perf_counter()
+        self._current: Optional[str] = None
+        self._current_start = 0.0
+
+    def begin(self, name: str) -> None:
         """
-        Extrae keywords relevantes del contexto de conversación.
+        Cierra el span actual (si existe) e inicia uno nuevo.
         
         Args:
-            context: Contexto de conversación anterior
+            name: Nombre del span (ej: 'cors_check', 'bedrock_call')
+        """
+        now = time.perf_counter()
+        self._close(now)
+        self._current = name
+        self._current_start = now
+
+    def end(self) -> None:
+        """Cierra el span actual sin abrir uno nuevo."""
+        self._close(time.perf_counter())
+
+    def _close(self, now: float) -> None:
+        if self._current is not None:
+            elapsed_ms = (now - self._current_start) * 1000
+            self.spans[self._current] = self.spans.get(self._current, 0.0) + elapsed_ms
+            self._current = None
+
+    def emit(self, status_code: int) -> None:
+        """
+        Emite los spans de la solicitud como un registro EMF.
+        
+        Args:
+            status_code: Código HTTP de la respuesta
+        """
+        now = time.perf_counter()
+        self._close(now)
+        metrics = {name: (round(ms, 3), 'Milliseconds') for name, ms in self.spans.items()}
+        metrics['total'] = (round((now - self._start) * 1000, 3), 'Milliseconds')
+        properties = {'request_id': self.request_id, 'status_code': status_code}
+        if self.usage:
+            properties['usage'] = self.usage
+        emit_metrics({'Route': self.route}, metrics, properties)
+
+
+class UsageAccountant:
+    """
+    Contabilidad de tokens, unidades de guardrail y costo estimados por solicitud.
+    
+    Agrega las solicitudes (por ruta) en contadores por minuto que se emiten como
+    EMF al empezar el minuto siguiente; en Lambda eso ocurre con la primera solicitud
+    del nuevo minuto, así que un contenedor inactivo publica su último minuto tarde.
+    Con TOKEN_BUDGET_PER_MINUTE, el gasto de los últimos 60 segundos reduce
+    MAX_TOKENS y el historial de forma gradual entre TOKEN_BUDGET_SOFT_RATIO y el
+    100% del presupuesto.
+    """
+    COUNTERS = ('input_tokens', 'output_tokens', 'history_tokens', 'search_result_tokens', 'guardrail_units')
+
+    def __init__(self, budget_per_minute: int = None, clock=time.time):
+        self.budget_per_minute = TOKEN_BUDGET_PER_MINUTE if budget_per_minute is None else budget_per_minute
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._minute = int(clock() // 60)
+        self._current = self._empty_bucket()
+        self._previous_tokens = 0
+
+    @staticmethod
+    def _empty_bucket() -> Dict[str, Any]:
+        return {'requests': 0, 'routes': {}, 'cost_usd': 0.0, **{name: 0 for name in UsageAccountant.COUNTERS}}
+
+    def estimate(self, orchestration_template: str, generation_template: str, query: str, contextual_query: str,
+                 answer: str, citations: List[Dict[str, Any]], max_tokens: int = None,
+                 guardrail: bool = True) -> Dict[str, Any]:
+        """
+        Estima el consumo de una llamada RetrieveAndGenerate (la API no retorna el uso).
+        
+        El texto enviado (query + historial) entra en ambos prompts; los resultados de
+        búsqueda solo en el de generación y se aproximan con las referencias citadas
+        (cota inferior: Bedrock no retorna los fragmentos no citados). La salida es la
+        consulta reformulada por la orquestación más la respuesta.
+        
+        Args:
+            orchestration_template: Prompt de orquestación
+            generation_template: Prompt de generación
+            query: Query optimizado (sin historial)
+            contextual_query: Texto enviado a Bedrock (query + historial)
+            answer: Respuesta generada, antes de la limpieza
+            citations: Citas de la respuesta
+            max_tokens: maxTokens usado en la llamada
+            guardrail: Si la llamada llevó guardrail (sin él no hay unidades que cobrar)
             
         Returns:
-            Keywords extraídos como string
+            Diccionario con tokens, unidades de guardrail y costo estimado (USD)
+        """
+        search_results = {
+            ref.get('content', {}).get('text', '')
+            for citation in citations or []
+            for ref in citation.get('retrievedReferences', [])
+        }
+        search_tokens = sum(estimate_tokens(text) for text in search_results)
+        sent_tokens = estimate_tokens(contextual_query)
+        orchestration_input = estimate_tokens(orchestration_template) + sent_tokens
+        generation_input = estimate_tokens(generation_template) + sent_tokens + search_tokens
+        output_tokens = estimate_tokens(query) + estimate_tokens(answer)
+        guardrail_units = 0
+        if guardrail:
+            guardrail_units = (-(-len(contextual_query) // GUARDRAIL_TEXT_UNIT_CHARS)
+                               + -(-len(answer or '') // GUARDRAIL_TEXT_UNIT_CHARS))
+        input_tokens = orchestration_input + generation_input
+        cost = (input_tokens * INPUT_TOKEN_PRICE_PER_1K + output_tokens * OUTPUT_TOKEN_PRICE_PER_1K
+                + guardrail_units * GUARDRAIL_PRICE_PER_1K_UNITS) / 1000
+        return {
+            'orchestration_input_tokens': orchestration_input,
+            'generation_input_tokens': generation_input,
+            'input_tokens': input_tokens,
+            'output_tokens': output_tokens,
+            'history_tokens': max(0, sent_tokens - estimate_tokens(query)),
+            'search_result_tokens': search_tokens,
+            'guardrail_units': guardrail_units,
+            'cost_usd': round(cost, 6),
+            'max_tokens': max_tokens,
+        }
+
+    def record(self, route: str, usage: Dict[str, Any] = None) -> None:
         """
-        context_lower = context.lower()
-        extracted_keywords = []
+        Suma una solicitud al minuto actual.
         
-        for term in self.synonyms_dict.keys():
-            if term in context_lower and term not in extracted_keywords:
-                extracted_keywords.append(term)
-                if len(extracted_keywords) >= 2:
-                    break
+        Args:
+            route: Ruta tomada (safety, chitchat, faq, rag, coalesced, ...)
+            usage: Resultado de estimate() si hubo llamada a Bedrock
+        """
+        with self._lock:
+            finished = self._roll()
+            bucket = self._current
+            bucket['requests'] += 1
+            bucket['routes'][route] = bucket['routes'].get(route, 0) + 1
+            if usage:
+                for name in self.COUNTERS:
+                    bucket[name] += usage.get(name, 0)
+                bucket['cost_usd'] += usage.get('cost_usd', 0.0)
+        if finished:
+            self._emit(*finished)
+
+    def _roll(self) -> Optional[Tuple[int, Dict[str, Any]]]:
+        """Cambia de minuto si corresponde (con el lock tomado) y retorna el minuto terminado."""
+        minute = int(self.clock() // 60)
+        if minute == self._minute:
+            return None
+        finished = (self._minute, self._current)
+        self._previous_tokens = self._tokens(self._current) if minute == self._minute + 1 else 0
+        self._minute = minute
+        self._current = self._empty_bucket()
+        return finished if finished[1]['requests'] else None
+
+    @staticmethod
+    def _tokens(bucket: Dict[str, Any]) -> int:
+        return bucket['input_tokens'] + bucket['output_tokens']
+
+    def spend_last_minute(self) -> float:
+        """Tokens de los últimos 60 s: minuto actual + fracción proporcional del anterior."""
+        with self._lock:
+            finished = self._roll()
+            elapsed = (self.clock() % 60) / 60
+            spend = self._tokens(self._current) + self._previous_tokens * (1 - elapsed)
+        if finished:
+            self._emit(*finished)
+        return spend
+
+    def limits(self) -> Tuple[int, int]:
+        """
+        Límites para la próxima llamada según el gasto reciente.
         
-        return ' '.join(extracted_keywords) if extracted_keywords else ''
+        Returns:
+            Tupla (max_tokens, max_context_messages)
+        """
+        if self.budget_per_minute <= 0:
+            return MAX_TOKENS, MAX_CONTEXT_MESSAGES
+        pressure = self.spend_last_minute() / self.budget_per_minute
+        if pressure <= TOKEN_BUDGET_SOFT_RATIO:
+            return MAX_TOKENS, MAX_CONTEXT_MESSAGES
+        factor = max(0.0, (1 - pressure) / (1 - TOKEN_BUDGET_SOFT_RATIO)) if TOKEN_BUDGET_SOFT_RATIO < 1 else 0.0
+        min_tokens = min(TOKEN_BUDGET_MIN_MAX_TOKENS, MAX_TOKENS)
+        min_messages = min(TOKEN_BUDGET_MIN_CONTEXT_MESSAGES, MAX_CONTEXT_MESSAGES)
+        return (
+            min_tokens + int(round((MAX_TOKENS - min_tokens) * factor)),
+            min_messages + int(round((MAX_CONTEXT_MESSAGES - min_messages) * factor)),
+        )
 
+    def flush(self) -> None:
+        """Emite el minuto en curso (fin del servidor local o de un benchmark)."""
+        with self._lock:
+            finished = (self._minute, self._current) if self._current['requests'] else None
+            self._current = self._empty_bucket()
+        if finished:
+            self._emit(*finished)
+
+    def _emit(self, minute: int, bucket: Dict[str, Any]) -> None:
+        metrics = {
+            'Requests': (bucket['requests'], 'Count'),
+            'InputTokens': (bucket['input_tokens'], 'Count'),
+            'OutputTokens': (bucket['output_tokens'], 'Count'),
+            'HistoryTokens': (bucket['history_tokens'], 'Count'),
+            'SearchResultTokens': (bucket['search_result_tokens'], 'Count'),
+            'GuardrailUnits': (bucket['guardrail_units'], 'Count'),
+            'EstimatedCostUSD': (round(bucket['cost_usd'], 6), 'None'),
+        }
+        for route, count in bucket['routes'].items():
+            metrics[f'Requests.{route}'] = (count, 'Count')
+        if self.budget_per_minute > 0:
+            metrics['TokenBudgetUsed'] = (round(self._tokens(bucket) / self.budget_per_minute * 100, 2), 'Percent')
+        emit_metrics(
+            {'Accounting': 'minute'},
+            metrics,
+            {'minute': time.strftime('%Y-%m-%dT%H:%M:00Z', time.gmtime(minute * 60))}
+        )
 
-query_optimizer = QueryOptimizer()
+
+usage_accountant = UsageAccountant() if ACCOUNTING_ENABLED else None
 
 
 # Diccionario de patrones RegEx para chit-chat y sus respuestas
@@ -666,7 +1938,7 @@ def handle_safety_check(query: str) -> Optional[str]:
     
     for pattern, response in SAFETY_PATTERNS.items():
         if re.search(pattern, query_lower, re.IGNORECASE):
-            logger.info(f"Safety check triggered: '{query}' -> respuesta de seguridad")
+            logger.info("Safety check triggered: '%s' -> respuesta de seguridad", query)
             return response
     return None
 
@@ -690,13 +1962,277 @@ def handle_chit_chat(query: str) -> Optional[str]:
     
     for pattern, response in CHIT_CHAT_PATTERNS.items():
         if re.search(pattern, query_lower, re.IGNORECASE):
-            logger.info(f"Chit-chat detectado: '{query}' -> respuesta programada")
+            logger.info("Chit-chat detectado: '%s' -> respuesta programada", query)
             return response
     
     # Si no coincide con nada, no es chit-chat
     return None
 
 
+# Tabla de riesgo del filtro local: (categoría, patrón compilado, peso). Cubre la zona gris
+# que los bloqueos locales (SAFETY_PATTERNS, PromptInjectionFilter) dejan pasar y que las
+# políticas del guardrail sí evalúan.
+MODERATION_PATTERNS = [
+    ('hostility', re.compile('|'.join(SAFETY_PATTERNS), re.IGNORECASE), 0.6),  # El historial no pasa por el safety check
+    ('insults', re.compile(r'\b(wn|we(ó|o)n|ctm|conchetumare|culiao|ql|put[oa]s?|maric(ó|o)n|flaite)\b', re.IGNORECASE), 0.5),
+    ('hate', re.compile(r'\b(racis\w*|nazi\w*|xen(ó|o)fob\w*|homof(ó|o)b\w*|inferiores?)\b', re.IGNORECASE), 0.5),
+    ('sexual', re.compile(r'\b(sexo|sexual\w*|porno\w*|desnud[oa]s?|xxx|nudes?)\b', re.IGNORECASE), 0.6),
+    ('self_harm', re.compile(r'\b(suicid\w*|matarme|autolesi\w*|cortarme|hacerme daño|quitarme la vida)\b', re.IGNORECASE), 0.8),
+    ('weapons_drugs', re.compile(r'\b(armas?|pistolas?|bombas?|explosiv\w*|drogas?|coca(í|i)na|hackear|hacke(o|ar)|robar)\b', re.IGNORECASE), 0.5),
+    ('prompt_probe', re.compile(
+        r'(act(ú|u)a como|finge (ser|que)|modo (desarrollador|dios)|jailbreak|\bprompt\b|tus instrucciones|'
+        r'instrucciones (del|de tu) sistema|sin restricciones|\bDAN\b)', re.IGNORECASE), 0.6),
+    ('pii', re.compile(
+        r'(\b\d{1,2}\.?\d{3}\.?\d{3}-[\dkK]\b|[\w.+-]+@[\w-]+\.[\w.]+|(\+?56\s?)?\b9\s?\d{4}\s?\d{4}\b|\b(?:\d[ -]?){15,16}\b)'
+    ), 0.4),  # RUT, correo, celular, tarjeta: el guardrail los enmascara
+    ('obfuscation', re.compile(r'([A-Za-z0-9+/]{32,}={0,2}|(\\x[0-9a-fA-F]{2}){4,}|&#\d+;)'), 0.4),
+]
+
+
+class ModerationScreen:
+    """
+    Moderación por niveles antes de RetrieveAndGenerate.
+
+    Un puntaje de riesgo local (tabla MODERATION_PATTERNS más, si está habilitado, el
+    puntaje de LLM Guard ya calculado en el injection scan) separa las solicitudes de
+    bajo riesgo de las ambiguas. El riesgo alto ya se bloqueó antes (safety check,
+    PromptInjectionFilter / LLM Guard). En modo 'tiered' solo las ambiguas, más una
+    muestra de las de bajo riesgo, llevan el guardrail de Bedrock; en modo 'always'
+    todas lo llevan y el puntaje solo se registra, para calibrar el umbral antes de
+    activar el modo 'tiered'. Las solicitudes con guardrail sirven para medir el acuerdo
+    entre el filtro local y el guardrail (GUARDRAIL_INTERVENED en la respuesta).
+    """
+    LOW = 'low'
+    AMBIGUOUS = 'ambiguous'
+
+    def __init__(self, mode: str = None, threshold: float = None, sample_rate: float = None,
+                 patterns: List[Tuple[str, Any, float]] = None, rng=random.random):
+        self.mode = MODERATION_MODE if mode is None else mode
+        self.threshold = MODERATION_RISK_THRESHOLD if threshold is None else threshold
+        self.sample_rate = MODERATION_GUARDRAIL_SAMPLE_RATE if sample_rate is None else sample_rate
+        self.patterns = MODERATION_PATTERNS if patterns is None else patterns
+        self.rng = rng
+        self._lock = threading.Lock()
+        self._outcomes: Dict[str, int] = {}
+        self._latency = {True: [0, 0.0], False: [0, 0.0]}  # guardrail adjunto -> [llamadas, ms acumulados]
+
+    def score(self, texts: List[str], model_score: float = 0.0) -> Tuple[float, List[str]]:
+        """
+        Puntaje de riesgo combinado: 1 - Π(1 - peso) sobre las categorías detectadas.
+
+        Args:
+            texts: Query y contenidos del historial (lo que recibe el guardrail)
+            model_score: Puntaje del modelo local (LLM Guard), 0 si no se usa
+
+        Returns:
+            Tupla (puntaje entre 0 y 1, categorías detectadas)
+        """
+        text = '\n'.join(texts)
+        signals = [category for category, pattern, _ in self.patterns if pattern.search(text)]
+        safe = 1.0
+        for category, _, weight in self.patterns:
+            if category in signals:
+                safe *= 1.0 - weight
+        if len(text) > MODERATION_LONG_TEXT_CHARS:
+            signals.append('long_text')
+            safe *= 0.7
+        if model_score > 0:
+            signals.append('model')
+            safe *= 1.0 - min(1.0, model_score)
+        return round(1.0 - safe, 4), signals
+
+    def assess(self, query: str, history: List[Dict[str, str]] = None, model_score: float = 0.0) -> Dict[str, Any]:
+        """
+        Clasifica la solicitud y decide si adjuntar el guardrail.
+
+        Args:
+            query: Query sanitizado
+            history: Historial sanitizado (opcional)
+            model_score: Máximo puntaje de LLM Guard en query e historial (opcional)
+
+        Returns:
+            {'tier', 'score', 'signals', 'guardrail', 'sampled'}
+        """
+        texts = [query] + [str(msg.get('content', '')) for msg in history or []]
+        score, signals = self.score(texts, model_score)
+        tier = self.AMBIGUOUS if score >= self.threshold else self.LOW
+        sampled = False
+        if self.mode != 'tiered' or tier == self.AMBIGUOUS:
+            guardrail = True
+        else:
+            sampled = guardrail = self.sample_rate > 0 and self.rng() < self.sample_rate
+        return {'tier': tier, 'score': score, 'signals': signals, 'guardrail': guardrail, 'sampled': sampled}
+
+    def record(self, assessment: Dict[str, Any], response: Dict[str, Any], latency_ms: float,
+               request_id: str = None) -> str:
+        """
+        Registra el resultado contra la decisión local y emite métricas de acuerdo y latencia.
+
+        Args:
+            assessment: Resultado de assess()
+            response: Respuesta de RetrieveAndGenerate
+            latency_ms: Latencia de la llamada a Bedrock en milisegundos
+            request_id: Request ID para correlación (opcional)
+
+        Returns:
+            agree_low | agree_ambiguous | missed (bajo riesgo que el guardrail bloqueó) |
+            unneeded (ambiguo que el guardrail dejó pasar) | unverified (sin guardrail)
+        """
+        attached = assessment['guardrail']
+        intervened = attached and response.get('guardrailAction') == 'INTERVENED'
+        if not attached:
+            outcome = 'unverified'
+        elif assessment['tier'] == self.LOW:
+            outcome = 'missed' if intervened else 'agree_low'
+        else:
+            outcome = 'agree_ambiguous' if intervened else 'unneeded'
+        with self._lock:
+            self._outcomes[outcome] = self._outcomes.get(outcome, 0) + 1
+            self._latency[attached][0] += 1
+            self._latency[attached][1] += latency_ms
+
+        emit_metrics(
+            {'ModerationTier': assessment['tier']},
+            {
+                'GuardrailAttached': (int(attached), 'Count'),
+                'GuardrailIntervened': (int(intervened), 'Count'),
+                f'Agreement.{outcome}': (1, 'Count'),
+                'BedrockLatency': (round(latency_ms, 2), 'Milliseconds'),
+            },
+            {
+                'request_id': request_id,
+                'risk_score': assessment['score'],
+                'signals': assessment['signals'],
+                'sampled': assessment['sampled'],
+                'moderation_mode': self.mode,
+            }
+        )
+        return outcome
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Acuerdo acumulado en el proceso y latencia media con y sin guardrail.
+
+        Returns:
+            Conteos por resultado, tasas de acuerdo y de fallos sobre las solicitudes
+            verificadas, y ahorro estimado de latencia por las llamadas sin guardrail
+        """
+        with self._lock:
+            outcomes = dict(self._outcomes)
+            (with_calls, with_ms), (without_calls, without_ms) = self._latency[True], self._latency[False]
+        verified = sum(count for outcome, count in outcomes.items() if outcome != 'unverified')
+        low_verified = outcomes.get('agree_low', 0) + outcomes.get('missed', 0)
+        avg_with = with_ms / with_calls if with_calls else None
+        avg_without = without_ms / without_calls if without_calls else None
+        saved = None
+        if avg_with is not None and avg_without is not None:
+            saved = round((avg_with - avg_without) * without_calls, 1)
+        return {
+            'outcomes': outcomes,
+            'agreement_rate': round((outcomes.get('agree_low', 0) + outcomes.get('agree_ambiguous', 0)) / verified, 4) if verified else None,
+            'miss_rate': round(outcomes.get('missed', 0) / low_verified, 4) if low_verified else None,
+            'avg_latency_ms_with_guardrail': round(avg_with, 1) if avg_with is not None else None,
+            'avg_latency_ms_without_guardrail': round(avg_without, 1) if avg_without is not None else None,
+            'estimated_saved_ms': saved,
+        }
+
+
+moderation_screen = ModerationScreen()
+
+
+def load_prompt_templates(version: str) -> Dict[str, str]:
+    """
+    Carga los prompt templates en el cold start.
+    
+    Args:
+        version: Versión registrada en prompt_templates.TEMPLATES
+        
+    Returns:
+        Templates de la versión, o los de la versión por defecto si no existe o no es válida
+    """
+    try:
+        templates = get_templates(version)
+    except (KeyError, ValueError) as e:
+        logger.warning("Prompt templates '%s' no disponibles (%s), usando '%s'", version, e, DEFAULT_PROMPT_TEMPLATE_VERSION)
+        templates = get_templates(DEFAULT_PROMPT_TEMPLATE_VERSION)
+    logger.info("Prompt templates: %s", templates['version'])
+    return templates
+
+
+prompt_templates = load_prompt_templates(PROMPT_TEMPLATE_VERSION)
+
+
+def copy_configuration(config: Dict[str, Any]) -> Dict[str, Any]:
+    """Copia cada nivel de dict de una configuración (los valores hoja son inmutables)."""
+    return {key: copy_configuration(value) if isinstance(value, dict) else value for key, value in config.items()}
+
+
+def rag_configuration(model_arn: str, max_tokens: int, guardrail: bool = True) -> Dict[str, Any]:
+    """
+    retrieveAndGenerateConfiguration para una solicitud: copia propia de la plantilla
+    cacheada, así un cambio por solicitud (o de botocore) no altera las siguientes.
+    
+    Args:
+        model_arn: ARN del modelo elegido por el router
+        max_tokens: Tope de tokens de salida
+        guardrail: Adjuntar el guardrail de Bedrock (ver ModerationScreen)
+        
+    Returns:
+        Configuración de Knowledge Base para RetrieveAndGenerate
+    """
+    return copy_configuration(rag_configuration_template(model_arn, max_tokens, guardrail))
+
+
+@functools.lru_cache(maxsize=16)
+def rag_configuration_template(model_arn: str, max_tokens: int, guardrail: bool = True) -> Dict[str, Any]:
+    """
+    Plantilla de retrieveAndGenerateConfiguration. Se construye una sola vez por
+    combinación (tiering, presupuesto de tokens y moderación generan pocas) y se
+    comparte: usar rag_configuration() para obtener una copia modificable. Si cambia
+    `prompt_templates`, llamar a rag_configuration_template.cache_clear().
+    
+    Args:
+        model_arn: ARN del modelo elegido por el router
+        max_tokens: Tope de tokens de salida
+        guardrail: Adjuntar el guardrail de Bedrock (ver ModerationScreen)
+        
+    Returns:
+        Configuración de Knowledge Base para RetrieveAndGenerate
+    """
+    generation_configuration = {
+        'inferenceConfig': {
+            'textInferenceConfig': {
+                'temperature': TEMPERATURE,
+                'topP': TOP_P,
+                'maxTokens': max_tokens,
+            }
+        },
+        # Genera la respuesta final; Bedrock reemplaza $search_results$ con los resultados recuperados
+        'promptTemplate': {
+            'textPromptTemplate': prompt_templates['generation']
+        }
+    }
+    if guardrail:
+        generation_configuration['guardrailConfiguration'] = {
+            'guardrailId': GUARDRAIL_ID,
+            'guardrailVersion': GUARDRAIL_VERSION
+        }
+    return {
+        'type': 'KNOWLEDGE_BASE',
+        'knowledgeBaseConfiguration': {
+            'knowledgeBaseId': KNOWLEDGE_BASE_ID,
+            'modelArn': model_arn,
+            'generationConfiguration': generation_configuration,
+            'orchestrationConfiguration': {
+                # Reformula la pregunta del usuario para mejorar la búsqueda en la base de conocimientos
+                'promptTemplate': {
+                    'textPromptTemplate': prompt_templates['orchestration']
+                }
+            }
+        }
+    }
+
+
 def build_context_prompt(query: str, history: List[Dict[str, str]]) -> str:
     """
     Construye un prompt contextual a partir del historial de conversación.
@@ -755,11 +2291,38 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
     # Extraer request ID para tracking
     request_id = extract_request_id(event)
+    tracer = RequestTracer(request_id)
+    response = None
+    
+    try:
+        response = process_request(event, context, request_id, tracer)
+        response = finalize_response(response, event, tracer)
+        return response
+    finally:
+        if TRACING_ENABLED:
+            tracer.emit(response['statusCode'] if response else 500)
+        if usage_accountant is not None:
+            usage_accountant.record(tracer.route, tracer.usage)
+
+
+def process_request(event: Dict[str, Any], context: Any, request_id: str, tracer: RequestTracer) -> Dict[str, Any]:
+    """
+    Procesa la solicitud HTTP registrando cada etapa como un span del tracer.
     
+    Args:
+        event: Evento Lambda con el cuerpo de la solicitud HTTP
+        context: Contexto de ejecución de Lambda
+        request_id: Request ID para tracking
+        tracer: Tracer de la solicitud
+        
+    Returns:
+        Respuesta HTTP con statusCode, headers y body
+    """
     # Manejar solicitud OPTIONS (CORS preflight)
     http_method = event.get('requestContext', {}).get('httpMethod') or event.get('httpMethod') or 'POST'
     if http_method == 'OPTIONS':
-        logger.info(f"OPTIONS preflight request: {request_id}")
+        tracer.route = 'preflight'
+        logger.info("OPTIONS preflight request: %s", request_id)
         # Retornar respuesta preflight con todos los headers CORS necesarios
         return {
             'statusCode': 200,
@@ -772,7 +2335,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             }
         }
     
-    logger.info(f"Iniciando ejecución para la solicitud: {request_id}")
+    logger.info("Iniciando ejecución para la solicitud: %s", request_id)
 
     # Validar que las variables de entorno críticas estén configuradas
     # ALLOWED_ORIGIN es opcional (puede ser '*' o vacío para desarrollo)
@@ -789,12 +2352,13 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     if not ALLOWED_ORIGIN or ALLOWED_ORIGIN.strip() == '':
         logger.warning("ALLOWED_ORIGIN no está configurado - usando '*' (permitir todos los orígenes)")
     
-    # Verificar timeout antes de procesar
-    if not check_timeout_remaining(context):
-        logger.warning(f"Request rejected due to insufficient remaining time: {request_id}")
+    # Verificar timeout antes de procesar (sin admission control; con él, solo se exige a la ruta RAG)
+    if admission_controller is None and not check_timeout_remaining(context):
+        logger.warning("Request rejected due to insufficient remaining time: %s", request_id)
         return create_response(503, {'error': 'Request timeout'}, request_id)
     
     # Validar CORS origin antes de procesar la solicitud
+    tracer.begin('cors_check')
     if not validate_cors_origin(event, ALLOWED_ORIGIN):
         logger.warning(
             "CORS validation failed - origin not allowed",
@@ -802,20 +2366,32 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         )
         return create_response(403, {'error': 'Origin not allowed'}, request_id)
 
+    admitted = False
     try:
-        body = json.loads(event.get('body', '{}'))
+        body = json.loads(decode_request_body(event))
         query = body.get('query', '').strip()
         history = body.get('history', [])
 
+        # Protocolo compacto: history_token + solo los mensajes nuevos (delta)
+        if body.get('history_token'):
+            stored_history = conversation_store.get(str(body['history_token'])) if conversation_store else None
+            if stored_history is None:
+                logger.info("history_token desconocido, se pide el historial completo", extra={'request_id': request_id})
+                return create_response(409, {'error': 'history_required'}, request_id)
+            history = stored_history + (history if isinstance(history, list) else [])
+        tracer.history = history
+
         # Validar que el query no esté vacío
         if not query:
             logger.warning("Solicitud recibida sin una consulta (query).", extra={'request_id': request_id})
             return create_response(400, {'error': 'El campo "query" es requerido.'}, request_id)
         
         # 1. NUEVO: Verificar seguridad ANTES de chit-chat o RAG
+        tracer.begin('safety')
         safety_response = handle_safety_check(query)
         if safety_response:
-            logger.info(f"Safety check triggered for query: '{query}'")
+            tracer.route = 'safety'
+            logger.info("Safety check triggered for query: '%s'", query)
             return create_response(200, {
                 'answer': safety_response,
                 'sources': [],
@@ -824,10 +2400,12 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
         # Router de chit-chat: detecta modismos chilenos y frases coloquiales
         # Si es chit-chat, retornar respuesta programada sin llamar a RAG
+        tracer.begin('chit_chat')
         chit_chat_response = handle_chit_chat(query)
         if chit_chat_response:
+            tracer.route = 'chitchat'
             logger.info(
-                f"Respondiendo a chit-chat (sin RAG): '{query}'",
+                "Respondiendo a chit-chat (sin RAG): '%s'", query,
                 extra={'request_id': request_id, 'query_type': 'chitchat'}
             )
             # Retornamos la respuesta programada sin llamar a Bedrock
@@ -838,26 +2416,36 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             }, request_id)
         
         # Si no fue chit-chat, continuar con el flujo RAG normal
-        logger.info(f"Procesando consulta RAG para: '{query}'", extra={'request_id': request_id})
+        logger.info("Procesando consulta RAG para: '%s'", query, extra={'request_id': request_id})
         
         # Detectar prompt injection en query
+        tracer.begin('injection_scan')
         # Primero intentar con LLM Guard si está disponible, luego filtro manual
         injection_detected = False
         risk_score = 0.0
+        model_risk = 0.0  # Máximo puntaje de LLM Guard (query e historial), insumo de la moderación
         
+        if llm_guard_scanner and hasattr(llm_guard_scanner, 'scan_batch'):
+            # Backend ONNX: query e historial en una sola inferencia; los scan() siguientes leen del caché
+            try:
+                llm_guard_scanner.scan_batch([query] + [str(msg.get('content', '')) for msg in history or []])
+            except Exception as e:
+                logger.warning("Error en el escaneo por lotes de LLM Guard: %s", e)
+
         if llm_guard_scanner:
             try:
                 sanitized_query, is_valid, risk_score = llm_guard_scanner.scan(query)
                 if not is_valid:
                     injection_detected = True
                     logger.warning(
-                        f"LLM Guard: Prompt injection detected in query (risk: {risk_score:.2f})",
-                        extra={'request_id': request_id, 'risk_score': risk_score, 'query_preview': query[:100]}
+                        "LLM Guard: Prompt injection detected in query (risk: %.2f): '%.100s'", risk_score, query,
+                        extra={'request_id': request_id, 'risk_score': risk_score}
                     )
                 else:
                     query = sanitized_query  # Usar versión sanitizada de LLM Guard
+                    model_risk = risk_score
             except Exception as e:
-                logger.warning(f"Error usando LLM Guard, usando filtro manual: {str(e)}")
+                logger.warning("Error usando LLM Guard, usando filtro manual: %s", e)
                 injection_detected = prompt_filter.detect_injection(query)
         else:
             # Fallback a detección manual
@@ -878,9 +2466,10 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         if not is_valid:
                             history_injection = True
                             logger.warning(
-                                f"LLM Guard: Prompt injection detected in history (risk: {risk_score:.2f})",
+                                "LLM Guard: Prompt injection detected in history (risk: %.2f)", risk_score,
                                 extra={'request_id': request_id, 'risk_score': risk_score}
                             )
+                        model_risk = max(model_risk, risk_score)
                     except Exception:
                         history_injection = prompt_filter.detect_injection(content)
                 else:
@@ -890,6 +2479,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     return create_response(400, {'error': 'Invalid input detected'}, request_id)
         
         # Sanitizar inputs
+        tracer.begin('sanitize')
         query = prompt_filter.sanitize_input(query)
         if history:
             history = [
@@ -902,7 +2492,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
         # Validar longitud del query (después de sanitización)
         if len(query) > MAX_QUERY_LENGTH:
-            logger.warning(f"Query excede longitud máxima: {len(query)} caracteres (máximo: {MAX_QUERY_LENGTH})")
+            logger.warning("Query excede longitud máxima: %d caracteres (máximo: %d)", len(query), MAX_QUERY_LENGTH)
             return create_response(
                 400, 
                 {'error': f'La consulta excede la longitud máxima permitida de {MAX_QUERY_LENGTH} caracteres.'},
@@ -926,30 +2516,99 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                             'content': str(msg.get('content', '')).strip()
                         })
                 else:
-                    logger.warning(f"Mensaje inválido en history: {msg}")
+                    logger.warning("Mensaje inválido en history: %s", msg)
             history = valid_history
         
         # Limitar history a MAX_CONTEXT_MESSAGES
         if len(history) > MAX_CONTEXT_MESSAGES:
-            logger.info(f"History truncado de {len(history)} a {MAX_CONTEXT_MESSAGES} mensajes")
+            logger.info("History truncado de %d a %d mensajes", len(history), MAX_CONTEXT_MESSAGES)
             history = history[-MAX_CONTEXT_MESSAGES:]
-        
+
+        # Búsqueda semántica local: solo sin historial, porque una pregunta de
+        # seguimiento depende del contexto y no equivale a la misma pregunta aislada
+        query_vector = None
+        if semantic_index is not None and not history:
+            tracer.begin('semantic_lookup')
+            query_vector = semantic_index.embed_query(query)
+
+            faq_matches = semantic_index.search_vector(query_vector, k=1, kind='faq')
+            if faq_matches and faq_matches[0][0] >= FAQ_DEFLECTION_THRESHOLD:
+                score, faq = faq_matches[0]
+                tracer.route = 'faq'
+                logger.info(
+                    "Deflexión a FAQ %s (score: %.3f)", faq.get('id'), score,
+                    extra={'request_id': request_id, 'faq_id': faq.get('id'), 'score': score}
+                )
+                sources = faq_sources(faq, score)
+                return create_response(200, {'answer': faq['answer'], 'sources': sources, 'request_id': request_id}, request_id)
+
+            if semantic_answer_cache is not None:
+                cached = semantic_answer_cache.lookup(query_vector)
+                if cached:
+                    score, payload = cached
+                    tracer.route = 'semantic_cache'
+                    logger.info("Respuesta desde caché semántica (score: %.3f)", score, extra={'request_id': request_id})
+                    return create_response(200, {**payload, 'request_id': request_id}, request_id)
+
+        # Admission control: la ruta RAG solo empieza si hay tiempo y cupo
+        if admission_controller is not None:
+            tracer.begin('admission')
+            shed_reason = admission_controller.admit(context)
+            if shed_reason:
+                fallback = shed_fallback_answer(query)
+                decision = AdmissionController.DOWNGRADED if fallback else AdmissionController.SHED
+                admission_controller.record(decision, shed_reason, request_id)
+                logger.warning(
+                    "Solicitud RAG descartada (%s): %s", shed_reason, decision,
+                    extra={'request_id': request_id, 'in_flight': admission_controller.in_flight}
+                )
+                if fallback:
+                    tracer.route = 'shed_fallback'
+                    return create_response(200, {**fallback, 'degraded': True, 'request_id': request_id}, request_id)
+                tracer.route = 'shed'
+                return create_response(
+                    503,
+                    {'error': 'El asistente está con alta demanda. Intenta nuevamente en unos segundos.',
+                     'retry_after': ADMISSION_RETRY_AFTER_SECONDS},
+                    request_id,
+                    headers={'Retry-After': str(ADMISSION_RETRY_AFTER_SECONDS)}
+                )
+            admitted = True
+            admission_controller.record(AdmissionController.SERVED, request_id=request_id)
+
+        # Presupuesto de tokens: con gasto alto se acortan la respuesta y el historial
+        max_tokens, max_context_messages = MAX_TOKENS, MAX_CONTEXT_MESSAGES
+        if usage_accountant is not None:
+            max_tokens, max_context_messages = usage_accountant.limits()
+            if max_tokens < MAX_TOKENS:
+                logger.info(
+                    "Presupuesto de tokens: maxTokens %d, historial %d mensajes", max_tokens, max_context_messages,
+                    extra={'request_id': request_id}
+                )
+            if len(history) > max_context_messages:
+                history = history[-max_context_messages:] if max_context_messages else []
+
         # Optimizar query (Phase 2: Query Optimization)
+        tracer.begin('optimize')
         optimized_query = query
         if QUERY_OPTIMIZATION_ENABLED:
             optimized_query = query_optimizer.optimize_query(query, history)
             if optimized_query != query:
                 logger.info(
-                    f"Query optimizado: '{query[:100]}...' -> '{optimized_query[:100]}...'",
-                    extra={'original_query': query, 'optimized_query': optimized_query, 'request_id': request_id}
+                    "Query optimizado: '%.100s...' -> '%.100s...'", query, optimized_query,
+                    extra={'request_id': request_id}
                 )
         
         # Construir query contextual usando el query optimizado
         contextual_query = build_context_prompt(optimized_query, history)
         
-        query_preview = optimized_query[:100] + '...' if len(optimized_query) > 100 else optimized_query
+        # Model tiering: elegir modelo rápido o fuerte según la complejidad del query
+        model_tier = model_router.classify(query, history)
+        model_arn = model_router.select_model_arn(model_tier)
+        
         logger.info(
-            f"Procesando consulta (longitud: {len(optimized_query)}, history: {len(history)} mensajes): '{query_preview}'",
+            "Procesando consulta (longitud: %d, history: %d mensajes): '%.100s'",
+            len(optimized_query), len(history), optimized_query,
             extra={
                 'query_optimization_enabled': QUERY_OPTIMIZATION_ENABLED,
                 'query_expansion_enabled': QUERY_EXPANSION_ENABLED,
@@ -963,114 +2622,36 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         # Query optimizado se envía a Bedrock para mejor recuperación.
         # Usar contextual_query que incluye el historial de conversación y el query optimizado
         
-        # Prompt template para Orchestration (búsqueda y recuperación)
-        # Reformula la pregunta del usuario para mejorar la búsqueda en la base de conocimientos
-        # IMPORTANTE: Debe incluir $conversation_history$ y $output_format_instructions$ (obligatorios)
-        # Bedrock reemplazará estos placeholders automáticamente
-        orchestration_prompt = """Tu tarea es reformular la pregunta del usuario para mejorar la búsqueda en la base de conocimientos de Duoc UC.
-La pregunta reformulada debe ser clara, específica y optimizada para encontrar información relevante sobre admisión, matrícula, becas, carreras, servicios estudiantiles, gratuidad, aranceles y otros temas relacionados con Duoc UC.
-Mantén el sentido original de la pregunta pero hazla más específica para la búsqueda.
-
-HISTORIAL DE CONVERSACIÓN:
-$conversation_history$
-
-PREGUNTA DEL USUARIO:
-$query$
-
-$output_format_instructions$
-
-PREGUNTA REFORMULADA PARA BÚSQUEDA:"""
-
-        # Prompt template para Generation (generación de respuesta)
-        # Genera la respuesta final basada en el contexto recuperado
-        # IMPORTANTE: Debe incluir el placeholder $search_results$ (obligatorio) y $query$ (opcional)
-        # Bedrock reemplazará $search_results$ con los resultados recuperados de la Knowledge Base
-        # VERSIÓN FINAL: PROACTIVA Y EVITA SEPARADORES INICIALES
-        generation_prompt = """Eres un asistente virtual de la Mesa de Servicio Estudiantil de Duoc UC.
-
-Tu función es ayudar a los estudiantes respondiendo sus consultas de manera clara, precisa y amigable.
-
----
-
-INSTRUCCIONES DE CONTENIDO:
-
-- Basa tu respuesta ESTRICTAMENTE en la información de los "RESULTADOS DE BÚSQUEDA".
-
-- **(NUEVA REGLA) NO AÑADIR SEPARADORES:** Tu respuesta debe empezar directamente con la oración. NO incluyas separadores de formato al inicio (como `: ---`, `---`, `***`) ni dos puntos (`:`) antes de la respuesta.
-
-- **SÉ PROACTIVO Y ÚTIL (MUY IMPORTANTE):** Si la respuesta es un resumen y los resultados de búsqueda contienen un enlace (URL) a más detalles, **DEBES incluir ese enlace** en tu respuesta.
-
-- **IGNORAR LISTAS DE PALABRAS CLAVE:** Si los "RESULTADOS DE BÚSQUEDA" son solo una lista de palabras clave (ej. 'CAE', 'Aranceles'), ignóralos y responde que no tienes la información.
-
-- **MÁXIMA PRECISIÓN (NO ASOCIAR):** No asocies información general (ej. "teléfono Mesa de Ayuda") con preguntas específicas (ej. "teléfono Sede Temuco").
-
-- **NO INVENTAR:** Si no tienes un dato, no intentes adivinarlo.
-
-- IGNORA Y OMITE CUALQUIER ARTEFACTO DE FORMATO (ej: 'Step 1', 'SEQ_STARTX', '[1]').
-
-- NO incluyas títulos o nombres de fuente (como 'Gratuidad y Becas'). Tu respuesta debe ir directamente al grano.
-
-- Usa SOLO español.
-
----
-
-INSTRUCCIONES DE FORMATO (MUY IMPORTANTE):
-
-- Tu respuesta final debe ser profesional, limpia y fácil de leer.
-
-- Si la respuesta tiene múltiples puntos, organízalos con guiones (-) sin números.
-
-- No uses separadores visuales (como `---`, `***`, `===`).
-
-- Incluye URLs directas si están disponibles en los resultados.
-
----
-
-RESULTADOS DE BÚSQUEDA:
-$search_results$
-
----
+        # Moderación por niveles: el guardrail solo se adjunta si el filtro local lo pide
+        tracer.begin('moderation')
+        moderation = moderation_screen.assess(query, history, model_risk)
 
-PREGUNTA DEL USUARIO:
-$query$
-
----
-
-RESPUESTA (clara, directa, sin separadores al inicio):"""
-
-        response = bedrock_agent_runtime.retrieve_and_generate(
-            input={'text': contextual_query},
-            retrieveAndGenerateConfiguration={
-                'type': 'KNOWLEDGE_BASE',
-                'knowledgeBaseConfiguration': {
-                    'knowledgeBaseId': KNOWLEDGE_BASE_ID,
-                    'modelArn': MODEL_ARN,
-                    'generationConfiguration': {
-                        # --- INICIO DE NUEVA CONFIGURACIÓN GUARDRAIL ---
-                        'guardrailConfiguration': {
-                            'guardrailId': GUARDRAIL_ID,
-                            'guardrailVersion': GUARDRAIL_VERSION
-                        },
-                        # --- FIN DE NUEVA CONFIGURACIÓN GUARDRAIL ---
-                        'inferenceConfig': {
-                            'textInferenceConfig': {
-                                'temperature': TEMPERATURE,
-                                'topP': TOP_P,
-                                'maxTokens': MAX_TOKENS,
-                            }
-                        },
-                        'promptTemplate': {
-                            'textPromptTemplate': generation_prompt
-                        }
-                    },
-                    'orchestrationConfiguration': {
-                        'promptTemplate': {
-                            'textPromptTemplate': orchestration_prompt
-                        }
-                    }
-                }
-            }
-        )
+        tracer.route = 'rag'
+        tracer.begin('bedrock_call')
+        # La configuración (prompts, modelo, guardrail) se construye una vez por combinación
+        rag_request = {
+            'input': {'text': contextual_query},
+            'retrieveAndGenerateConfiguration': rag_configuration(model_arn, max_tokens, moderation['guardrail']),
+        }
+        call_bedrock = functools.partial(bedrock_client_manager.retrieve_and_generate, context=context, **rag_request)
+
+        bedrock_start = time.perf_counter()
+        coalesced = False
+        if request_coalescer is not None:
+            # Single-flight: las consultas idénticas en vuelo comparten una sola llamada a Bedrock.
+            # La espera se acota para que, si el líder no responde, quede tiempo para llamar.
+            remaining = get_remaining_seconds(context)
+            max_wait = None
+            if remaining is not None:
+                max_wait = remaining - BEDROCK_MIN_CALL_SECONDS - BEDROCK_DEADLINE_MARGIN_SECONDS
+            response, coalesced = request_coalescer.run(
+                coalescing_key(model_arn, str(moderation['guardrail']), contextual_query), call_bedrock, max_wait
+            )
+            if coalesced:
+                tracer.route = 'coalesced'
+                logger.info("Respuesta compartida con una consulta idéntica en vuelo", extra={'request_id': request_id})
+        else:
+            response = call_bedrock()
 
         # Validar estructura de respuesta de Bedrock
         if 'output' not in response or 'text' not in response['output']:
@@ -1080,8 +2661,18 @@ RESPUESTA (clara, directa, sin separadores al inicio):"""
         # Extraer la respuesta y las fuentes (citas)
         answer = response['output']['text']
         citations = response.get('citations', [])
+        if not coalesced:
+            bedrock_latency_ms = (time.perf_counter() - bedrock_start) * 1000
+            model_router.record(model_tier, bedrock_latency_ms, contextual_query, answer, request_id)
+            moderation_screen.record(moderation, response, bedrock_latency_ms, request_id)
+            if usage_accountant is not None:
+                tracer.usage = usage_accountant.estimate(
+                    prompt_templates['orchestration'], prompt_templates['generation'], optimized_query, contextual_query,
+                    answer, citations, max_tokens, guardrail=moderation['guardrail']
+                )
 
         # Validar output antes de retornar
+        tracer.begin('cleanup')
         answer = output_validator.filter_response(answer)
 
         # --- LIMPIEZA AGRESIVA DE ARTEFACTOS ---
@@ -1113,7 +2704,9 @@ RESPUESTA (clara, directa, sin separadores al inicio):"""
         answer = answer.strip()
 
         # Formatear y validar las fuentes (filtrado por score y cantidad)
+        tracer.begin('format_sources')
         sources = format_sources(citations, min_score=MIN_CITATION_SCORE, max_count=MAX_CITATIONS)
+        tracer.end()
         
         # Validar que haya al menos una cita válida si la respuesta requiere fuentes
         if not sources and citations:
@@ -1128,6 +2721,9 @@ RESPUESTA (clara, directa, sin separadores al inicio):"""
             # Opcional: Retornar respuesta sin fuentes o con mensaje de advertencia
             # Por ahora, retornamos sin fuentes pero logueamos la advertencia
 
+        if semantic_answer_cache is not None and query_vector is not None and answer:
+            semantic_answer_cache.store(query_vector, {'answer': answer, 'sources': sources})
+
         logger.info(
             "Respuesta y fuentes generadas exitosamente",
             extra={
@@ -1141,18 +2737,32 @@ RESPUESTA (clara, directa, sin separadores al inicio):"""
         return create_response(200, {'answer': answer, 'sources': sources, 'request_id': request_id}, request_id)
 
     except json.JSONDecodeError as e:
-        logger.error(f"Error al decodificar JSON en el cuerpo de la solicitud: {str(e)}", extra={'request_id': request_id})
+        logger.error("Error al decodificar JSON en el cuerpo de la solicitud: %s", e, extra={'request_id': request_id})
         return create_response(400, {'error': 'Formato JSON inválido en la solicitud.'}, request_id)
     
     except ValueError as e:
-        logger.error(f"Error de validación: {str(e)}", extra={'request_id': request_id})
+        logger.error("Error de validación: %s", e, extra={'request_id': request_id})
         return create_response(400, {'error': str(e)}, request_id)
     
+    except BedrockUnavailableError as e:
+        # Ruta degradada: Bedrock falla o no queda tiempo suficiente para llamarlo
+        tracer.route = 'degraded'
+        logger.warning(
+            "Bedrock no disponible, usando respuesta degradada: %s", e,
+            extra={'request_id': request_id, 'circuit_state': bedrock_client_manager.circuit_breaker.state}
+        )
+        return create_response(200, {
+            'answer': DEGRADED_ANSWER,
+            'sources': [],
+            'degraded': True,
+            'request_id': request_id
+        }, request_id)
+    
     except ClientError as e:
         error_code = e.response['Error']['Code']
         error_message = e.response['Error']['Message']
         logger.error(
-            f"Error de Bedrock API [{error_code}]: {error_message}",
+            "Error de Bedrock API [%s]: %s", error_code, error_message,
             extra={
                 'error_code': error_code,
                 'error_message': error_message,
@@ -1171,9 +2781,13 @@ RESPUESTA (clara, directa, sin separadores al inicio):"""
             return create_response(500, {'error': 'Error interno al procesar la solicitud.'}, request_id)
     
     except Exception as e:
-        logger.error(f"Error inesperado en el handler: {str(e)}", exc_info=True, extra={'request_id': request_id})
+        logger.error("Error inesperado en el handler: %s", e, exc_info=True, extra={'request_id': request_id})
         return create_response(500, {'error': 'Ocurrió un error interno al procesar tu solicitud.'}, request_id)
 
+    finally:
+        if admitted:
+            admission_controller.release()
+
 
 def extract_url_from_text(text: str) -> Optional[str]:
     """
@@ -1225,7 +2839,7 @@ def extract_url_from_metadata(metadata: Dict[str, Any]) -> Optional[str]:
                 url_cleaned = url_value.strip()
                 # Validar que sea una URL válida
                 if url_cleaned.startswith(('http://', 'https://')):
-                    logger.debug(f"URL encontrada en metadata.{field}: {url_cleaned[:100]}")
+                    logger.debug("URL encontrada en metadata.%s: %.100s", field, url_cleaned)
                     return url_cleaned
     
     # Buscar recursivamente en estructuras anidadas
@@ -1238,7 +2852,7 @@ def extract_url_from_metadata(metadata: Dict[str, Any]) -> Optional[str]:
                 # Si la clave sugiere que es una URL
                 if any(field in key.lower() for field in ['url', 'link', 'href']):
                     if isinstance(value, str) and value.strip().startswith(('http://', 'https://')):
-                        logger.debug(f"URL encontrada recursivamente en {key}: {value[:100]}")
+                        logger.debug("URL encontrada recursivamente en %s: %.100s", key, value)
                         return value.strip()
                 
                 # Buscar recursivamente en valores anidados
@@ -1263,14 +2877,38 @@ def extract_url_from_metadata(metadata: Dict[str, Any]) -> Optional[str]:
         metadata_str = json.dumps(metadata)
         url_found = extract_url_from_text(metadata_str)
         if url_found:
-            logger.debug(f"URL encontrada en serialización JSON de metadata: {url_found[:100]}")
+            logger.debug("URL encontrada en serialización JSON de metadata: %.100s", url_found)
             return url_found
     except Exception as e:
-        logger.debug(f"Error serializando metadata para búsqueda de URL: {str(e)}")
+        logger.debug("Error serializando metadata para búsqueda de URL: %s", e)
     
     return None
 
 
+def truncate_excerpt(text: str, max_chars: int = None) -> str:
+    """
+    Recorta el extracto de una fuente en un límite de palabra (el frontend solo muestra
+    el comienzo; el texto completo es la mayor parte del tamaño de la respuesta).
+    
+    Args:
+        text: Texto de la referencia
+        max_chars: Largo máximo (default: SOURCE_EXCERPT_MAX_CHARS, 0 = sin recorte)
+        
+    Returns:
+        Extracto recortado, terminado en '…' si se recortó
+    """
+    if max_chars is None:
+        max_chars = SOURCE_EXCERPT_MAX_CHARS
+    text = (text or '').strip()
+    if not max_chars or len(text) <= max_chars:
+        return text
+    cut = text[:max_chars]
+    space = cut.rfind(' ')
+    if space > max_chars // 2:
+        cut = cut[:space]
+    return cut.rstrip(' ,.;:') + '…'
+
+
 def format_sources(citations: List[Dict[str, Any]], min_score: float = None, max_count: int = None) -> List[Dict[str, Any]]:
     """
     Formatea las citas de Bedrock en un formato simplificado para el frontend.
@@ -1300,7 +2938,7 @@ def format_sources(citations: List[Dict[str, Any]], min_score: float = None, max
             # Filtrar por score mínimo
             if score < min_score:
                 logger.debug(
-                    f"Citation filtered due to low score: {score:.3f} < {min_score:.3f}",
+                    "Citation filtered due to low score: %.3f < %.3f", score, min_score,
                     extra={'score': score, 'min_score': min_score}
                 )
                 continue
@@ -1332,31 +2970,41 @@ def format_sources(citations: List[Dict[str, Any]], min_score: float = None, max
                 if s3_uri:
                     url = s3_uri
                     url_source = 's3_location'
-                    logger.debug(
-                        "URL no encontrada en metadatos ni contenido, usando S3 location",
-                        extra={'s3_location': url[:100]}
-                    )
+                    logger.debug("URL no encontrada en metadatos ni contenido, usando S3 location: %.100s", url)
             
             if url and url_source != 's3_location':
                 logger.debug(
-                    "URL extraída exitosamente desde metadatos de OpenSearch Serverless",
-                    extra={'url_source': url_source, 'url': url[:100]}
+                    "URL extraída exitosamente desde metadatos de OpenSearch Serverless (%s): %.100s",
+                    url_source, url
                 )
             
             source_info = {
                 'url': url,
-                'excerpt': excerpt,
-                'score': score
+                'excerpt': truncate_excerpt(excerpt),
+                'score': round(score, 4)
             }
+            record_id = metadata.get('id')
+            if record_id:
+                source_info['id'] = str(record_id)
             sources.append(source_info)
     
     # Ordenar por score descendente (mayor relevancia primero)
     sources.sort(key=lambda x: x.get('score', 0.0), reverse=True)
     
+    # Varias referencias al mismo documento se muestran una sola vez (la de mayor score)
+    seen_urls = set()
+    unique_sources = []
+    for source in sources:
+        if source['url'] and source['url'] in seen_urls:
+            continue
+        seen_urls.add(source['url'])
+        unique_sources.append(source)
+    sources = unique_sources
+    
     # Limitar cantidad de citas
     if len(sources) > max_count:
         logger.info(
-            f"Citations limited from {len(sources)} to {max_count} (top scores)",
+            "Citations limited from %d to %d (top scores)", len(sources), max_count,
             extra={'original_count': len(sources), 'max_count': max_count}
         )
         sources = sources[:max_count]
@@ -1364,14 +3012,113 @@ def format_sources(citations: List[Dict[str, Any]], min_score: float = None, max
     # Validar que haya al menos una cita válida
     if not sources:
         logger.warning(
-            f"No valid citations found (all below score threshold: {min_score:.3f})",
+            "No valid citations found (all below score threshold: %.3f)", min_score,
             extra={'min_score': min_score, 'total_citations': len(citations)}
         )
     
     return sources
 
 
-def create_response(status_code: int, body: Dict[str, Any], request_id: str = None) -> Dict[str, Any]:
+def decode_request_body(event: Dict[str, Any]) -> str:
+    """
+    Body de la solicitud como texto. Con binaryMediaTypes (necesario para responder
+    comprimido) API Gateway entrega el body en base64; también acepta bodies gzip.
+    """
+    body = event.get('body') or '{}'
+    if not event.get('isBase64Encoded'):
+        return body
+    raw = base64.b64decode(body)
+    if raw[:2] == b'\x1f\x8b':
+        raw = gzip.decompress(raw)
+    return raw.decode('utf-8')
+
+
+def negotiate_encoding(event: Dict[str, Any]) -> Optional[str]:
+    """
+    Codificación de la respuesta según Accept-Encoding: br (si brotli está instalado),
+    luego gzip. Los valores con q=0 se consideran rechazados.
+    
+    Args:
+        event: Evento Lambda con headers de la solicitud
+        
+    Returns:
+        'br', 'gzip' o None
+    """
+    headers = event.get('headers') or {}
+    header = next((value for name, value in headers.items() if name.lower() == 'accept-encoding'), '') or ''
+    accepted = set()
+    for part in header.split(','):
+        name, _, params = part.strip().partition(';')
+        quality = params.strip().lower()
+        if quality.startswith('q=') and quality[2:].strip() in ('0', '0.0', '0.00', '0.000'):
+            continue
+        accepted.add(name.strip().lower())
+    if BROTLI_AVAILABLE and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted or '*' in accepted:
+        return 'gzip'
+    return None
+
+
+def compress_response(response: Dict[str, Any], event: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Comprime el body si RESPONSE_COMPRESSION_ENABLED, el cliente lo acepta y supera
+    RESPONSE_COMPRESSION_MIN_BYTES. El body va en base64 (isBase64Encoded) y API
+    Gateway lo entrega binario con Content-Encoding.
+    
+    Args:
+        response: Respuesta de create_response
+        event: Evento Lambda (Accept-Encoding)
+        
+    Returns:
+        La misma respuesta, comprimida si corresponde
+    """
+    if not RESPONSE_COMPRESSION_ENABLED or response.get('isBase64Encoded'):
+        return response
+    payload = response['body'].encode('utf-8')
+    if len(payload) < RESPONSE_COMPRESSION_MIN_BYTES:
+        return response
+    encoding = negotiate_encoding(event)
+    if encoding is None:
+        return response
+    if encoding == 'br':
+        compressed = brotli.compress(payload, quality=5)  # Calidad media: la latencia importa más que el último byte
+    else:
+        compressed = gzip.compress(payload, compresslevel=6)
+    response['body'] = base64.b64encode(compressed).decode('ascii')
+    response['isBase64Encoded'] = True
+    response['headers'] = {**response['headers'], 'Content-Encoding': encoding, 'Vary': 'Accept-Encoding'}
+    return response
+
+
+def finalize_response(response: Dict[str, Any], event: Dict[str, Any], tracer: RequestTracer) -> Dict[str, Any]:
+    """
+    Agrega el history_token a las respuestas 200 (si hay store de historiales y la
+    conversación ya tiene mensajes) y aplica la compresión negociada.
+    
+    Args:
+        response: Respuesta de process_request
+        event: Evento Lambda
+        tracer: Tracer de la solicitud (historial completo recibido)
+        
+    Returns:
+        Respuesta final
+    """
+    if conversation_store is not None and tracer.history and response['statusCode'] == 200:
+        body = json.loads(response['body'])
+        if body.get('answer') and isinstance(tracer.history, list):
+            history = tracer.history + [{'role': 'assistant', 'content': body['answer']}]
+            try:
+                body['history_token'] = conversation_store.put(history[-MAX_CONTEXT_MESSAGES:])
+                response['body'] = json.dumps(body, ensure_ascii=False, separators=(',', ':'))
+            except Exception as e:
+                # Sin token el cliente envía el historial completo la próxima vez
+                logger.warning("No se pudo guardar el historial: %s", e, extra={'request_id': tracer.request_id})
+    return compress_response(response, event)
+
+
+def create_response(status_code: int, body: Dict[str, Any], request_id: str = None,
+                    headers: Dict[str, str] = None) -> Dict[str, Any]:
     """
     Función de utilidad para crear respuestas HTTP consistentes con headers CORS apropiados.
     
@@ -1379,6 +3126,7 @@ def create_response(status_code: int, body: Dict[str, Any], request_id: str = No
         status_code: Código de estado HTTP
         body: Cuerpo de la respuesta como diccionario
         request_id: Request ID para tracking (opcional)
+        headers: Headers adicionales (ej: Retry-After) (opcional)
         
     Returns:
         Diccionario con statusCode, headers y body formateado
@@ -1390,14 +3138,18 @@ def create_response(status_code: int, body: Dict[str, Any], request_id: str = No
     # Determinar el origen permitido (usar '*' solo si no está configurado, para desarrollo)
     allowed_origin = ALLOWED_ORIGIN or '*'
     
+    response_headers = {
+        'Content-Type': 'application/json',
+        'Access-Control-Allow-Origin': allowed_origin,
+        'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token',
+        'Access-Control-Allow-Methods': 'OPTIONS,POST,GET',
+        'Access-Control-Max-Age': '86400'
+    }
+    if headers:
+        response_headers.update(headers)
+    
     return {
         'statusCode': status_code,
-        'body': json.dumps(body, ensure_ascii=False),  # Soporte para caracteres en español
-        'headers': {
-            'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': allowed_origin,
-            'Access-Control-Allow-Headers': 'Content-Type,X-Amz-Date,Authorization,X-Api-Key,X-Amz-Security-Token',
-            'Access-Control-Allow-Methods': 'OPTIONS,POST,GET',
-            'Access-Control-Max-Age': '86400'
-        }
+        'body': json.dumps(body, ensure_ascii=False, separators=(',', ':')),  # Soporte para caracteres en español
+        'headers': response_headers
     }
\ No newline at end of file
@@ -0,0 +1,219 @@
+"""
+Grabación y reproducción de llamadas a Bedrock Agent Runtime (cassettes).
+
+- RecordingClient envuelve un cliente real y guarda cada par solicitud/respuesta
+  de `retrieve_and_generate` y `retrieve` en un CassetteStore.
+- ReplayClient responde desde el cassette sin red, con latencia, throttling y
+  citas parciales inyectables, para medir regresiones del propio handler.
+
+El cassette es JSONL comprimido con gzip (una entrada por línea, append-only). De
+cada solicitud solo se guardan la operación, el texto consultado y dos hashes: uno
+de la solicitud completa (prompts, modelo, configuración) y otro solo del texto,
+que permite reproducir aunque cambien los prompts. De la respuesta se descarta
+ResponseMetadata (cabeceras HTTP).
+"""
+import copy
+import gzip
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+RECORDED_OPERATIONS = ('retrieve_and_generate', 'retrieve')
+
+
+class CassetteMiss(LookupError):
+    """La solicitud no tiene respuesta grabada en el cassette."""
+
+
+def request_text(operation: str, params: Dict[str, Any]) -> str:
+    """Texto consultado: `input.text` en RetrieveAndGenerate y `retrievalQuery.text` en Retrieve."""
+    if operation == 'retrieve':
+        return (params.get('retrievalQuery') or {}).get('text', '')
+    return (params.get('input') or {}).get('text', '')
+
+
+def request_key(operation: str, params: Dict[str, Any]) -> str:
+    """Hash estable de la solicitud completa (sessionId excluido: cambia en cada conversación)."""
+    stable = {key: value for key, value in params.items() if key != 'sessionId'}
+    canonical = json.dumps([operation, stable], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def query_key(operation: str, params: Dict[str, Any]) -> str:
+    """Hash de la operación y el texto normalizado."""
+    normalized = ' '.join(request_text(operation, params).lower().split())
+    return hashlib.sha256(f"{operation}\x1f{normalized}".encode('utf-8')).hexdigest()
+
+
+class CassetteStore:
+    """
+    Entradas grabadas indexadas por hash de solicitud y por hash de texto.
+    Las escrituras se agregan al archivo al momento (un corte no pierde lo grabado).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._by_request: Dict[str, Dict[str, Any]] = {}
+        self._by_query: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        self._index(json.loads(line))
+
+    def __len__(self) -> int:
+        return len(self._by_request)
+
+    def _index(self, entry: Dict[str, Any]) -> None:
+        self._by_request[entry['key']] = entry
+        self._by_query[entry['query_key']] = entry
+
+    def lookup(self, operation: str, params: Dict[str, Any], exact: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Args:
+            operation: Operación del cliente
+            params: Parámetros de la llamada
+            exact: Exigir la solicitud completa idéntica (si no, basta el mismo texto)
+
+        Returns:
+            Entrada grabada o None
+        """
+        entry = self._by_request.get(request_key(operation, params))
+        if entry is None and not exact:
+            entry = self._by_query.get(query_key(operation, params))
+        return entry
+
+    def record(self, operation: str, params: Dict[str, Any], response: Dict[str, Any], latency_ms: float) -> None:
+        entry = {
+            'operation': operation,
+            'key': request_key(operation, params),
+            'query_key': query_key(operation, params),
+            'text': request_text(operation, params),
+            'latency_ms': round(latency_ms, 1),
+            'response': {key: value for key, value in response.items() if key != 'ResponseMetadata'},
+        }
+        line = json.dumps(entry, ensure_ascii=False, separators=(',', ':'), default=str) + '\n'
+        with self._lock:
+            self._index(entry)
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            with gzip.open(self.path, 'at', encoding='utf-8') as f:
+                f.write(line)
+
+
+class RecordingClient:
+    """Cliente real + grabación de las operaciones de RECORDED_OPERATIONS. El resto pasa directo."""
+
+    def __init__(self, client: Any, store: CassetteStore):
+        self._client = client
+        self.store = store
+
+    def __getattr__(self, name: str) -> Any:
+        attribute = getattr(self._client, name)
+        if name not in RECORDED_OPERATIONS:
+            return attribute
+
+        def recorded(**params):
+            start = time.perf_counter()
+            response = attribute(**params)
+            self.store.record(name, params, response, (time.perf_counter() - start) * 1000)
+            return response
+
+        return recorded
+
+
+def throttling_error(operation: str) -> Exception:
+    """ClientError de botocore con el mismo formato que un throttling real."""
+    from botocore.exceptions import ClientError
+
+    return ClientError(
+        {
+            'Error': {'Code': 'ThrottlingException', 'Message': 'Rate exceeded (replay)'},
+            'ResponseMetadata': {'HTTPStatusCode': 429},
+        },
+        operation,
+    )
+
+
+class ReplayClient:
+    """
+    Cliente offline que reproduce un cassette.
+
+    Args:
+        store: Cassette
+        latency_scale: Factor sobre la latencia grabada (0 = sin espera)
+        latency_ms: Latencia fija en lugar de la grabada
+        jitter_ms: Variación uniforme ± sobre la latencia
+        throttle_rate: Probabilidad de responder ThrottlingException
+        citation_drop_rate: Probabilidad de descartar cada referencia recuperada
+        exact: Exigir solicitud idéntica (ver CassetteStore.lookup)
+        seed: Semilla del generador (reproducibilidad de las fallas inyectadas)
+        sleep: Función de espera (inyectable)
+    """
+
+    def __init__(self, store: CassetteStore, latency_scale: float = 1.0, latency_ms: float = None,
+                 jitter_ms: float = 0.0, throttle_rate: float = 0.0, citation_drop_rate: float = 0.0,
+                 exact: bool = False, seed: int = None, sleep: Callable[[float], None] = time.sleep):
+        self.store = store
+        self.latency_scale = latency_scale
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.throttle_rate = throttle_rate
+        self.citation_drop_rate = citation_drop_rate
+        self.exact = exact
+        self.sleep = sleep
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.misses = 0
+        self.throttled = 0
+
+    def retrieve_and_generate(self, **params) -> Dict[str, Any]:
+        return self._replay('retrieve_and_generate', params)
+
+    def retrieve(self, **params) -> Dict[str, Any]:
+        return self._replay('retrieve', params)
+
+    def _replay(self, operation: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        entry = self.store.lookup(operation, params, exact=self.exact)
+        with self._lock:
+            self.calls += 1
+            if entry is None:
+                self.misses += 1
+            latency = self.latency_ms if self.latency_ms is not None else (entry or {}).get('latency_ms', 0.0) * self.latency_scale
+            latency += self._random.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+            throttle = self.throttle_rate > 0 and self._random.random() < self.throttle_rate
+            if throttle:
+                self.throttled += 1
+            seed = self._random.random()
+
+        if entry is None:
+            raise CassetteMiss(f"{operation} sin respuesta grabada: {request_text(operation, params)[:80]!r}")
+        if latency > 0:
+            self.sleep(latency / 1000.0)
+        if throttle:
+            raise throttling_error(operation.replace('_', ' ').title().replace(' ', ''))
+
+        response = copy.deepcopy(entry['response'])
+        if self.citation_drop_rate > 0:
+            self._drop_citations(response, random.Random(seed))
+        return response
+
+    def _drop_citations(self, response: Dict[str, Any], rng: random.Random) -> None:
+        """Simula recuperación parcial: descarta referencias y las citas que quedan vacías."""
+        if 'retrievalResults' in response:
+            response['retrievalResults'] = [
+                result for result in response['retrievalResults'] if rng.random() >= self.citation_drop_rate
+            ]
+        citations = []
+        for citation in response.get('citations') or []:
+            references = [ref for ref in citation.get('retrievedReferences') or [] if rng.random() >= self.citation_drop_rate]
+            if references:
+                citations.append({**citation, 'retrievedReferences': references})
+        if 'citations' in response:
+            response['citations'] = citations
@@ -0,0 +1,266 @@
+"""
+Coalescing de solicitudes idénticas en vuelo (single-flight).
+
+Cuando muchos estudiantes hacen la misma pregunta al mismo tiempo, solo una
+invocación llama a Bedrock y las demás esperan su resultado:
+
+- Dentro de un proceso (servidor local con hilos): los hilos con la misma clave
+  comparten un `Future`.
+- Entre contenedores Lambda: un registro de corta duración en un store compartido
+  hace de lock mientras el líder llama a Bedrock y luego guarda el resultado por
+  unos segundos. El store es intercambiable: MemoryCoalescingStore (local, tests)
+  o DynamoDBCoalescingStore (escrituras condicionales + TTL).
+
+Si el líder falla o no publica a tiempo, los seguidores hacen su propia llamada:
+el coalescing solo reduce llamadas, nunca agrega un punto de falla.
+"""
+import hashlib
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, Optional, Tuple
+
+STATUS_PENDING = 'pending'
+STATUS_DONE = 'done'
+
+
+def coalescing_key(*parts: str) -> str:
+    """Clave estable a partir de los textos normalizados que determinan la respuesta."""
+    normalized = '\x1f'.join(' '.join(str(part).lower().split()) for part in parts)
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+class MemoryCoalescingStore:
+    """Store compartido en memoria: sustituto local de DynamoDB con la misma semántica."""
+
+    def __init__(self, clock: Callable[[], float] = time.time):
+        self.clock = clock
+        self._records: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str, owner: str, ttl_seconds: float) -> bool:
+        with self._lock:
+            record = self._records.get(key)
+            if record and record['expires_at'] > self.clock():
+                return False
+            self._records[key] = {'owner': owner, 'status': STATUS_PENDING, 'expires_at': self.clock() + ttl_seconds}
+            return True
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            record = self._records.get(key)
+            if record and record['expires_at'] > self.clock():
+                return dict(record)
+            return None
+
+    def publish(self, key: str, owner: str, result: str, ttl_seconds: float) -> None:
+        with self._lock:
+            record = self._records.get(key)
+            if record and record['owner'] == owner:
+                record.update(status=STATUS_DONE, result=result, expires_at=self.clock() + ttl_seconds)
+
+    def release(self, key: str, owner: str) -> None:
+        with self._lock:
+            record = self._records.get(key)
+            if record and record['owner'] == owner and record['status'] == STATUS_PENDING:
+                del self._records[key]
+
+
+class DynamoDBCoalescingStore:
+    """
+    Store en DynamoDB. Tabla con partition key 'pk' (string) y TTL sobre 'expires_at'.
+    El TTL de DynamoDB borra con retraso, por eso también se compara `expires_at`
+    en cada lectura y en la condición del lock.
+    """
+
+    def __init__(self, table_name: str, client=None, region: str = None, clock: Callable[[], float] = time.time):
+        self.table_name = table_name
+        self.clock = clock
+        if client is None:
+            import boto3
+            client = boto3.client('dynamodb', region_name=region)
+        self.client = client
+
+    def acquire(self, key: str, owner: str, ttl_seconds: float) -> bool:
+        now = self.clock()
+        try:
+            self.client.put_item(
+                TableName=self.table_name,
+                Item={
+                    'pk': {'S': key},
+                    'owner': {'S': owner},
+                    'status': {'S': STATUS_PENDING},
+                    'expires_at': {'N': str(int(now + ttl_seconds) + 1)},
+                },
+                ConditionExpression='attribute_not_exists(pk) OR expires_at < :now',
+                ExpressionAttributeValues={':now': {'N': str(int(now))}},
+            )
+            return True
+        except self.client.exceptions.ConditionalCheckFailedException:
+            return False
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        item = self.client.get_item(TableName=self.table_name, Key={'pk': {'S': key}}, ConsistentRead=True).get('Item')
+        if not item or int(item['expires_at']['N']) < self.clock():
+            return None
+        record = {'owner': item['owner']['S'], 'status': item['status']['S'], 'expires_at': int(item['expires_at']['N'])}
+        if 'result' in item:
+            record['result'] = item['result']['S']
+        return record
+
+    def publish(self, key: str, owner: str, result: str, ttl_seconds: float) -> None:
+        try:
+            self.client.update_item(
+                TableName=self.table_name,
+                Key={'pk': {'S': key}},
+                UpdateExpression='SET #s = :done, #r = :result, expires_at = :expires',
+                ConditionExpression='#o = :owner',
+                ExpressionAttributeNames={'#s': 'status', '#r': 'result', '#o': 'owner'},
+                ExpressionAttributeValues={
+                    ':done': {'S': STATUS_DONE},
+                    ':result': {'S': result},
+                    ':expires': {'N': str(int(self.clock() + ttl_seconds) + 1)},
+                    ':owner': {'S': owner},
+                },
+            )
+        except self.client.exceptions.ConditionalCheckFailedException:
+            pass  # El lock expiró y otro contenedor tomó la clave
+
+    def release(self, key: str, owner: str) -> None:
+        try:
+            self.client.delete_item(
+                TableName=self.table_name,
+                Key={'pk': {'S': key}},
+                ConditionExpression='#o = :owner AND #s = :pending',
+                ExpressionAttributeNames={'#o': 'owner', '#s': 'status'},
+                ExpressionAttributeValues={':owner': {'S': owner}, ':pending': {'S': STATUS_PENDING}},
+            )
+        except self.client.exceptions.ConditionalCheckFailedException:
+            pass
+
+
+class RequestCoalescer:
+    """
+    Single-flight por clave, en proceso y (opcionalmente) entre contenedores.
+
+    Contadores: `leader_calls` (llamadas reales), `local_shared` (hilos que
+    reutilizaron un Future) y `remote_shared` (resultados leídos del store).
+    """
+
+    def __init__(self, store=None, lock_ttl_seconds: float = 30.0, result_ttl_seconds: float = 5.0,
+                 max_wait_seconds: float = 20.0, poll_interval_seconds: float = 0.1,
+                 serialize: Callable[[Any], str] = None, deserialize: Callable[[str], Any] = None):
+        self.store = store
+        self.lock_ttl_seconds = lock_ttl_seconds
+        self.result_ttl_seconds = result_ttl_seconds
+        self.max_wait_seconds = max_wait_seconds
+        self.poll_interval_seconds = poll_interval_seconds
+        self.serialize = serialize or (lambda value: json.dumps(value, ensure_ascii=False, default=str))
+        self.deserialize = deserialize or json.loads
+        self.owner_prefix = uuid.uuid4().hex
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.leader_calls = 0
+        self.local_shared = 0
+        self.remote_shared = 0
+
+    def run(self, key: str, func: Callable[[], Any], max_wait: float = None) -> Tuple[Any, bool]:
+        """
+        Ejecuta `func` una sola vez por clave entre todas las solicitudes concurrentes.
+
+        Args:
+            key: Clave de coalescing (ver `coalescing_key`)
+            func: Llamada real (p. ej. retrieve_and_generate)
+            max_wait: Tiempo máximo de espera como seguidor (acotado por el deadline de la solicitud)
+
+        Returns:
+            Tupla (resultado, compartido). Los errores del líder se propagan a los
+            hilos que esperan su Future en el mismo proceso.
+        """
+        max_wait = self.max_wait_seconds if max_wait is None else min(max_wait, self.max_wait_seconds)
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+            else:
+                self.local_shared += 1
+
+        if not leader:
+            try:
+                return future.result(timeout=max(max_wait, 0.0)), True
+            except FutureTimeoutError:
+                return self._call(func), False
+
+        try:
+            result, shared = self._run_shared(key, func, max_wait)
+            future.set_result(result)
+            return result, shared
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _call(self, func: Callable[[], Any]) -> Any:
+        with self._lock:
+            self.leader_calls += 1
+        return func()
+
+    def _run_shared(self, key: str, func: Callable[[], Any], max_wait: float) -> Tuple[Any, bool]:
+        if self.store is None:
+            return self._call(func), False
+
+        owner = f"{self.owner_prefix}:{threading.get_ident()}"
+        deadline = time.monotonic() + max(max_wait, 0.0)
+        while True:
+            try:
+                acquired = self.store.acquire(key, owner, self.lock_ttl_seconds)
+            except Exception:
+                return self._call(func), False  # Store no disponible: degradar a llamada directa
+
+            if acquired:
+                try:
+                    result = self._call(func)
+                except BaseException:
+                    self._safe_release(key, owner)
+                    raise
+                try:
+                    self.store.publish(key, owner, self.serialize(result), self.result_ttl_seconds)
+                except Exception:
+                    pass
+                return result, False
+
+            record = self._wait_for_result(key, deadline)
+            if record is not None:
+                with self._lock:
+                    self.remote_shared += 1
+                return self.deserialize(record['result']), True
+            if time.monotonic() >= deadline:
+                return self._call(func), False
+            # El líder soltó el lock sin resultado (falló): reintentar tomarlo
+
+    def _wait_for_result(self, key: str, deadline: float) -> Optional[Dict[str, Any]]:
+        """Espera el resultado del líder; None si el lock desaparece sin resultado o se acaba el tiempo."""
+        while time.monotonic() < deadline:
+            try:
+                record = self.store.get(key)
+            except Exception:
+                return None
+            if record is None:
+                return None
+            if record['status'] == STATUS_DONE and 'result' in record:
+                return record
+            time.sleep(min(self.poll_interval_seconds, max(deadline - time.monotonic(), 0.0)))
+        return None
+
+    def _safe_release(self, key: str, owner: str) -> None:
+        try:
+            self.store.release(key, owner)
+        except Exception:
+            pass
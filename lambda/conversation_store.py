@@ -0,0 +1,113 @@
+"""
+Historial de conversación guardado en el servidor para el protocolo compacto.
+
+Con un store habilitado, cada respuesta 200 incluye un `history_token` que
+identifica el historial completo después de esa respuesta. En la solicitud
+siguiente chatbot.js envía el token y solo los mensajes nuevos desde entonces
+(el delta) en lugar de todo el historial.
+
+El token es el hash del contenido: el mismo historial produce el mismo token en
+cualquier contenedor y una entrada nunca cambia, así que no hay conflictos de
+escritura. Si el token no está (expiró, o el store es en memoria y la solicitud
+llegó a otro contenedor) el handler responde 409 y el cliente reenvía el
+historial completo. El store es intercambiable: MemoryConversationStore (un
+proceso, LRU + TTL) o DynamoDBConversationStore (compartido entre contenedores).
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+
+def clean_history(history: List[Any]) -> List[Dict[str, str]]:
+    """Solo mensajes {'role', 'content'} con texto: lo demás no llega al prompt."""
+    return [
+        {'role': str(msg['role']), 'content': str(msg['content'])}
+        for msg in history
+        if isinstance(msg, dict) and msg.get('role') and msg.get('content')
+    ]
+
+
+def history_token(history: List[Dict[str, str]]) -> str:
+    """Hash estable del historial."""
+    canonical = json.dumps(history, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:32]
+
+
+class MemoryConversationStore:
+    """Historiales en memoria del proceso (servidor local o un contenedor Lambda caliente)."""
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600, clock: Callable[[], float] = time.time):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._entries: 'OrderedDict[str, Any]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, history: List[Any]) -> str:
+        history = clean_history(history)
+        token = history_token(history)
+        with self._lock:
+            self._entries[token] = (history, self.clock() + self.ttl_seconds)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return token
+
+    def get(self, token: str) -> Optional[List[Dict[str, str]]]:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            history, expires_at = entry
+            if expires_at < self.clock():
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return list(history)
+
+
+class DynamoDBConversationStore:
+    """
+    Store en DynamoDB. Tabla con partition key 'pk' (string) y TTL sobre 'expires_at'
+    (puede ser la misma tabla de coalescing: las claves no se cruzan). Un caché en
+    memoria evita leer la tabla cuando la conversación vuelve al mismo contenedor.
+    """
+
+    def __init__(self, table_name: str, ttl_seconds: float = 3600, client=None, region: str = None,
+                 cache_size: int = 1024, clock: Callable[[], float] = time.time):
+        self.table_name = table_name
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._cache = MemoryConversationStore(cache_size, ttl_seconds, clock)
+        if client is None:
+            import boto3
+            client = boto3.client('dynamodb', region_name=region)
+        self.client = client
+
+    def put(self, history: List[Any]) -> str:
+        token = self._cache.put(history)
+        self.client.put_item(
+            TableName=self.table_name,
+            Item={
+                'pk': {'S': f"conversation#{token}"},
+                'history': {'S': json.dumps(clean_history(history), ensure_ascii=False, separators=(',', ':'))},
+                'expires_at': {'N': str(int(self.clock() + self.ttl_seconds) + 1)},
+            },
+        )
+        return token
+
+    def get(self, token: str) -> Optional[List[Dict[str, str]]]:
+        history = self._cache.get(token)
+        if history is not None:
+            return history
+        item = self.client.get_item(
+            TableName=self.table_name, Key={'pk': {'S': f"conversation#{token}"}}, ConsistentRead=True
+        ).get('Item')
+        if not item or int(item['expires_at']['N']) < self.clock():
+            return None
+        history = json.loads(item['history']['S'])
+        self._cache.put(history)
+        return history
@@ -0,0 +1,211 @@
+"""
+Detector de prompt injection con ONNX Runtime, alternativa liviana a LLM Guard.
+
+El modelo es el mismo clasificador que usa `llm_guard.input_scanners.PromptInjection`
+(DeBERTa v3), exportado a ONNX y cuantizado a int8 offline con
+scripts/build_injection_model.py. Se empaqueta en el artefacto de despliegue junto
+al resto de `lambda/data/` y solo necesita `onnxruntime` y `tokenizers` (sin torch
+ni transformers).
+
+- La sesión de ONNX Runtime se crea en el primer escaneo (no en el cold start) y
+  queda en caché a nivel de módulo: las invocaciones en caliente la reutilizan.
+- `scan_batch` clasifica query e historial en una sola inferencia por lotes.
+- Los puntajes se cachean por texto (LRU): en una conversación el historial se
+  reenvía completo en cada turno, así que solo los mensajes nuevos pasan por el modelo.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import onnxruntime as ort
+    from tokenizers import Tokenizer
+    ONNX_AVAILABLE = True
+except ImportError:
+    ONNX_AVAILABLE = False
+
+MODEL_FILE = 'model.onnx'
+QUANTIZED_MODEL_FILE = 'model.int8.onnx'
+TOKENIZER_FILE = 'tokenizer.json'
+MANIFEST_FILE = 'scanner.json'  # Escrito por scripts/build_injection_model.py
+
+_SESSIONS: Dict[Tuple[str, int], Tuple[Any, Any]] = {}
+_SESSIONS_LOCK = threading.Lock()
+
+
+def load_session(model_path: str, tokenizer_path: str, threads: int = 0) -> Tuple[Any, Any]:
+    """
+    Sesión de inferencia y tokenizador, creados una vez por proceso y modelo.
+
+    Args:
+        model_path: Archivo .onnx
+        tokenizer_path: tokenizer.json del modelo
+        threads: Hilos intra-op de ONNX Runtime (0 = los que decida ONNX Runtime)
+
+    Returns:
+        Tupla (InferenceSession, Tokenizer)
+    """
+    key = (os.path.abspath(model_path), threads)
+    with _SESSIONS_LOCK:
+        cached = _SESSIONS.get(key)
+        if cached is not None:
+            return cached
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        session = ort.InferenceSession(model_path, sess_options=options, providers=['CPUExecutionProvider'])
+        tokenizer = Tokenizer.from_file(tokenizer_path)
+        _SESSIONS[key] = (session, tokenizer)
+        return session, tokenizer
+
+
+class OnnxPromptInjectionScanner:
+    """
+    Clasificador de prompt injection sobre ONNX Runtime con la interfaz de LLM Guard:
+    `scan(text)` retorna (texto, es_válido, riesgo). El riesgo es la probabilidad de
+    la clase de injection; el texto es inválido si supera el threshold.
+
+    Args:
+        model_dir: Directorio con el modelo, tokenizer.json y scanner.json
+        threshold: Probabilidad desde la que el texto se considera injection
+        quantized: Usar model.int8.onnx si existe (si no, model.onnx)
+        max_length: Tokens por texto (se trunca, como MatchType.FULL de LLM Guard)
+        cache_size: Puntajes cacheados por texto
+        threads: Hilos intra-op de ONNX Runtime (0 = automático)
+    """
+
+    def __init__(self, model_dir: str, threshold: float = 0.5, quantized: bool = True, max_length: int = 512,
+                 cache_size: int = 2048, threads: int = 0):
+        self.model_dir = model_dir
+        self.threshold = threshold
+        self.quantized = quantized
+        self.max_length = max_length
+        self.cache_size = cache_size
+        self.threads = threads
+        self._session = None
+        self._tokenizer = None
+        self._input_names: List[str] = []
+        self._injection_index = 1
+        self._load_error = None
+        self._load_lock = threading.Lock()
+        self._cache: 'OrderedDict[str, float]' = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.load_ms = None
+
+    @property
+    def model_path(self) -> str:
+        quantized_path = os.path.join(self.model_dir, QUANTIZED_MODEL_FILE)
+        if self.quantized and os.path.exists(quantized_path):
+            return quantized_path
+        return os.path.join(self.model_dir, MODEL_FILE)
+
+    def _load(self) -> None:
+        """Carga diferida del modelo; un error de carga se recuerda para no reintentar en cada solicitud."""
+        if self._session is not None:
+            return
+        with self._load_lock:
+            if self._session is not None:
+                return
+            if self._load_error is not None:
+                raise self._load_error
+            try:
+                start = time.perf_counter()
+                session, tokenizer = load_session(
+                    self.model_path, os.path.join(self.model_dir, TOKENIZER_FILE), self.threads
+                )
+                tokenizer.enable_truncation(max_length=self.max_length)
+                tokenizer.enable_padding()
+                manifest_path = os.path.join(self.model_dir, MANIFEST_FILE)
+                if os.path.exists(manifest_path):
+                    with open(manifest_path, 'r', encoding='utf-8') as f:
+                        self._injection_index = int(json.load(f).get('injection_index', 1))
+                self._input_names = [item.name for item in session.get_inputs()]
+                self._tokenizer = tokenizer
+                self._session = session
+                self.load_ms = (time.perf_counter() - start) * 1000
+            except Exception as e:
+                self._load_error = e
+                raise
+
+    @staticmethod
+    def _key(text: str) -> str:
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+    def _infer(self, texts: Sequence[str]) -> np.ndarray:
+        """Probabilidad de injection para cada texto, en una sola llamada al modelo."""
+        self._load()
+        encodings = self._tokenizer.encode_batch(list(texts))
+        inputs = {
+            'input_ids': np.array([encoding.ids for encoding in encodings], dtype=np.int64),
+            'attention_mask': np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64),
+            'token_type_ids': np.array([encoding.type_ids for encoding in encodings], dtype=np.int64),
+        }
+        logits = self._session.run(None, {name: inputs[name] for name in self._input_names})[0]
+        logits = logits - logits.max(axis=1, keepdims=True)
+        probabilities = np.exp(logits)
+        probabilities /= probabilities.sum(axis=1, keepdims=True)
+        return probabilities[:, self._injection_index]
+
+    def scores(self, texts: Sequence[str]) -> List[float]:
+        """
+        Probabilidad de injection por texto. Solo los textos sin puntaje en caché (y
+        sin repetir) pasan por el modelo, todos en el mismo lote.
+
+        Args:
+            texts: Textos a clasificar
+
+        Returns:
+            Lista de probabilidades en el orden de `texts`
+        """
+        keys = [self._key(text) for text in texts]
+        found: Dict[str, float] = {}
+        pending: Dict[str, str] = {}
+        with self._cache_lock:
+            for key, text in zip(keys, texts):
+                if key in found or key in pending:
+                    continue
+                score = self._cache.get(key)
+                if score is None:
+                    pending[key] = text
+                else:
+                    self._cache.move_to_end(key)
+                    found[key] = score
+            self.cache_hits += len(found)
+            self.cache_misses += len(pending)
+
+        if pending:
+            computed = self._infer(list(pending.values()))
+            with self._cache_lock:
+                for key, score in zip(pending, computed.tolist()):
+                    found[key] = score
+                    self._cache[key] = score
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return [found[key] for key in keys]
+
+    def scan_batch(self, texts: Sequence[str]) -> List[Tuple[str, bool, float]]:
+        """
+        Args:
+            texts: Query y contenidos del historial
+
+        Returns:
+            Lista de (texto, es_válido, riesgo) en el orden de `texts`
+        """
+        return [
+            (text, score <= self.threshold, round(score, 4))
+            for text, score in zip(texts, self.scores(texts))
+        ]
+
+    def scan(self, text: str) -> Tuple[str, bool, float]:
+        """Misma interfaz que `PromptInjection.scan` de LLM Guard."""
+        return self.scan_batch([text])[0]
@@ -0,0 +1,107 @@
+"""
+Búsqueda léxica de FAQ curadas sin dependencias (sin numpy ni índice precalculado).
+
+Es el respaldo del admission control cuando el índice semántico no está
+habilitado: al descartar una solicitud RAG se responde con la FAQ curada más
+parecida si la coincidencia es suficientemente clara.
+
+El score de una FAQ es la cobertura del query ponderada por IDF (suma del IDF de
+los términos del query presentes en una de sus preguntas, dividida por la suma
+del IDF de todos los términos del query), en [0, 1]. Los términos que no aparecen
+en ninguna FAQ pesan como los más raros, así una consulta fuera del dominio no
+alcanza el umbral por compartir palabras comunes.
+"""
+import json
+import math
+import os
+import re
+import unicodedata
+from typing import Any, Dict, List, Optional, Tuple
+
+STOPWORDS = frozenset(
+    'a al como con cual cuales de del el en es la las lo los me mi mis o para por que se su sus un una y yo'.split()
+)
+URL_PATTERN = re.compile(r'https?://[^\s<>"{}|\\^`\[\]]+[^\s<>"{}|\\^`\[\].,;!?]', re.IGNORECASE)
+
+
+def normalize_terms(text: str) -> List[str]:
+    """Términos sin tildes, en minúsculas y sin stopwords."""
+    text = unicodedata.normalize('NFKD', str(text).lower())
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    words = ''.join(ch if ch.isalnum() else ' ' for ch in text).split()
+    return [word for word in words if word not in STOPWORDS and len(word) > 1]
+
+
+def load_faq_records(path: str) -> List[Dict[str, Any]]:
+    """
+    FAQ curadas de un JSONL con el formato de dataset_enriquecido.jsonl.
+
+    Returns:
+        Lista de {'id', 'answer', 'url', 'questions'}; vacía si el archivo no existe
+    """
+    records = []
+    if not os.path.exists(path):
+        return records
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            data = json.loads(line)
+            if not (data.get('question') and data.get('answer')):
+                continue
+            url = URL_PATTERN.search(f"{data.get('url') or ''} {data.get('source', '')} {data['answer']}")
+            records.append({
+                'id': data.get('id'),
+                'answer': data['answer'],
+                'url': url.group(0) if url else None,
+                'questions': [data['question']] + list(data.get('alternative_questions') or []),
+            })
+    return records
+
+
+class LexicalFaqIndex:
+    """Preguntas (curada + alternativas) de cada FAQ como conjuntos de términos, en memoria."""
+
+    def __init__(self, records: List[Dict[str, Any]]):
+        self.records = records
+        self._variants: List[Tuple[int, frozenset]] = []
+        document_frequency: Dict[str, int] = {}
+        for position, record in enumerate(records):
+            terms_in_record = set()
+            for question in record['questions']:
+                terms = frozenset(normalize_terms(question))
+                if terms:
+                    self._variants.append((position, terms))
+                    terms_in_record |= terms
+            for term in terms_in_record:
+                document_frequency[term] = document_frequency.get(term, 0) + 1
+
+        total = len(records) or 1
+        self.idf = {term: math.log(1 + total / count) for term, count in document_frequency.items()}
+        self.unknown_idf = math.log(1 + total)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def search(self, text: str) -> Optional[Tuple[float, Dict[str, Any]]]:
+        """
+        FAQ con mayor cobertura del query.
+
+        Args:
+            text: Consulta del usuario
+
+        Returns:
+            Tupla (score, registro) o None si el query no tiene términos útiles
+        """
+        weights = {term: self.idf.get(term, self.unknown_idf) for term in normalize_terms(text)}
+        total = sum(weights.values())
+        if not total:
+            return None
+        best_score, best_position = 0.0, None
+        for position, terms in self._variants:
+            score = sum(weight for term, weight in weights.items() if term in terms) / total
+            if score > best_score:
+                best_score, best_position = score, position
+        if best_position is None:
+            return None
+        return best_score, self.records[best_position]
@@ -0,0 +1,399 @@
+"""
+Modo servidor HTTP para ejecutar ask_handler fuera de Lambda.
+
+Traduce cada solicitud HTTP al evento de API Gateway (proxy REST) que espera
+`handler` y devuelve la respuesta de `create_response` tal cual (status, headers
+CORS y body). Cada worker importa ask_handler una sola vez, así el cliente de
+Bedrock (y su pool de conexiones), el circuit breaker y las cachés quedan
+calientes entre solicitudes, igual que un contenedor Lambda reutilizado.
+
+Formas de uso:
+    # Servidor incluido (solo biblioteca estándar): pre-fork + pool de hilos por worker
+    python local_server.py --env-file env.example --workers 4 --threads 16
+
+    # WSGI (gunicorn) o ASGI (uvicorn), con sus propios workers
+    gunicorn -w 4 --threads 16 local_server:application
+    uvicorn local_server:asgi_application --workers 4
+
+En ASGI la llamada bloqueante (boto3) se ejecuta en un ThreadPoolExecutor para
+no bloquear el event loop.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from socketserver import BaseServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer
+
+logger = logging.getLogger(__name__)
+
+# --- Configuración ---
+LOCAL_REQUEST_TIMEOUT_SECONDS = float(os.environ.get('LOCAL_REQUEST_TIMEOUT_SECONDS', '30'))  # Equivale al timeout de la Lambda
+LOCAL_MAX_BODY_BYTES = int(os.environ.get('LOCAL_MAX_BODY_BYTES', str(1024 * 1024)))
+LOCAL_SERVER_THREADS = int(os.environ.get('LOCAL_SERVER_THREADS', '16'))  # Hilos por worker (servidor incluido y offload ASGI)
+LOCAL_HEALTH_PATH = os.environ.get('LOCAL_HEALTH_PATH', '/health')
+# ---------------------
+
+_handler: Optional[Callable[[Dict[str, Any], Any], Dict[str, Any]]] = None
+_handler_lock = threading.Lock()
+
+
+def get_handler() -> Callable[[Dict[str, Any], Any], Dict[str, Any]]:
+    """
+    Importa ask_handler la primera vez que se usa en el worker (después del fork),
+    para que cada proceso cree sus propios clientes boto3.
+    """
+    global _handler
+    if _handler is None:
+        with _handler_lock:
+            if _handler is None:
+                import ask_handler
+                _handler = ask_handler.handler
+    return _handler
+
+
+def flush_usage() -> None:
+    """Publica los contadores de uso del minuto en curso antes de terminar el worker."""
+    ask_handler = sys.modules.get('ask_handler')
+    accountant = getattr(ask_handler, 'usage_accountant', None)
+    if accountant is not None:
+        accountant.flush()
+
+
+class LocalContext:
+    """Contexto mínimo compatible con el de Lambda (deadline por solicitud)."""
+
+    def __init__(self, request_id: str, timeout_seconds: float = LOCAL_REQUEST_TIMEOUT_SECONDS):
+        self.aws_request_id = request_id
+        self.function_name = 'ask_handler-local'
+        self._deadline = time.monotonic() + timeout_seconds
+
+    def get_remaining_time_in_millis(self) -> int:
+        return max(0, int((self._deadline - time.monotonic()) * 1000))
+
+
+def build_event(method: str, path: str, headers: List[Tuple[str, str]], body: bytes,
+                query_string: str = '', source_ip: str = '', request_id: str = None) -> Dict[str, Any]:
+    """
+    Construye el evento de API Gateway (integración proxy REST) para `handler`.
+
+    Args:
+        method: Método HTTP
+        path: Ruta de la solicitud
+        headers: Pares (nombre, valor) tal como llegaron
+        body: Cuerpo crudo
+        query_string: Query string sin '?'
+        source_ip: IP del cliente
+        request_id: Request ID (se genera uno si no viene)
+
+    Returns:
+        Evento con headers, multiValueHeaders, body y requestContext
+    """
+    request_id = request_id or str(uuid.uuid4())
+    single_headers: Dict[str, str] = {}
+    multi_headers: Dict[str, List[str]] = {}
+    for name, value in headers:
+        single_headers[name] = value
+        multi_headers.setdefault(name, []).append(value)
+
+    query = parse_qs(query_string, keep_blank_values=True) if query_string else {}
+    try:
+        text_body = body.decode('utf-8')
+        is_base64 = False
+    except UnicodeDecodeError:
+        text_body = base64.b64encode(body).decode('ascii')
+        is_base64 = True
+
+    return {
+        'resource': path,
+        'path': path,
+        'httpMethod': method,
+        'headers': single_headers,
+        'multiValueHeaders': multi_headers,
+        'queryStringParameters': {key: values[-1] for key, values in query.items()} or None,
+        'multiValueQueryStringParameters': query or None,
+        'body': text_body if body else '{}',
+        'isBase64Encoded': is_base64,
+        'requestContext': {
+            'requestId': request_id,
+            'httpMethod': method,
+            'path': path,
+            'stage': 'local',
+            'identity': {'sourceIp': source_ip},
+        },
+    }
+
+
+def invoke(event: Dict[str, Any]) -> Dict[str, Any]:
+    """Ejecuta el handler con un contexto local; los errores inesperados se convierten en 500."""
+    request_id = event['requestContext']['requestId']
+    try:
+        return get_handler()(event, LocalContext(request_id))
+    except Exception as e:
+        logger.error("Error no controlado en handler: %s", e, exc_info=True)
+        return {'statusCode': 500, 'headers': {'Content-Type': 'application/json'},
+                'body': json.dumps({'error': 'Error interno', 'request_id': request_id})}
+
+
+def response_parts(response: Dict[str, Any]) -> Tuple[int, List[Tuple[str, str]], bytes]:
+    """Convierte la respuesta de `handler` en (status, headers, body) HTTP."""
+    status = int(response.get('statusCode', 200))
+    body = response.get('body') or ''
+    payload = base64.b64decode(body) if response.get('isBase64Encoded') else body.encode('utf-8')
+
+    headers = [(name, str(value)) for name, value in (response.get('headers') or {}).items()]
+    for name, values in (response.get('multiValueHeaders') or {}).items():
+        headers.extend((name, str(value)) for value in values)
+    headers = [(name, value) for name, value in headers if name.lower() != 'content-length']
+    headers.append(('Content-Length', str(len(payload))))
+    return status, headers, payload
+
+
+def health_response() -> Dict[str, Any]:
+    return {'statusCode': 200, 'headers': {'Content-Type': 'application/json'}, 'body': '{"status":"ok"}'}
+
+
+def too_large_response() -> Dict[str, Any]:
+    return {'statusCode': 413, 'headers': {'Content-Type': 'application/json'},
+            'body': json.dumps({'error': f'El cuerpo excede {LOCAL_MAX_BODY_BYTES} bytes.'})}
+
+
+def status_line(status: int) -> str:
+    try:
+        return f"{status} {HTTPStatus(status).phrase}"
+    except ValueError:
+        return str(status)
+
+
+# --- WSGI ---
+
+def application(environ: Dict[str, Any], start_response: Callable) -> List[bytes]:
+    """Aplicación WSGI: una solicitud HTTP -> una invocación de `handler`."""
+    method = environ.get('REQUEST_METHOD', 'GET')
+    path = environ.get('PATH_INFO') or '/'
+    if method == 'GET' and path == LOCAL_HEALTH_PATH:
+        response = health_response()
+    else:
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        if length > LOCAL_MAX_BODY_BYTES:
+            response = too_large_response()
+        else:
+            body = environ['wsgi.input'].read(length) if length > 0 else b''
+            headers = [(key[5:].replace('_', '-').title(), value) for key, value in environ.items()
+                       if key.startswith('HTTP_')]
+            if environ.get('CONTENT_TYPE'):
+                headers.append(('Content-Type', environ['CONTENT_TYPE']))
+            event = build_event(method, path, headers, body, environ.get('QUERY_STRING', ''),
+                                environ.get('REMOTE_ADDR', ''))
+            response = invoke(event)
+
+    status, headers, payload = response_parts(response)
+    start_response(status_line(status), headers)
+    return [payload]
+
+
+# --- ASGI ---
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=LOCAL_SERVER_THREADS, thread_name_prefix='ask-handler')
+    return _executor
+
+
+async def asgi_application(scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+    """Aplicación ASGI: `handler` corre en un pool de hilos para no bloquear el event loop."""
+    loop = asyncio.get_running_loop()
+
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await loop.run_in_executor(get_executor(), get_handler)  # Cold start antes de aceptar tráfico
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                get_executor().shutdown(wait=False)
+                flush_usage()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    if scope['type'] != 'http':
+        return
+
+    method = scope['method']
+    path = scope.get('path') or '/'
+    if method == 'GET' and path == LOCAL_HEALTH_PATH:
+        response = health_response()
+    else:
+        chunks, size, more = [], 0, True
+        while more:
+            message = await receive()
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size <= LOCAL_MAX_BODY_BYTES:
+                chunks.append(chunk)
+            more = message.get('more_body', False)
+
+        if size > LOCAL_MAX_BODY_BYTES:
+            response = too_large_response()
+        else:
+            headers = [(name.decode('latin-1'), value.decode('latin-1')) for name, value in scope.get('headers', [])]
+            client = scope.get('client') or ('', 0)
+            event = build_event(method, path, headers, b''.join(chunks),
+                                scope.get('query_string', b'').decode('latin-1'), client[0])
+            response = await loop.run_in_executor(get_executor(), invoke, event)
+
+    status, headers, payload = response_parts(response)
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+    })
+    await send({'type': 'http.response.body', 'body': payload})
+
+
+# --- Servidor incluido (biblioteca estándar) ---
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format: str, *args: Any) -> None:
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+class PooledWSGIServer(WSGIServer):
+    """WSGIServer que atiende cada conexión en un pool acotado de hilos."""
+
+    def __init__(self, sock: socket.socket, threads: int):
+        BaseServer.__init__(self, sock.getsockname(), QuietRequestHandler)
+        self.socket = sock
+        self.server_address = sock.getsockname()
+        self.setup_environ_from_socket()
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='http')
+        self.set_app(application)
+
+    def setup_environ_from_socket(self) -> None:
+        host, port = self.server_address[:2]
+        self.server_name = socket.getfqdn(host)
+        self.server_port = port
+        self.setup_environ()
+
+    def process_request(self, request, client_address) -> None:
+        self.pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address) -> None:
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self) -> None:
+        super().server_close()
+        self.pool.shutdown(wait=True)
+
+
+def serve_worker(sock: socket.socket, threads: int) -> None:
+    # No bloqueante: con varios workers sobre el mismo socket, el que pierde el accept() no se queda colgado
+    sock.setblocking(False)
+    server = PooledWSGIServer(sock, threads)
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+    get_handler()  # Cold start antes de aceptar conexiones
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        flush_usage()
+
+
+def serve(host: str = '127.0.0.1', port: int = 8080, workers: int = 1, threads: int = LOCAL_SERVER_THREADS) -> None:
+    """
+    Servidor pre-fork: el proceso padre abre el socket y cada worker hijo acepta
+    conexiones sobre él con su propio estado caliente. Sin fork (Windows) corre un solo worker.
+    """
+    sock = socket.create_server((host, port), backlog=1024, reuse_port=False)
+    if workers <= 1 or not hasattr(os, 'fork'):
+        logger.info("Escuchando en http://%s:%d (1 worker, %d hilos)", host, port, threads)
+        serve_worker(sock, threads)
+        return
+
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                serve_worker(sock, threads)
+            finally:
+                os._exit(0)
+        children.append(pid)
+    logger.info("Escuchando en http://%s:%d (%d workers, %d hilos c/u)", host, port, workers, threads)
+
+    def stop(signum, frame):
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for pid in children:
+        while True:
+            try:
+                os.waitpid(pid, 0)
+                break
+            except InterruptedError:
+                continue
+            except ChildProcessError:
+                break
+    sock.close()
+
+
+def load_env_file(path: str) -> None:
+    """Carga KEY=VALUE (p. ej. env.example) sin pisar variables ya definidas."""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#') and '=' in line:
+                key, value = line.split('=', 1)
+                os.environ.setdefault(key.strip(), value.strip())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ejecuta ask_handler como servidor HTTP local")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=1, help="Procesos (pre-fork)")
+    parser.add_argument('--threads', type=int, default=LOCAL_SERVER_THREADS, help="Hilos por worker")
+    parser.add_argument('--env-file', help="Archivo KEY=VALUE con la configuración de la Lambda")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(process)d] %(levelname)s %(message)s')
+    if args.env_file:
+        load_env_file(args.env_file)
+    if os.path.dirname(os.path.abspath(__file__)) not in sys.path:
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    serve(args.host, args.port, args.workers, args.threads)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,274 @@
+"""
+Índice vectorial local para comparar consultas semánticamente sin salir de Lambda.
+
+La matriz de embeddings (corpus + preguntas FAQ) se construye offline con
+scripts/build_semantic_index.py y se guarda como float16 en un `.npy`, junto a un
+`.json` con los ítems y la especificación del embedder. En el cold start la matriz
+se abre con memory-map (no se copia a memoria) y el top-k es un producto matricial
+vectorizado por bloques.
+
+El embedder es intercambiable: HashingEmbedder es determinista y no usa red (tests
+offline y despliegues sin costo), TitanEmbedder usa Amazon Titan Text Embeddings.
+"""
+import json
+import os
+import threading
+import time
+import unicodedata
+import zlib
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+SEARCH_BLOCK_ROWS = 8192  # Filas float16 que se convierten a float32 por bloque durante la búsqueda
+
+
+def normalize_text(text: str) -> str:
+    """Minúsculas, sin tildes y solo caracteres alfanuméricos separados por espacio."""
+    text = unicodedata.normalize('NFKD', str(text).lower())
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return ' '.join(''.join(ch if ch.isalnum() else ' ' for ch in text).split())
+
+
+class HashingEmbedder:
+    """
+    Embedder determinista basado en feature hashing (sin red ni modelo).
+
+    Usa palabras, bigramas de palabras y trigramas de caracteres; cada feature se
+    proyecta con crc32 a una dimensión y un signo. Captura similitud léxica y es
+    robusto a tildes y errores de tipeo menores.
+    """
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+
+    @property
+    def spec(self) -> Dict[str, Any]:
+        return {'type': 'hashing', 'dim': self.dim}
+
+    def _features(self, text: str) -> List[Tuple[str, float]]:
+        words = normalize_text(text).split()
+        features = [(f"w:{word}", 1.0) for word in words]
+        features += [(f"b:{a}_{b}", 0.7) for a, b in zip(words, words[1:])]
+        for word in words:
+            padded = f"#{word}#"
+            features += [(f"c:{padded[i:i + 3]}", 0.3) for i in range(len(padded) - 2)]
+        return features
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        """
+        Args:
+            texts: Textos a convertir
+
+        Returns:
+            Matriz float32 (len(texts), dim) con filas de norma 1 (o 0 si el texto está vacío)
+        """
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, weight in self._features(text):
+                encoded = feature.encode('utf-8')
+                index = zlib.crc32(encoded) % self.dim
+                sign = 1.0 if zlib.crc32(b'~' + encoded) & 1 else -1.0
+                matrix[row, index] += sign * weight
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        return matrix
+
+
+class TitanEmbedder:
+    """Embeddings de Amazon Titan Text Embeddings V2 (una llamada a Bedrock por texto)."""
+
+    def __init__(self, model_id: str = 'amazon.titan-embed-text-v2:0', dim: int = 256,
+                 region: str = None, client=None):
+        self.model_id = model_id
+        self.dim = dim
+        if client is None:
+            import boto3
+            client = boto3.client('bedrock-runtime', region_name=region or os.environ.get('AWS_REGION', 'us-east-1'))
+        self.client = client
+
+    @property
+    def spec(self) -> Dict[str, Any]:
+        return {'type': 'titan', 'dim': self.dim, 'model_id': self.model_id}
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            response = self.client.invoke_model(
+                modelId=self.model_id,
+                body=json.dumps({'inputText': text, 'dimensions': self.dim, 'normalize': True}),
+            )
+            matrix[row] = json.loads(response['body'].read())['embedding']
+        return matrix
+
+
+def make_embedder(spec: Dict[str, Any]):
+    """Reconstruye el embedder con el que se construyó un índice."""
+    if spec.get('type') == 'hashing':
+        return HashingEmbedder(dim=spec['dim'])
+    if spec.get('type') == 'titan':
+        return TitanEmbedder(model_id=spec['model_id'], dim=spec['dim'])
+    raise ValueError(f"Embedder desconocido: {spec}")
+
+
+def build_index(items: List[Dict[str, Any]], embedder, path_prefix: str, batch_size: int = 256) -> int:
+    """
+    Construye y guarda el índice: `<prefix>.npy` (float16) y `<prefix>.json`.
+
+    Args:
+        items: Ítems con 'texts' (textos a indexar, una fila cada uno), 'kind' y
+               el payload a devolver en las búsquedas (answer, url, id, ...)
+        embedder: Objeto con `embed(texts)` y `spec`
+        path_prefix: Ruta sin extensión
+
+    Returns:
+        Cantidad de filas del índice
+    """
+    row_texts, row_items = [], []
+    for item_index, item in enumerate(items):
+        for text in item['texts']:
+            if text and text.strip():
+                row_texts.append(text)
+                row_items.append(item_index)
+
+    matrix = np.lib.format.open_memmap(path_prefix + '.npy', mode='w+', dtype=np.float16,
+                                       shape=(len(row_texts), embedder.spec['dim']))
+    for start in range(0, len(row_texts), batch_size):
+        matrix[start:start + batch_size] = embedder.embed(row_texts[start:start + batch_size])
+    matrix.flush()
+    del matrix
+
+    meta = {
+        'version': 1,
+        'embedder': embedder.spec,
+        'rows': row_items,
+        'items': [{key: value for key, value in item.items() if key != 'texts'} for item in items],
+    }
+    with open(path_prefix + '.json', 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, separators=(',', ':'))
+    return len(row_texts)
+
+
+class SemanticIndex:
+    """Índice memory-mapped con búsqueda coseno top-k y caché de embeddings de consultas."""
+
+    def __init__(self, path_prefix: str, embedder=None, query_cache_size: int = 1024):
+        with open(path_prefix + '.json', 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        self.matrix = np.load(path_prefix + '.npy', mmap_mode='r')
+        self.rows = np.asarray(meta['rows'], dtype=np.int32)
+        self.items: List[Dict[str, Any]] = meta['items']
+        self.embedder = embedder or make_embedder(meta['embedder'])
+        if self.embedder.spec['dim'] != self.matrix.shape[1]:
+            raise ValueError(
+                f"Dimensión del embedder ({self.embedder.spec['dim']}) distinta a la del índice ({self.matrix.shape[1]})"
+            )
+
+        kinds = np.array([self.items[item].get('kind', '') for item in self.rows]) if len(self.rows) else np.array([])
+        self.kind_masks = {kind: kinds == kind for kind in set(kinds.tolist())}
+
+        self.query_cache_size = query_cache_size
+        self._query_cache: 'OrderedDict[str, np.ndarray]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def __len__(self) -> int:
+        return self.matrix.shape[0]
+
+    def embed_query(self, text: str) -> np.ndarray:
+        """Embedding del query, cacheado por texto normalizado (LRU)."""
+        key = normalize_text(text)
+        with self._lock:
+            vector = self._query_cache.get(key)
+            if vector is not None:
+                self._query_cache.move_to_end(key)
+                self.cache_hits += 1
+                return vector
+            self.cache_misses += 1
+
+        vector = self.embedder.embed([text])[0]
+        with self._lock:
+            self._query_cache[key] = vector
+            if len(self._query_cache) > self.query_cache_size:
+                self._query_cache.popitem(last=False)
+        return vector
+
+    def search_vector(self, vector: np.ndarray, k: int = 5, kind: Optional[str] = None) -> List[Tuple[float, Dict[str, Any]]]:
+        """
+        Top-k por similitud coseno (las filas ya están normalizadas).
+        Cada ítem aparece una sola vez, con el score de su mejor fila.
+        """
+        if not len(self):
+            return []
+        vector = np.asarray(vector, dtype=np.float32)
+        scores = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), SEARCH_BLOCK_ROWS):
+            block = self.matrix[start:start + SEARCH_BLOCK_ROWS]
+            scores[start:start + len(block)] = block.astype(np.float32) @ vector
+        if kind is not None:
+            mask = self.kind_masks.get(kind)
+            if mask is None:
+                return []
+            scores[~mask] = -np.inf
+
+        # Pedir filas de más: varias filas pueden apuntar al mismo ítem (pregunta + alternativas)
+        candidates = min(len(scores), max(k * 8, k))
+        top = np.argpartition(-scores, candidates - 1)[:candidates]
+        top = top[np.argsort(-scores[top])]
+
+        results, seen = [], set()
+        for row in top:
+            score = float(scores[row])
+            if score == -np.inf:
+                break
+            item_index = int(self.rows[row])
+            if item_index in seen:
+                continue
+            seen.add(item_index)
+            results.append((score, self.items[item_index]))
+            if len(results) == k:
+                break
+        return results
+
+    def search(self, text: str, k: int = 5, kind: Optional[str] = None) -> List[Tuple[float, Dict[str, Any]]]:
+        return self.search_vector(self.embed_query(text), k, kind)
+
+
+class SemanticAnswerCache:
+    """
+    Caché de respuestas por similitud de consulta (por contenedor Lambda).
+
+    Guarda los embeddings en una matriz fija tipo ring buffer; una búsqueda es un
+    solo producto matriz-vector.
+    """
+
+    def __init__(self, dim: int, capacity: int = 256, threshold: float = 0.95, ttl_seconds: float = 3600.0,
+                 clock: Callable[[], float] = time.time):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.expires = np.zeros(capacity, dtype=np.float64)
+        self.payloads: List[Optional[Dict[str, Any]]] = [None] * capacity
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def lookup(self, vector: np.ndarray) -> Optional[Tuple[float, Dict[str, Any]]]:
+        with self._lock:
+            scores = self.vectors @ vector
+            scores[self.expires <= self.clock()] = -np.inf
+            best = int(np.argmax(scores))
+            if scores[best] >= self.threshold:
+                return float(scores[best]), self.payloads[best]
+        return None
+
+    def store(self, vector: np.ndarray, payload: Dict[str, Any]) -> None:
+        with self._lock:
+            slot = self._next
+            self.vectors[slot] = vector
+            self.expires[slot] = self.clock() + self.ttl_seconds
+            self.payloads[slot] = payload
+            self._next = (slot + 1) % self.capacity
@@ -0,0 +1,182 @@
+"""
+Offline crawler benchmark against the local mock duoc.cl site.
+
+Each crawler mode runs in a fresh process so peak memory (max RSS) is measured
+per mode; the mock server runs in the parent process.
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from typing import Any, Dict, List
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from mock_duoc_site import MockSiteConfig, start_mock_server
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Crawler modes to compare: CrawlerConfig overrides per mode
+MODES: Dict[str, Dict[str, Any]] = {
+    "sequential": {"max_workers": 1},
+    "threaded": {"max_workers": 8},
+    "threaded-fast": {"max_workers": 8, "extractor": "fast"},
+}
+SECTION_PATHS = ["/admision/", "/carreras", "/oferta-academica"]
+
+
+class ParseTimer:
+    """Accumulates CPU time spent parsing HTML (outermost timed call per thread only)"""
+
+    def __init__(self):
+        self.cpu_seconds = 0.0
+        self.calls = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def wrap(self, func):
+        def timed(*args, **kwargs):
+            depth = getattr(self._local, "depth", 0)
+            self._local.depth = depth + 1
+            start = time.thread_time() if depth == 0 else 0.0
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._local.depth = depth
+                if depth == 0:
+                    elapsed = time.thread_time() - start
+                    with self._lock:
+                        self.cpu_seconds += elapsed
+                        self.calls += 1
+        return timed
+
+
+def run_mode(mode: str, overrides: Dict[str, Any], base_url: str, max_depth: int) -> Dict[str, Any]:
+    """Run one crawler mode against the mock site and return its metrics"""
+    import duoc_crawler
+
+    timer = ParseTimer()
+    duoc_crawler.BeautifulSoup = timer.wrap(duoc_crawler.BeautifulSoup)
+    duoc_crawler.extract_page_fast = timer.wrap(duoc_crawler.extract_page_fast)
+
+    use_tracemalloc = resource is None
+    if use_tracemalloc:
+        tracemalloc.start()
+
+    output_dir = tempfile.mkdtemp(prefix=f"crawler_bench_{mode}_")
+    config = duoc_crawler.CrawlerConfig(
+        max_depth=max_depth,
+        delay_min=0.0,
+        delay_max=0.0,
+        retry_delay=0.05,
+        log_level="WARNING",
+        **overrides,
+    )
+    with contextlib.redirect_stdout(io.StringIO()):
+        crawler = duoc_crawler.DuocCrawler(config)
+        crawler.OUTPUT_DIR = output_dir
+        crawler.extract_text_from_html = timer.wrap(crawler.extract_text_from_html)
+        crawler.extract_links = timer.wrap(crawler.extract_links)
+
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        items = crawler.run([base_url + path for path in SECTION_PATHS])
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+
+    shutil.rmtree(output_dir, ignore_errors=True)
+
+    if use_tracemalloc:
+        peak_mib = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        tracemalloc.stop()
+    else:
+        peak_mib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+
+    total_bytes = sum(item.meta.get("content_length", 0) for item in items)
+    return {
+        "mode": mode,
+        "config": overrides,
+        "pages": len(items),
+        "bytes": total_bytes,
+        "wall_seconds": round(wall, 3),
+        "pages_per_second": round(len(items) / wall, 2) if wall else 0.0,
+        "bytes_per_second": round(total_bytes / wall, 1) if wall else 0.0,
+        "process_cpu_seconds": round(cpu, 3),
+        "parse_cpu_seconds": round(timer.cpu_seconds, 3),
+        "parse_calls": timer.calls,
+        "peak_memory_mib": round(peak_mib, 1),
+        "memory_source": "tracemalloc" if use_tracemalloc else "max_rss",
+    }
+
+
+def print_results(results: List[Dict[str, Any]], served: Dict[str, int]):
+    print(f"\n{'='*100}")
+    print("🏁 CRAWLER BENCHMARK (mock duoc.cl)")
+    print(f"   • Requests served: {served['requests']} | Errors: {served['errors']} | "
+          f"Bytes: {served['bytes'] / 1024 / 1024:.1f} MiB")
+    print(f"{'='*100}")
+    print(f"{'mode':<20}{'pages':>7}{'pages/s':>10}{'MiB/s':>9}{'wall s':>9}"
+          f"{'cpu s':>9}{'parse cpu s':>13}{'peak MiB':>10}")
+    for r in results:
+        print(f"{r['mode']:<20}{r['pages']:>7}{r['pages_per_second']:>10}"
+              f"{r['bytes_per_second'] / 1024 / 1024:>9.2f}{r['wall_seconds']:>9}"
+              f"{r['process_cpu_seconds']:>9}{r['parse_cpu_seconds']:>13}{r['peak_memory_mib']:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark DuocCrawler modes against a local mock duoc.cl")
+    parser.add_argument("--modes", default=",".join(MODES), help="Comma-separated modes to run")
+    parser.add_argument("--max-depth", type=int, default=2)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--jitter-ms", type=float, default=5.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--fanout", type=int, default=8)
+    parser.add_argument("--size-scale", type=float, default=0.1)
+    parser.add_argument("--copies", type=int, default=1)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    site_config = MockSiteConfig(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+        fanout=args.fanout, size_scale=args.size_scale, copies=args.copies,
+    )
+    server, site, base_url = start_mock_server(site_config)
+    print(f"🌐 Mock site with {len(site.pages)} pages at {base_url}")
+
+    results = []
+    ctx = multiprocessing.get_context("spawn")
+    try:
+        for mode in [m.strip() for m in args.modes.split(",") if m.strip()]:
+            if mode not in MODES:
+                print(f"⚠️  Unknown mode '{mode}', skipping (available: {', '.join(MODES)})")
+                continue
+            print(f"🚀 Running mode: {mode}")
+            with ctx.Pool(1) as pool:
+                results.append(pool.apply(run_mode, (mode, MODES[mode], base_url, args.max_depth)))
+    finally:
+        server.shutdown()
+
+    served = {"requests": site.requests_served, "errors": site.errors_served, "bytes": site.bytes_served}
+    print_results(results, served)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"site": vars(args), "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"\n📝 Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
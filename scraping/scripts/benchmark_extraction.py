@@ -0,0 +1,83 @@
+"""
+Compare the BeautifulSoup and streaming lxml extractors over the stored pages.
+
+Pages are rendered by the mock duoc.cl site from combined_dataset.json at their
+original size, so both extractors see realistic documents. The benchmark checks
+that both produce identical text and reports time and peak memory per extractor.
+"""
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+from typing import Callable, List
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+import duoc_crawler
+from duoc_crawler import CrawlerConfig, DuocCrawler
+from mock_duoc_site import MockDuocSite, MockSiteConfig
+
+
+def make_extractor(extractor: str) -> Callable[[str], str]:
+    """Bind DuocCrawler.extract_text_from_html to a config without crawler side effects"""
+    crawler = DuocCrawler.__new__(DuocCrawler)
+    crawler.config = CrawlerConfig(extractor=extractor)
+    return crawler.extract_text_from_html
+
+
+def measure(extract: Callable[[str], str], pages: List[str], rounds: int):
+    """Return (texts, seconds per round, peak traced memory in MiB for one page at a time)"""
+    texts = [extract(html) for html in pages]  # warm-up
+
+    gc.collect()
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for html in pages:
+            extract(html)
+    seconds = (time.perf_counter() - start) / rounds
+
+    peak = 0
+    for html in pages:
+        gc.collect()
+        tracemalloc.start()
+        extract(html)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return texts, seconds, peak / (1024 * 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark HTML text extractors over the stored pages")
+    parser.add_argument("--size-scale", type=float, default=1.0, help="Fraction of the original page size")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    if not duoc_crawler.LXML_AVAILABLE:
+        print("❌ lxml is not installed: pip install lxml")
+        return
+
+    site = MockDuocSite(MockSiteConfig(size_scale=args.size_scale))
+    pages = [site.render(path).decode("utf-8") for path in sorted(site.pages)]
+    total_mib = sum(len(html) for html in pages) / (1024 * 1024)
+    print(f"📄 {len(pages)} pages, {total_mib:.1f} MiB of HTML")
+
+    bs4_texts, bs4_seconds, bs4_peak = measure(make_extractor("bs4"), pages, args.rounds)
+    fast_texts, fast_seconds, fast_peak = measure(make_extractor("fast"), pages, args.rounds)
+
+    mismatches = [path for path, a, b in zip(sorted(site.pages), bs4_texts, fast_texts) if a != b]
+    print(f"\n{'extractor':<12}{'seconds':>10}{'MiB/s':>10}{'peak MiB/page':>16}")
+    print(f"{'bs4':<12}{bs4_seconds:>10.3f}{total_mib / bs4_seconds:>10.1f}{bs4_peak:>16.2f}")
+    print(f"{'fast':<12}{fast_seconds:>10.3f}{total_mib / fast_seconds:>10.1f}{fast_peak:>16.2f}")
+    print(f"\n⚡ Speedup: {bs4_seconds / fast_seconds:.1f}x | Peak memory: {bs4_peak / fast_peak:.1f}x lower")
+    if mismatches:
+        print(f"❌ {len(mismatches)} pages differ: {mismatches[:5]}")
+    else:
+        print("✅ Identical text for every page")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+"""
+Compact binary corpus store for the scraping pipeline.
+
+A store is two files:
+    corpus.dcs      length-prefixed record log
+    corpus.dcs.idx  JSON index: field names, record offsets and key -> record numbers
+
+Each record is framed field by field, so readers can project columns
+(e.g. only url/title/text) and skip bulky fields like meta.structured_data
+without decoding them. Records are random-accessible by key (url or chunk id)
+through the index, and the log is memory-mapped so nothing is parsed up front.
+
+Values are stored as raw UTF-8 for strings (zlib-compressed when large, unless
+disabled) and as msgpack for anything else when available, JSON otherwise.
+
+Usage:
+    python corpus_store.py convert ../datasets/combined_dataset.json ../datasets/combined_dataset.dcs
+    python corpus_store.py export ../datasets/combined_dataset.dcs out.json --fields url,title,text
+    python corpus_store.py info ../datasets/combined_dataset.dcs
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+import zlib
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+MAGIC = b"DCS1"
+STORE_EXTENSION = ".dcs"
+INDEX_SUFFIX = ".idx"
+COMPRESS_MIN_BYTES = 512  # Strings at least this long are zlib-compressed
+
+# Value encodings (first byte of every field payload)
+TYPE_NONE = 0
+TYPE_STR = 1
+TYPE_STR_ZLIB = 2
+TYPE_JSON = 3
+TYPE_MSGPACK = 4
+
+RECORD_HEADER = struct.Struct("<IH")  # record length, number of fields
+FIELD_HEADER = struct.Struct("<HI")  # field id, payload length
+
+
+def encode_value(value: Any, compress: bool = True) -> bytes:
+    """Encode a single field value with its type byte"""
+    if value is None:
+        return bytes([TYPE_NONE])
+    if isinstance(value, str):
+        raw = value.encode("utf-8")
+        if compress and len(raw) >= COMPRESS_MIN_BYTES:
+            packed = zlib.compress(raw, 6)
+            if len(packed) < len(raw):
+                return bytes([TYPE_STR_ZLIB]) + packed
+        return bytes([TYPE_STR]) + raw
+    if MSGPACK_AVAILABLE:
+        return bytes([TYPE_MSGPACK]) + msgpack.packb(value, use_bin_type=True)
+    return bytes([TYPE_JSON]) + json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def decode_value(payload) -> Any:
+    """Decode a field payload produced by encode_value"""
+    kind, body = payload[0], payload[1:]
+    if kind == TYPE_NONE:
+        return None
+    if kind == TYPE_STR:
+        return bytes(body).decode("utf-8")
+    if kind == TYPE_STR_ZLIB:
+        return zlib.decompress(body).decode("utf-8")
+    if kind == TYPE_MSGPACK:
+        if not MSGPACK_AVAILABLE:
+            raise RuntimeError("This store contains msgpack values: pip install msgpack")
+        return msgpack.unpackb(bytes(body), raw=False)
+    if kind == TYPE_JSON:
+        return json.loads(bytes(body).decode("utf-8"))
+    raise ValueError(f"Unknown value type {kind}")
+
+
+class CorpusWriter:
+    """Appends records to a store and writes its index on close"""
+
+    def __init__(self, path: str, key_field: str = "url", compress: bool = True):
+        self.path = path
+        self.key_field = key_field
+        self.compress = compress
+        self.fields: List[str] = []
+        self._field_ids: Dict[str, int] = {}
+        self.offsets: List[int] = []
+        self.keys: Dict[str, List[int]] = {}
+        self._file = open(path, "wb")
+        self._file.write(MAGIC)
+
+    def _field_id(self, name: str) -> int:
+        field_id = self._field_ids.get(name)
+        if field_id is None:
+            field_id = len(self.fields)
+            self.fields.append(name)
+            self._field_ids[name] = field_id
+        return field_id
+
+    def append(self, record: Dict[str, Any]):
+        """Append one record (a flat dict; nested values are stored whole)"""
+        parts = []
+        for name, value in record.items():
+            payload = encode_value(value, self.compress)
+            parts.append(FIELD_HEADER.pack(self._field_id(name), len(payload)))
+            parts.append(payload)
+        body = b"".join(parts)
+
+        record_number = len(self.offsets)
+        self.offsets.append(self._file.tell())
+        self._file.write(RECORD_HEADER.pack(len(body), len(record)))
+        self._file.write(body)
+
+        key = record.get(self.key_field)
+        if key is not None:
+            self.keys.setdefault(str(key), []).append(record_number)
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._file.close()
+        index = {
+            "version": 1,
+            "key_field": self.key_field,
+            "fields": self.fields,
+            "count": len(self.offsets),
+            "offsets": self.offsets,
+            "keys": self.keys,
+        }
+        with open(self.path + INDEX_SUFFIX, "w", encoding="utf-8") as f:
+            json.dump(index, f, ensure_ascii=False, separators=(",", ":"))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class CorpusReader:
+    """Memory-mapped, random-access reader with column projection"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path + INDEX_SUFFIX, "r", encoding="utf-8") as f:
+            index = json.load(f)
+        self.key_field: str = index["key_field"]
+        self.fields: List[str] = index["fields"]
+        self.offsets: List[int] = index["offsets"]
+        self.keys: Dict[str, List[int]] = index["keys"]
+
+        self._file = open(path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        if self._map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a corpus store")
+        self._view = memoryview(self._map)
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.keys
+
+    def read_at(self, record_number: int, fields: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """Decode record number `record_number`, keeping only `fields` (all when None)"""
+        wanted = None
+        if fields is not None:
+            wanted = {self.fields.index(name) for name in fields if name in self.fields}
+
+        offset = self.offsets[record_number]
+        length, field_count = RECORD_HEADER.unpack_from(self._view, offset)
+        position = offset + RECORD_HEADER.size
+        record = {}
+        for _ in range(field_count):
+            field_id, size = FIELD_HEADER.unpack_from(self._view, position)
+            position += FIELD_HEADER.size
+            if wanted is None or field_id in wanted:
+                record[self.fields[field_id]] = decode_value(self._view[position:position + size])
+            position += size
+        return record
+
+    def get(self, key: str, fields: Optional[Iterable[str]] = None) -> Optional[Dict[str, Any]]:
+        """First record stored under `key`, or None"""
+        numbers = self.keys.get(key)
+        return self.read_at(numbers[0], fields) if numbers else None
+
+    def get_all(self, key: str, fields: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+        """Every record stored under `key` (datasets may repeat a URL across sections)"""
+        return [self.read_at(number, fields) for number in self.keys.get(key, [])]
+
+    def iter(self, fields: Optional[Iterable[str]] = None) -> Iterator[Dict[str, Any]]:
+        """Iterate over all records in write order"""
+        fields = list(fields) if fields is not None else None
+        for number in range(len(self.offsets)):
+            yield self.read_at(number, fields)
+
+    def close(self):
+        if hasattr(self, "_view"):
+            self._view.release()
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def write_corpus(records: Iterable[Dict[str, Any]], path: str, key_field: str = "url",
+                 compress: bool = True) -> int:
+    """Write `records` to a new store and return how many were written"""
+    with CorpusWriter(path, key_field=key_field, compress=compress) as writer:
+        for record in records:
+            writer.append(record)
+        return len(writer.offsets)
+
+
+def read_records(path: str, fields: Optional[Iterable[str]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Read records from a store, a JSON array or a JSONL file.
+
+    Lets pipeline stages switch to the store gradually: the same call works
+    on the legacy JSON files. `fields` projects columns in every format.
+    """
+    fields = list(fields) if fields is not None else None
+
+    if path.endswith(STORE_EXTENSION):
+        with CorpusReader(path) as reader:
+            yield from reader.iter(fields)
+        return
+
+    def project(record):
+        return record if fields is None else {name: record[name] for name in fields if name in record}
+
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    yield project(json.loads(line))
+        else:
+            for record in json.load(f):
+                yield project(record)
+
+
+def default_key_field(path: str) -> str:
+    """Chunk files are keyed by chunk id, crawl datasets by url"""
+    return "id" if path.endswith(".jsonl") else "url"
+
+
+def convert_to_store(source: str, destination: str, key_field: Optional[str] = None,
+                     fields: Optional[Iterable[str]] = None, compress: bool = True) -> int:
+    """Convert a JSON/JSONL dataset to a store"""
+    return write_corpus(read_records(source, fields), destination,
+                        key_field or default_key_field(source), compress)
+
+
+def export_from_store(source: str, destination: str, fields: Optional[Iterable[str]] = None) -> int:
+    """Convert a store back to JSON (array) or JSONL, depending on the destination extension"""
+    count = 0
+    with open(destination, "w", encoding="utf-8") as f:
+        if destination.endswith(".jsonl"):
+            for record in read_records(source, fields):
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                count += 1
+        else:
+            records = list(read_records(source, fields))
+            json.dump(records, f, ensure_ascii=False, indent=2)
+            count = len(records)
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert and inspect compact corpus stores")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    convert = subparsers.add_parser("convert", help="JSON/JSONL -> store")
+    convert.add_argument("source")
+    convert.add_argument("destination")
+    convert.add_argument("--key-field", help="Field used for random access (default: url, or id for .jsonl)")
+    convert.add_argument("--fields", help="Comma-separated fields to keep (default: all)")
+    convert.add_argument("--no-compress", action="store_true",
+                         help="Store long strings uncompressed (bigger file, faster full-text reads)")
+
+    export = subparsers.add_parser("export", help="store -> JSON/JSONL")
+    export.add_argument("source")
+    export.add_argument("destination")
+    export.add_argument("--fields", help="Comma-separated fields to export (default: all)")
+
+    info = subparsers.add_parser("info", help="Show store statistics")
+    info.add_argument("source")
+
+    args = parser.parse_args()
+    fields = args.fields.split(",") if getattr(args, "fields", None) else None
+
+    if args.command == "convert":
+        count = convert_to_store(args.source, args.destination, args.key_field, fields, not args.no_compress)
+        before = os.path.getsize(args.source)
+        after = os.path.getsize(args.destination) + os.path.getsize(args.destination + INDEX_SUFFIX)
+        print(f"✅ {count} records: {before / 1024:.0f} KiB -> {after / 1024:.0f} KiB ({args.destination})")
+    elif args.command == "export":
+        count = export_from_store(args.source, args.destination, fields)
+        print(f"✅ {count} records exported to {args.destination}")
+    else:
+        with CorpusReader(args.source) as reader:
+            print(f"📦 {args.source}")
+            print(f"   • Records: {len(reader)} | Unique keys ({reader.key_field}): {len(reader.keys)}")
+            print(f"   • Fields: {', '.join(reader.fields)}")
+            print(f"   • Size: {os.path.getsize(args.source) / 1024:.0f} KiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,14 @@ import random
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import csv
 
+try:
+    from lxml import etree
+    LXML_AVAILABLE = True
+except ImportError:
+    LXML_AVAILABLE = False
+
+FAST_EXTRACTOR_CHUNK_CHARS = 64 * 1024  # Characters fed to the streaming parser at a time
+
 # Configuration
 @dataclass
 class CrawlerConfig:
@@ -24,7 +32,8 @@ class CrawlerConfig:
     max_retries: int = 3
     retry_delay: float = 2.0
     max_workers: int = 3  # For concurrent requests
-    output_format: str = "json"  # json or csv
+    output_format: str = "json"  # json, csv or store (compact binary, see corpus_store.py)
+    extractor: str = "bs4"  # bs4 (BeautifulSoup tree) or fast (streaming lxml, single pass)
     log_level: str = "INFO"
     user_agents: List[str] = None
     
@@ -53,6 +62,143 @@ class ScrapedItem:
         if self.meta is None:
             self.meta = {}
 
+@dataclass
+class ExtractedPage:
+    """Result of a single streaming pass over a page"""
+    title: str
+    text: str
+    links: List[str]
+    structured_data: List[Any]
+
+
+class _StreamingExtractorTarget:
+    """lxml parser target that extracts text, title, links and JSON-LD in one pass.
+
+    No tree is built: unwanted subtrees (script, style, nav, footer, ...) are skipped
+    as they stream by, and the text of the main-content candidates is collected in
+    parallel so the first matching selector can be picked at the end.
+    """
+
+    SKIP_TAGS = {"script", "style", "noscript", "iframe", "nav", "footer"}
+    # Same priority as the BeautifulSoup path: main, article, .content, #content, .main-content
+    SELECTORS = [("tag", "main"), ("tag", "article"), ("class", "content"),
+                 ("id", "content"), ("class", "main-content")]
+
+    def __init__(self):
+        self.strings: List[str] = []
+        self.candidate_strings: List[List[str]] = [[] for _ in self.SELECTORS]
+        self.candidate_depth: List[Optional[int]] = [None] * len(self.SELECTORS)
+        self.candidate_found = [False] * len(self.SELECTORS)
+        self.links: List[str] = []
+        self.structured_data: List[Any] = []
+        self.title = ""
+        self._title_parts: Optional[List[str]] = None
+        self._json_ld_parts: Optional[List[str]] = None
+        self._buffer: List[str] = []
+        self._depth = 0
+        self._skip_depth: Optional[int] = None
+
+    def _matches(self, index: int, tag: str, attrib) -> bool:
+        kind, value = self.SELECTORS[index]
+        if kind == "tag":
+            return tag == value
+        if kind == "id":
+            return attrib.get("id") == value
+        return value in (attrib.get("class") or "").split()
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        text = "".join(self._buffer)
+        self._buffer = []
+        if self._skip_depth is not None:
+            return
+        stripped = text.strip()
+        if not stripped:
+            return
+        self.strings.append(stripped)
+        for index, depth in enumerate(self.candidate_depth):
+            if depth is not None:
+                self.candidate_strings[index].append(stripped)
+
+    def start(self, tag, attrib):
+        self._flush()
+        self._depth += 1
+        # Links are discovered from the whole document, including nav/footer menus
+        if tag == "a" and attrib.get("href"):
+            self.links.append(attrib["href"])
+        if self._skip_depth is not None:
+            return
+        if tag in self.SKIP_TAGS:
+            self._skip_depth = self._depth
+            if tag == "script" and (attrib.get("type") or "").lower() == "application/ld+json":
+                self._json_ld_parts = []
+            return
+        if tag == "title" and self._title_parts is None and not self.title:
+            self._title_parts = []
+        for index in range(len(self.SELECTORS)):
+            if not self.candidate_found[index] and self._matches(index, tag, attrib):
+                self.candidate_found[index] = True
+                self.candidate_depth[index] = self._depth
+
+    def end(self, tag):
+        if self._json_ld_parts is not None and self._skip_depth == self._depth:
+            try:
+                self.structured_data.append(json.loads("".join(self._json_ld_parts)))
+            except ValueError:
+                pass
+            self._json_ld_parts = None
+        self._flush()
+        if self._title_parts is not None and tag == "title":
+            self.title = "".join(self._title_parts)
+            self._title_parts = None
+        if self._skip_depth == self._depth:
+            self._skip_depth = None
+        for index, depth in enumerate(self.candidate_depth):
+            if depth == self._depth:
+                self.candidate_depth[index] = None
+        self._depth -= 1
+
+    def data(self, data):
+        if self._json_ld_parts is not None:
+            self._json_ld_parts.append(data)
+            return
+        if self._skip_depth is not None:
+            return
+        if self._title_parts is not None:
+            self._title_parts.append(data)
+        self._buffer.append(data)
+
+    def comment(self, text):
+        self._flush()
+
+    def close(self) -> ExtractedPage:
+        self._flush()
+        main_content = ""
+        for index, found in enumerate(self.candidate_found):
+            if found:
+                main_content = " ".join(self.candidate_strings[index])
+                break
+        if not main_content:
+            main_content = " ".join(self.strings)
+        lines = [line.strip() for line in main_content.split('\n') if line.strip()]
+        return ExtractedPage(
+            title=self.title,
+            text='\n'.join(lines),
+            links=self.links,
+            structured_data=self.structured_data,
+        )
+
+
+def extract_page_fast(html: str) -> ExtractedPage:
+    """Extract title, clean text, links and JSON-LD from HTML in a single streaming pass"""
+    parser = etree.HTMLParser(target=_StreamingExtractorTarget(), remove_comments=False)
+    # Feed in chunks so the parser never holds a second full copy of the document
+    for start in range(0, len(html), FAST_EXTRACTOR_CHUNK_CHARS):
+        parser.feed(html[start:start + FAST_EXTRACTOR_CHUNK_CHARS])
+    return parser.close()
+
+
 class ProgressTracker:
     """Class to track and display crawling progress"""
     
@@ -263,8 +409,15 @@ class DuocCrawler:
         """Check if link is internal to the base domain"""
         return self.get_domain(base_url) == self.get_domain(link)
         
+    def use_fast_extractor(self) -> bool:
+        """Whether the streaming lxml extractor is configured and available"""
+        return self.config.extractor == "fast" and LXML_AVAILABLE
+
     def extract_text_from_html(self, html: str) -> str:
         """Extract clean text from HTML"""
+        if self.use_fast_extractor():
+            return extract_page_fast(html).text
+
         soup = BeautifulSoup(html, "html.parser")
         
         # Remove unwanted tags
@@ -292,9 +445,12 @@ class DuocCrawler:
         
     def extract_links(self, soup: BeautifulSoup, base_url: str) -> List[str]:
         """Extract internal links from page"""
+        return self.filter_links([a["href"] for a in soup.find_all("a", href=True)], base_url)
+
+    def filter_links(self, hrefs: List[str], base_url: str) -> List[str]:
+        """Resolve hrefs and keep unvisited internal links"""
         links = []
-        for a in soup.find_all("a", href=True):
-            href = a["href"]
+        for href in hrefs:
             full_url = urljoin(base_url, href)
             
             # Clean URL (remove fragments, etc.)
@@ -313,9 +469,6 @@ class DuocCrawler:
             if not response:
                 return None
                 
-            soup = BeautifulSoup(response.text, "html.parser")
-            text = self.extract_text_from_html(response.text)
-            
             # Extract metadata
             meta = {
                 'content_length': len(response.content),
@@ -323,16 +476,28 @@ class DuocCrawler:
                 'charset': response.encoding or 'unknown',
             }
             
-            # Extract structured data if available
-            for script in soup.find_all('script', type='application/ld+json'):
-                try:
-                    meta['structured_data'] = json.loads(script.string)
-                except:
-                    pass
+            if self.use_fast_extractor():
+                # Single streaming pass: title, text and structured data together
+                page = extract_page_fast(response.text)
+                title = page.title
+                text = page.text
+                if page.structured_data:
+                    meta['structured_data'] = page.structured_data[-1]
+            else:
+                soup = BeautifulSoup(response.text, "html.parser")
+                text = self.extract_text_from_html(response.text)
+                title = soup.title.string if soup.title else ""
+                
+                # Extract structured data if available
+                for script in soup.find_all('script', type='application/ld+json'):
+                    try:
+                        meta['structured_data'] = json.loads(script.string)
+                    except:
+                        pass
                     
             return ScrapedItem(
                 url=url,
-                title=soup.title.string if soup.title else "",
+                title=title,
                 text=text,
                 section=section,
                 depth=depth,
@@ -371,8 +536,11 @@ class DuocCrawler:
                 try:
                     response = self.make_request(url)
                     if response and response.status_code == 200:
-                        soup = BeautifulSoup(response.text, "html.parser")
-                        links = self.extract_links(soup, base_url)
+                        if self.use_fast_extractor():
+                            links = self.filter_links(extract_page_fast(response.text).links, base_url)
+                        else:
+                            soup = BeautifulSoup(response.text, "html.parser")
+                            links = self.extract_links(soup, base_url)
                         
                         for link in links:
                             if link not in section_urls:
@@ -455,6 +623,11 @@ class DuocCrawler:
                     writer.writeheader()
                     for item in items:
                         writer.writerow(asdict(item))
+
+        elif self.config.output_format.lower() == 'store':
+            from corpus_store import STORE_EXTENSION, write_corpus
+            output_path = os.path.join(self.OUTPUT_DIR, f"{section_name}{STORE_EXTENSION}")
+            write_corpus((asdict(item) for item in items), output_path, key_field="url")
                         
         self.logger.info(f"Saved {len(items)} items to {output_path}")
         
@@ -484,6 +657,13 @@ class DuocCrawler:
             self.logger.error(f"Fatal error during crawling: {str(e)}")
             return all_items
 
+# URLs to crawl
+URLS_BASE = [
+    "https://www.duoc.cl/admision/",
+    "https://www.duoc.cl/carreras",
+    "https://www.duoc.cl/oferta-academica",
+]
+
 def main():
     """Main function to run the crawler"""
     # Configuration
@@ -496,13 +676,6 @@ def main():
         log_level="INFO"
     )
     
-    # URLs to crawl
-    URLS_BASE = [
-        "https://www.duoc.cl/admision/",
-        "https://www.duoc.cl/carreras",
-        "https://www.duoc.cl/oferta-academica",
-    ]
-    
     # Create and run crawler
     crawler = DuocCrawler(config)
     items = crawler.run(URLS_BASE)
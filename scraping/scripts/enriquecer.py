@@ -9,8 +9,9 @@ load_dotenv()
 API_KEY = "xD"
 API_URL = "xD"
 MODELO = "glm-4.6"
-INPUT_FILE = 'chunks_para_ia.jsonl'
-OUTPUT_FILE = 'dataset_final_scraper.jsonl'
+DATASETS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'datasets')
+INPUT_FILE = os.path.join(DATASETS_DIR, 'chunks_para_ia.jsonl')
+OUTPUT_FILE = os.path.join(DATASETS_DIR, 'dataset_final_scraper.jsonl')
 # ---------------------
 
 SYSTEM_PROMPT = """
@@ -57,15 +58,24 @@ def llamar_llm(chunk_text):
         print(f"Error general en llamar_llm: {e}")
         return None
 
-def enriquecer_dataset():
-    print(f"Iniciando enriquecimiento con LLM desde '{INPUT_FILE}'...")
+def enriquecer_dataset(input_path=INPUT_FILE, output_path=OUTPUT_FILE):
+    """
+    Enriquece cada chunk con el LLM. Los chunks que fallan se omiten del archivo
+    de salida y se cuentan en 'errores'.
+
+    Returns:
+        {'leidos', 'escritos', 'errores'}, o None si no existe el archivo de entrada
+    """
+    print(f"Iniciando enriquecimiento con LLM desde '{input_path}'...")
     
-    if not os.path.exists(INPUT_FILE):
-        print(f"Error: No se encontró el archivo '{INPUT_FILE}'. Ejecuta 'procesar_chunks.py' primero.")
-        return
+    if not os.path.exists(input_path):
+        print(f"Error: No se encontró el archivo '{input_path}'. Ejecuta 'procesar_chunks.py' primero.")
+        return None
+
+    leidos = escritos = errores = 0
 
-    with open(OUTPUT_FILE, 'w', encoding='utf-8') as f_out:
-        with open(INPUT_FILE, 'r', encoding='utf-8') as f_in:
+    with open(output_path, 'w', encoding='utf-8') as f_out:
+        with open(input_path, 'r', encoding='utf-8') as f_in:
             for i, line in enumerate(f_in):
                 try:
                     chunk_data = json.loads(line)
@@ -73,6 +83,7 @@ def enriquecer_dataset():
                     
                     if not answer_text:
                         continue
+                    leidos += 1
                     
                     print(f"Procesando chunk {i+1} (ID: {chunk_data.get('id')})...")
                     datos_ia = llamar_llm(answer_text)
@@ -89,14 +100,19 @@ def enriquecer_dataset():
                             "keywords": datos_ia.get("keywords", [])
                         }
                         f_out.write(json.dumps(documento_final, ensure_ascii=False) + '\n')
+                        escritos += 1
                     else:
+                        errores += 1
                         print(f"Skipping chunk {i+1} due to enrichment error.")
 
                 except Exception as e:
+                    errores += 1
                     print(f"Error procesando la línea {i+1}: {e}")
 
     print(f"\n--- ¡Enriquecimiento completado! ---")
-    print(f"Dataset final guardado en: '{OUTPUT_FILE}'")
+    print(f"Chunks enriquecidos: {escritos} de {leidos} ({errores} con error)")
+    print(f"Dataset final guardado en: '{output_path}'")
+    return {'leidos': leidos, 'escritos': escritos, 'errores': errores}
 
 if __name__ == "__main__":
     enriquecer_dataset()
\ No newline at end of file
@@ -2,8 +2,9 @@ import json
 import os
 
 # --- Configuración ---
-INPUT_FILE = 'datasets\combined_dataset.json'
-OUTPUT_FILE = 'dataset_filtrado.json'
+DATASETS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'datasets')
+INPUT_FILE = os.path.join(DATASETS_DIR, 'combined_dataset.json')
+OUTPUT_FILE = os.path.join(DATASETS_DIR, 'dataset_filtrado.json')
 # Lista de campos a mantener en el nuevo archivo
 FIELDS_TO_KEEP = ['url', 'title', 'text']
 # ---------------------
@@ -12,12 +13,15 @@ def copy_and_select_fields(input_path, output_path):
     """
     Lee el archivo JSON de entrada, selecciona solo los campos clave (url, title, text)
     y guarda el resultado en el archivo de salida.
+
+    Returns:
+        {'leidos', 'escritos', 'errores'}, o None si la entrada falta o no es válida
     """
     print(f"Iniciando la copia y selección de campos clave de '{input_path}'...")
 
     if not os.path.exists(input_path):
         print(f"Error: No se encontró el archivo '{input_path}'. Asegúrate de que está en la misma carpeta.")
-        return
+        return None
 
     try:
         with open(input_path, 'r', encoding='utf-8') as f:
@@ -37,12 +41,14 @@ def copy_and_select_fields(input_path, output_path):
         print("\n--- ¡Copia y selección de campos completada! ---")
         print(f"Items totales leídos: {total_items}")
         print(f"Campos mantenidos: {FIELDS_TO_KEEP}")
-        print(f"Archivo '{OUTPUT_FILE}' creado con éxito.")
+        print(f"Archivo '{output_path}' creado con éxito.")
+        return {'leidos': total_items, 'escritos': len(selected_data), 'errores': 0}
 
     except json.JSONDecodeError:
         print(f"Error: El archivo '{input_path}' no es un JSON válido.")
     except Exception as e:
         print(f"Ocurrió un error inesperado: {e}")
+    return None
 
 if __name__ == "__main__":
     copy_and_select_fields(INPUT_FILE, OUTPUT_FILE)
\ No newline at end of file
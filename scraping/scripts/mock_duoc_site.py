@@ -0,0 +1,293 @@
+"""
+Local HTTP fixture server that serves a synthetic site shaped like duoc.cl.
+
+Pages are generated from the items captured in datasets/combined_dataset.json:
+same paths, titles and main text, wrapped in the header/nav/footer/script
+boilerplate that the real site ships. Latency, error rate, link fan-out and
+page size are configurable so crawler throughput can be measured offline.
+"""
+import argparse
+import html
+import json
+import os
+import random
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DATASET = os.path.join(os.path.dirname(BASE_DIR), "datasets", "combined_dataset.json")
+SECTION_ROOTS = ["/admision/", "/carreras/", "/oferta-academica/"]
+
+NAV_ITEMS = [
+    ("Admisión", "/admision/"), ("Carreras", "/carreras/"), ("Oferta Académica", "/oferta-academica/"),
+    ("Alumnos", "/alumnos/"), ("Sedes", "/sedes/"), ("Biblioteca", "/biblioteca/"),
+    ("Educación Continua", "/educacion-continua/"), ("Contacto", "/contacto/"),
+]
+CTA_LABELS = ["VER MÁS", "MATRICÚLATE", "MÁS INFORMACIÓN", "CONOCE MÁS", "Postula Aquí", "DESCUBRE MÁS"]
+
+
+@dataclass
+class MockSiteConfig:
+    """Configuration for the mock duoc.cl site"""
+    dataset_path: str = DEFAULT_DATASET
+    host: str = "127.0.0.1"
+    port: int = 0  # 0 = pick a free port
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0  # Fraction of requests answered with a 5xx
+    fanout: int = 8  # Internal links per page (besides the nav menu)
+    size_scale: float = 0.1  # Fraction of the original content_length to pad pages to
+    copies: int = 1  # Replicate the captured pages N times to simulate a larger site
+    seed: int = 42
+
+
+@dataclass
+class MockPage:
+    """A single synthetic page"""
+    path: str
+    title: str
+    text: str
+    section: str
+    target_bytes: int
+    links: List[str] = None
+
+
+class MockDuocSite:
+    """Builds and renders the synthetic site from the captured dataset"""
+
+    def __init__(self, config: MockSiteConfig = None):
+        self.config = config or MockSiteConfig()
+        self.pages: Dict[str, MockPage] = {}
+        self._rendered: Dict[str, bytes] = {}
+        self._random = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+        self.requests_served = 0
+        self.bytes_served = 0
+        self.errors_served = 0
+        self.load_pages()
+
+    @staticmethod
+    def normalize_path(path: str) -> str:
+        """Normalize a URL path so '/carreras' and '/carreras/' map to the same page"""
+        path = urlparse(path).path or "/"
+        return path if path.endswith("/") else path + "/"
+
+    def load_pages(self):
+        """Create pages from combined_dataset.json (deduplicated by URL)"""
+        items = []
+        if os.path.exists(self.config.dataset_path):
+            with open(self.config.dataset_path, "r", encoding="utf-8") as f:
+                items = json.load(f)
+
+        unique = {}
+        for item in items:
+            path = self.normalize_path(item.get("url", "/"))
+            if path not in unique:
+                unique[path] = item
+
+        for copy in range(max(1, self.config.copies)):
+            prefix = "" if copy == 0 else f"/espejo-{copy}"
+            for path, item in unique.items():
+                meta = item.get("meta") or {}
+                target = int(meta.get("content_length", 0) * self.config.size_scale)
+                full_path = self.normalize_path(prefix + path)
+                self.pages[full_path] = MockPage(
+                    path=full_path,
+                    title=item.get("title") or "Duoc UC",
+                    text=item.get("text") or "",
+                    section=item.get("section") or path.strip("/").split("/")[0],
+                    target_bytes=target,
+                )
+
+        # Section roots are the crawler entry points: make sure they exist
+        for root in SECTION_ROOTS + [path for _, path in NAV_ITEMS]:
+            if root not in self.pages:
+                section = root.strip("/")
+                self.pages[root] = MockPage(
+                    path=root,
+                    title=f"{section.replace('-', ' ').title()} – Duoc UC",
+                    text=f"Información de {section.replace('-', ' ')} en Duoc UC.",
+                    section=section,
+                    target_bytes=0,
+                )
+
+        self.assign_links()
+
+    def assign_links(self):
+        """Give every page `fanout` deterministic internal links, preferring its own section"""
+        paths = sorted(self.pages)
+        by_section: Dict[str, List[str]] = {}
+        for path in paths:
+            by_section.setdefault(self.pages[path].section, []).append(path)
+
+        for path in paths:
+            page = self.pages[path]
+            rng = random.Random(f"{self.config.seed}:{path}")
+            same_section = [p for p in by_section.get(page.section, []) if p != path]
+            others = [p for p in paths if p != path]
+            links = rng.sample(same_section, min(len(same_section), (self.config.fanout + 1) // 2))
+            remaining = [p for p in others if p not in links]
+            links += rng.sample(remaining, min(len(remaining), self.config.fanout - len(links)))
+            page.links = links
+
+        # Section roots link to every page of their section so the crawl covers the site
+        for root in SECTION_ROOTS:
+            section = root.strip("/")
+            members = [p for p in by_section.get(section, []) if p != root]
+            self.pages[root].links = sorted(set((self.pages[root].links or []) + members))
+
+    def render(self, path: str) -> Optional[bytes]:
+        """Render a page to HTML bytes (cached after the first render)"""
+        cached = self._rendered.get(path)
+        if cached is not None:
+            return cached
+        page = self.pages.get(path)
+        if page is None:
+            return None
+
+        escape = html.escape
+        sentences = [s.strip() for s in page.text.replace("\n", " ").split(". ") if s.strip()]
+        paragraphs = [". ".join(sentences[i:i + 3]) for i in range(0, len(sentences), 3)]
+        nav = "".join(f'<li><a href="{href}">{escape(label)}</a></li>' for label, href in NAV_ITEMS)
+        links = "".join(
+            f'<li><a href="{href}?utm_source=mock#top">{escape(self.pages[href].title)}</a></li>'
+            for href in page.links or []
+        )
+        cta = "".join(f'<a class="btn" href="/admision/">{label}</a>' for label in CTA_LABELS)
+        structured = json.dumps({"@context": "https://schema.org", "@type": "WebPage",
+                                 "name": page.title, "url": f"https://www.duoc.cl{page.path}"},
+                                ensure_ascii=False)
+
+        parts = [
+            "<!DOCTYPE html><html lang=\"es\"><head><meta charset=\"UTF-8\">",
+            f"<title>{escape(page.title)}</title>",
+            "<style>body{font-family:sans-serif}.btn{padding:4px}.menu li{display:inline}</style>",
+            f'<script type="application/ld+json">{structured}</script>',
+            "<script>window.dataLayer=window.dataLayer||[];function gtag(){dataLayer.push(arguments);}</script>",
+            "</head><body>",
+            f'<header><nav class="menu"><ul>{nav}</ul></nav></header>',
+            '<div class="content"><main>',
+            f"<h1>{escape(page.title)}</h1>",
+            "".join(f"<p>{escape(p)}</p>" for p in paragraphs),
+            f'<section class="related"><ul>{links}</ul></section>',
+            f'<div class="cta">{cta}</div>',
+            "</main></div>",
+            f"<footer><nav><ul>{nav}</ul></nav><p>Duoc UC – Todos los derechos reservados</p></footer>",
+        ]
+        body = "".join(parts)
+
+        # Pad with inline scripts (like the analytics/theme bundles of the real site)
+        padding_needed = page.target_bytes - len(body.encode("utf-8"))
+        filler = "var _duocTheme=" + json.dumps({"k": "x" * 200}) + ";"
+        chunks = []
+        while padding_needed > 0:
+            chunk = f"<script>{filler * 20}</script>"
+            chunks.append(chunk)
+            padding_needed -= len(chunk)
+        document = (body + "".join(chunks) + "</body></html>").encode("utf-8")
+
+        with self._lock:
+            self._rendered[path] = document
+        return document
+
+    def should_fail(self) -> bool:
+        with self._lock:
+            return self._random.random() < self.config.error_rate
+
+    def delay_seconds(self) -> float:
+        with self._lock:
+            jitter = self._random.uniform(-self.config.jitter_ms, self.config.jitter_ms)
+        return max(0.0, self.config.latency_ms + jitter) / 1000.0
+
+    def record(self, size: int, error: bool):
+        with self._lock:
+            self.requests_served += 1
+            self.bytes_served += size
+            if error:
+                self.errors_served += 1
+
+
+def make_handler(site: MockDuocSite):
+    """Build a request handler class bound to `site`"""
+
+    class MockDuocHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            delay = site.delay_seconds()
+            if delay:
+                time.sleep(delay)
+
+            if site.should_fail():
+                self.send_body(503, b"Service Unavailable", "text/plain")
+                site.record(0, True)
+                return
+
+            document = site.render(MockDuocSite.normalize_path(self.path))
+            if document is None:
+                self.send_body(404, b"Not Found", "text/plain")
+                site.record(0, True)
+                return
+
+            self.send_body(200, document, "text/html; charset=UTF-8")
+            site.record(len(document), False)
+
+        def send_body(self, status: int, body: bytes, content_type: str):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Keep benchmark output clean
+
+    return MockDuocHandler
+
+
+def start_mock_server(config: MockSiteConfig = None) -> Tuple[ThreadingHTTPServer, MockDuocSite, str]:
+    """
+    Start the mock site in a background thread.
+
+    Returns:
+        (server, site, base_url) — call server.shutdown() when finished
+    """
+    site = MockDuocSite(config)
+    server = ThreadingHTTPServer((site.config.host, site.config.port), make_handler(site))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server.server_address[:2]
+    return server, site, f"http://{host}:{port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a synthetic duoc.cl site for offline crawler tests")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--fanout", type=int, default=8)
+    parser.add_argument("--size-scale", type=float, default=0.1)
+    parser.add_argument("--copies", type=int, default=1)
+    args = parser.parse_args()
+
+    config = MockSiteConfig(
+        port=args.port, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate, fanout=args.fanout, size_scale=args.size_scale, copies=args.copies,
+    )
+    server, site, base_url = start_mock_server(config)
+    print(f"🌐 Mock duoc.cl serving {len(site.pages)} pages at {base_url} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
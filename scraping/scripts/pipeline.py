@@ -0,0 +1,426 @@
+"""
+Pipeline runner for the ingestion scripts.
+
+Declares every stage with its inputs and outputs:
+
+    crawl -> filtrar -> chunks -> enriquecer -> markdown
+                                            |-> kb_prep
+                                            \\-> semantic_index
+
+A stage is skipped when the fingerprint of its inputs, its code and its
+outputs matches the last successful run (state in datasets/.pipeline_state.json).
+Stages whose dependencies are done run in parallel. Outputs are written to a
+temporary directory and only replace the previous artifacts when the stage
+succeeds, so a failed enrichment never truncates the existing dataset. A stage
+whose script dropped records (LLM or parse errors) counts as failed.
+
+Usage:
+    python pipeline.py                  # bring every artifact up to date
+    python pipeline.py chunks           # only what `chunks` needs
+    python pipeline.py --dry-run        # show what would run
+    python pipeline.py --force chunks   # rerun a stage (and whatever changes downstream)
+    python pipeline.py crawl            # re-crawl duoc.cl (never automatic once the dataset exists)
+    python pipeline.py --mark enriquecer  # adopt the committed enriched dataset without calling the LLM
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+SCRAPING_DIR = os.path.dirname(SCRIPTS_DIR)
+REPO_ROOT = os.path.dirname(SCRAPING_DIR)
+DATASETS_DIR = os.path.join(SCRAPING_DIR, "datasets")
+STATE_PATH = os.path.join(DATASETS_DIR, ".pipeline_state.json")
+SEMANTIC_INDEX_DIR = os.path.join(REPO_ROOT, "lambda", "data")
+
+if SCRIPTS_DIR not in sys.path:
+    sys.path.insert(0, SCRIPTS_DIR)
+
+
+def dataset_path(name: str) -> str:
+    return os.path.join(DATASETS_DIR, name)
+
+
+def script_path(name: str) -> str:
+    return os.path.join(SCRIPTS_DIR, name)
+
+
+# --- Stage implementations: each receives input paths and (temporary) output paths ---
+
+def require_complete(step: str, stats: Optional[Dict[str, int]]):
+    """
+    Fail the stage when the wrapped script reports a failure or dropped records.
+    The scripts log and continue on errors (useful when run by hand), but here a
+    partial output would replace the good artifact and be recorded as up to date.
+    """
+    if stats is None:
+        raise RuntimeError(f"{step} failed (see the log above)")
+    if stats["errores"]:
+        raise RuntimeError(f"{step}: {stats['errores']} of {stats['leidos']} records failed "
+                           f"({stats['escritos']} written); keeping the previous artifact")
+
+
+def run_crawl(inputs: List[str], outputs: List[str]):
+    from duoc_crawler import URLS_BASE, CrawlerConfig, DuocCrawler
+
+    crawler = DuocCrawler(CrawlerConfig())
+    crawler.OUTPUT_DIR = os.path.dirname(outputs[0])
+    crawler.run(URLS_BASE)
+
+
+def run_filtrar(inputs: List[str], outputs: List[str]):
+    from filtrar import copy_and_select_fields
+
+    require_complete("filtrar", copy_and_select_fields(inputs[0], outputs[0]))
+
+
+def run_chunks(inputs: List[str], outputs: List[str]):
+    from procesar_chunks import procesar_y_chunkear
+
+    require_complete("procesar_y_chunkear", procesar_y_chunkear(inputs[0], outputs[0]))
+
+
+def run_enriquecer(inputs: List[str], outputs: List[str]):
+    from enriquecer import enriquecer_dataset
+
+    require_complete("enriquecer_dataset", enriquecer_dataset(inputs[0], outputs[0]))
+
+
+def run_markdown(inputs: List[str], outputs: List[str]):
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    from convert_to_md import convert_to_markdown
+
+    convert_to_markdown(inputs[0], outputs[0])
+
+
+def run_kb_prep(inputs: List[str], outputs: List[str]):
+    from corpus_store import convert_to_store
+
+    convert_to_store(inputs[0], outputs[0], key_field="id")
+
+
+def run_semantic_index(inputs: List[str], outputs: List[str]):
+    scripts_dir = os.path.join(REPO_ROOT, "scripts")
+    if scripts_dir not in sys.path:
+        sys.path.insert(0, scripts_dir)
+    from build_semantic_index import build
+
+    os.makedirs(SEMANTIC_INDEX_DIR, exist_ok=True)
+    build(os.path.splitext(outputs[0])[0], faq_path=inputs[1], corpus_path=inputs[0])
+
+
+@dataclass
+class Stage:
+    """A pipeline step and the artifacts it reads and writes"""
+    name: str
+    func: Callable[[List[str], List[str]], None]
+    inputs: List[str]
+    outputs: List[str]
+    code: List[str] = field(default_factory=list)  # Source files whose changes invalidate the stage
+    description: str = ""
+    manual: bool = False  # Only runs when its outputs are missing or it is targeted/forced
+
+
+STAGES: List[Stage] = [
+    Stage("crawl", run_crawl, [], [dataset_path("combined_dataset.json")],
+          [script_path("duoc_crawler.py")], "Crawl duoc.cl", manual=True),
+    Stage("filtrar", run_filtrar, [dataset_path("combined_dataset.json")], [dataset_path("dataset_filtrado.json")],
+          [script_path("filtrar.py")], "Keep url/title/text"),
+    Stage("chunks", run_chunks, [dataset_path("dataset_filtrado.json")], [dataset_path("chunks_para_ia.jsonl")],
+          [script_path("procesar_chunks.py"), script_path("corpus_store.py")], "Clean and chunk pages"),
+    Stage("enriquecer", run_enriquecer, [dataset_path("chunks_para_ia.jsonl")],
+          [dataset_path("dataset_final_scraper.jsonl")], [script_path("enriquecer.py")], "LLM enrichment"),
+    Stage("markdown", run_markdown, [dataset_path("dataset_final_scraper.jsonl")],
+          [dataset_path("dataset_final_scraper.md")], [os.path.join(REPO_ROOT, "convert_to_md.py")],
+          "Markdown export"),
+    Stage("kb_prep", run_kb_prep, [dataset_path("dataset_final_scraper.jsonl")],
+          [dataset_path("dataset_final_scraper.dcs"), dataset_path("dataset_final_scraper.dcs.idx")],
+          [script_path("corpus_store.py")], "Compact store for KB upload"),
+    Stage("semantic_index", run_semantic_index,
+          [dataset_path("dataset_final_scraper.jsonl"), os.path.join(REPO_ROOT, "dataset", "dataset_enriquecido.jsonl")],
+          [os.path.join(SEMANTIC_INDEX_DIR, "semantic_index.npy"), os.path.join(SEMANTIC_INDEX_DIR, "semantic_index.json")],
+          [os.path.join(REPO_ROOT, "scripts", "build_semantic_index.py"),
+           os.path.join(REPO_ROOT, "lambda", "semantic_index.py"),
+           os.path.join(REPO_ROOT, "convert_to_md.py")],
+          "Embedding matrix for the Lambda"),
+]
+
+
+class FileHasher:
+    """sha256 of files, cached by (size, mtime) so unchanged artifacts are not re-read"""
+
+    def __init__(self, cache: Optional[Dict[str, list]] = None, lock: Optional[threading.RLock] = None):
+        self.cache = cache if cache is not None else {}
+        self._lock = lock or threading.RLock()
+
+    def digest(self, path: str) -> Optional[str]:
+        if not os.path.exists(path):
+            return None
+        stat = os.stat(path)
+        key = os.path.relpath(path, REPO_ROOT)
+        with self._lock:
+            cached = self.cache.get(key)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha.update(block)
+        digest = sha.hexdigest()
+        with self._lock:
+            self.cache[key] = [stat.st_size, stat.st_mtime_ns, digest]
+        return digest
+
+
+class PipelineRunner:
+    """Runs stages in dependency order, skipping the ones whose artifacts are current"""
+
+    def __init__(self, stages: List[Stage] = None, state_path: str = STATE_PATH, jobs: int = 4):
+        self.stages = {stage.name: stage for stage in (stages or STAGES)}
+        self.state_path = state_path
+        self.jobs = jobs
+        self.state = self.load_state()
+        self._lock = threading.RLock()  # Shared with the hasher: both mutate self.state
+        self.hasher = FileHasher(self.state.setdefault("hashes", {}), self._lock)
+
+        producers = {output: stage.name for stage in self.stages.values() for output in stage.outputs}
+        self.dependencies: Dict[str, Set[str]] = {
+            stage.name: {producers[path] for path in stage.inputs if path in producers}
+            for stage in self.stages.values()
+        }
+
+    def load_state(self) -> Dict:
+        if os.path.exists(self.state_path):
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        return {"stages": {}, "hashes": {}}
+
+    def save_state(self):
+        with self._lock:
+            tmp_path = self.state_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self.state, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.state_path)
+
+    def plan(self, targets: Optional[List[str]] = None) -> List[str]:
+        """Stages needed for `targets` (all when empty), in topological order"""
+        for name in targets or []:
+            if name not in self.stages:
+                raise ValueError(f"Unknown stage '{name}' (available: {', '.join(self.stages)})")
+        wanted: Set[str] = set()
+        pending = list(targets or self.stages)
+        while pending:
+            name = pending.pop()
+            if name not in wanted:
+                wanted.add(name)
+                pending.extend(self.dependencies[name])
+
+        order: List[str] = []
+        visiting: Set[str] = set()
+
+        def visit(name: str):
+            if name in order:
+                return
+            if name in visiting:
+                raise ValueError(f"Dependency cycle at stage '{name}'")
+            visiting.add(name)
+            for dependency in sorted(self.dependencies[name]):
+                visit(dependency)
+            visiting.discard(name)
+            order.append(name)
+
+        for name in sorted(wanted):
+            visit(name)
+        return order
+
+    def fingerprint(self, stage: Stage) -> str:
+        """Hash of the stage definition, its code and the current content of its inputs"""
+        sha = hashlib.sha256()
+        sha.update(json.dumps({
+            "name": stage.name,
+            "inputs": [os.path.relpath(path, REPO_ROOT) for path in stage.inputs],
+            "outputs": [os.path.relpath(path, REPO_ROOT) for path in stage.outputs],
+        }).encode("utf-8"))
+        for path in stage.code + stage.inputs:
+            sha.update((self.hasher.digest(path) or "missing").encode("utf-8"))
+        return sha.hexdigest()
+
+    def check(self, stage: Stage, forced: bool = False, targeted: bool = False) -> Tuple[bool, str]:
+        """Return (needs_run, reason)"""
+        if forced:
+            return True, "forced"
+        missing = [path for path in stage.outputs if not os.path.exists(path)]
+        if missing:
+            return True, f"missing {os.path.basename(missing[0])}"
+        if stage.manual:
+            return (True, "targeted") if targeted else (False, "manual stage, outputs present")
+
+        missing_inputs = [path for path in stage.inputs if not os.path.exists(path)]
+        if missing_inputs:
+            return True, f"missing input {os.path.basename(missing_inputs[0])}"
+
+        record = self.state["stages"].get(stage.name)
+        if not record:
+            return True, "no previous run recorded"
+        if record.get("fingerprint") != self.fingerprint(stage):
+            return True, "inputs or code changed"
+        for path in stage.outputs:
+            if record.get("outputs", {}).get(os.path.basename(path)) != self.hasher.digest(path):
+                return True, f"{os.path.basename(path)} modified outside the pipeline"
+        return False, "up to date"
+
+    def record(self, stage: Stage, seconds: float):
+        with self._lock:
+            self.state["stages"][stage.name] = {
+                "fingerprint": self.fingerprint(stage),
+                "outputs": {os.path.basename(path): self.hasher.digest(path) for path in stage.outputs},
+                "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "seconds": round(seconds, 2),
+            }
+        self.save_state()
+
+    def mark(self, names: List[str]) -> List[str]:
+        """Adopt the existing outputs of `names` as current without running them"""
+        marked = []
+        for name in self.plan(names):
+            stage = self.stages[name]
+            if name in names and all(os.path.exists(path) for path in stage.outputs):
+                self.record(stage, 0.0)
+                marked.append(name)
+        return marked
+
+    def execute(self, stage: Stage) -> float:
+        """Run one stage into a temporary directory and publish its outputs atomically"""
+        start = time.time()
+        work_dir = tempfile.mkdtemp(prefix=f".pipeline-{stage.name}-", dir=DATASETS_DIR)
+        try:
+            temp_outputs = [os.path.join(work_dir, os.path.basename(path)) for path in stage.outputs]
+            stage.func(stage.inputs, temp_outputs)
+
+            empty = [path for path in temp_outputs if not os.path.exists(path) or os.path.getsize(path) == 0]
+            if empty:
+                raise RuntimeError(f"stage produced no {os.path.basename(empty[0])}")
+            for temp_path, final_path in zip(temp_outputs, stage.outputs):
+                os.replace(temp_path, final_path)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        seconds = time.time() - start
+        self.record(stage, seconds)
+        return seconds
+
+    def dry_run(self, targets: Optional[List[str]] = None, force: Optional[Set[str]] = None) -> Dict[str, str]:
+        """Report which stages would run (a stage is stale if it or any dependency is stale)"""
+        force = force or set()
+        stale: Set[str] = set()
+        report = {}
+        for name in self.plan(targets):
+            stage = self.stages[name]
+            needs_run, reason = self.check(stage, name in force, name in (targets or []))
+            upstream = sorted(self.dependencies[name] & stale)
+            if not needs_run and upstream and not stage.manual:
+                needs_run, reason = True, f"after {', '.join(upstream)} (if its outputs change)"
+            if needs_run:
+                stale.add(name)
+            report[name] = ("run: " if needs_run else "skip: ") + reason
+        return report
+
+    def run(self, targets: Optional[List[str]] = None, force: Optional[Set[str]] = None) -> Dict[str, str]:
+        """Bring the targets up to date; returns stage -> status (ran/skipped/failed/blocked)"""
+        force = force or set()
+        order = self.plan(targets)
+        status: Dict[str, str] = {}
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            while len(status) < len(order):
+                for name in order:
+                    if name in status or name in running.values():
+                        continue
+                    dependencies = self.dependencies[name] & set(order)
+                    if any(status.get(dep) in ("failed", "blocked") for dep in dependencies):
+                        status[name] = "blocked"
+                        print(f"⛔ {name}: skipped, a dependency failed")
+                        continue
+                    if not all(dep in status for dep in dependencies):
+                        continue
+
+                    stage = self.stages[name]
+                    needs_run, reason = self.check(stage, name in force, name in (targets or []))
+                    if not needs_run:
+                        status[name] = "skipped"
+                        print(f"⏭️  {name}: {reason}")
+                        continue
+                    print(f"🚀 {name}: {stage.description} ({reason})")
+                    running[executor.submit(self.execute, stage)] = name
+
+                if not running:
+                    continue
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        seconds = future.result()
+                        status[name] = "ran"
+                        print(f"✅ {name}: done in {seconds:.1f}s")
+                    except Exception as e:
+                        status[name] = "failed"
+                        print(f"❌ {name}: {e}")
+        return status
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the ingestion pipeline, skipping up-to-date stages")
+    parser.add_argument("targets", nargs="*", help="Stages to bring up to date (default: all)")
+    parser.add_argument("--force", nargs="+", default=[], metavar="STAGE", help="Rerun these stages")
+    parser.add_argument("--dry-run", action="store_true", help="Only show what would run")
+    parser.add_argument("--list", action="store_true", help="List stages and their artifacts")
+    parser.add_argument("--mark", nargs="+", default=[], metavar="STAGE",
+                        help="Record the existing outputs of these stages as up to date (e.g. committed datasets)")
+    parser.add_argument("--jobs", type=int, default=4, help="Maximum stages running in parallel")
+    args = parser.parse_args()
+
+    runner = PipelineRunner(jobs=args.jobs)
+
+    if args.list:
+        for name in runner.plan():
+            stage = runner.stages[name]
+            outputs = ", ".join(os.path.relpath(path, SCRAPING_DIR) for path in stage.outputs)
+            after = ", ".join(sorted(runner.dependencies[name])) or "-"
+            print(f"{name:<15} after: {after:<12} -> {outputs}")
+        return
+
+    try:
+        if args.mark:
+            marked = runner.mark(args.mark)
+            print(f"📌 Marked as up to date: {', '.join(marked) or 'nothing (outputs missing)'}")
+            return
+        if args.dry_run:
+            for name, line in runner.dry_run(args.targets, set(args.force)).items():
+                print(f"{name:<15} {line}")
+            return
+        status = runner.run(args.targets, set(args.force))
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(2)
+
+    counts = {key: sum(1 for value in status.values() if value == key) for key in ("ran", "skipped", "failed", "blocked")}
+    print(f"\n🏁 Pipeline: {counts['ran']} ran, {counts['skipped']} skipped, "
+          f"{counts['failed']} failed, {counts['blocked']} blocked")
+    if counts["failed"] or counts["blocked"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,125 @@
 import json
 import re
 import os
+import hashlib
+from array import array
+
+from corpus_store import STORE_EXTENSION, read_records
 
 # --- Configuración ---
-INPUT_FILE = 'dataset_filtrado.json'  # El resultado del script anterior
-OUTPUT_JSONL = 'chunks_para_ia.jsonl' # La materia prima para el LLM
+DATASETS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'datasets')
+INPUT_FILE = os.path.join(DATASETS_DIR, 'dataset_filtrado.json')  # El resultado del script anterior (.json o store .dcs)
+OUTPUT_JSONL = os.path.join(DATASETS_DIR, 'chunks_para_ia.jsonl') # La materia prima para el LLM
 MIN_CHUNK_WORDS = 15                  # Mínimo de palabras para ser un "chunk" válido
+
+# Detección de boilerplate aprendida del corpus (menús, CTAs, footers repetidos)
+DETECTAR_BOILERPLATE = True
+BOILERPLATE_FRACCION_PAGINAS = 0.05   # Un bloque es boilerplate si aparece en más de este % de páginas
+BOILERPLATE_MIN_PAGINAS = 3           # ...y en al menos esta cantidad de páginas (corpus pequeños)
+CONSERVAR_PRIMERA_APARICION = True    # Mantener una copia del bloque (la de la primera página) en la KB
+SKETCH_ANCHO = 2 ** 16                # Contadores por fila del count-min sketch
+SKETCH_PROFUNDIDAD = 4                # Filas (funciones hash) del count-min sketch
 # ---------------------
 
+
+class CountMinSketch:
+    """
+    Contador aproximado de frecuencias con memoria fija (ancho x profundidad).
+    Nunca subestima: solo puede sobreestimar cuando hay colisiones.
+    """
+
+    def __init__(self, ancho=SKETCH_ANCHO, profundidad=SKETCH_PROFUNDIDAD):
+        self.ancho = ancho
+        self.profundidad = profundidad
+        self.filas = [array('I', [0]) * ancho for _ in range(profundidad)]
+
+    def _indices(self, clave):
+        digest = hashlib.blake2b(clave, digest_size=4 * self.profundidad).digest()
+        return [int.from_bytes(digest[4 * i:4 * i + 4], 'little') % self.ancho
+                for i in range(self.profundidad)]
+
+    def agregar(self, clave, cantidad=1):
+        for fila, indice in zip(self.filas, self._indices(clave)):
+            fila[indice] += cantidad
+
+    def estimar(self, clave):
+        return min(fila[indice] for fila, indice in zip(self.filas, self._indices(clave)))
+
+
+def normalizar_bloque(bloque):
+    """Normaliza un bloque (línea) para comparar: minúsculas y espacios colapsados."""
+    return ' '.join(bloque.lower().split())
+
+
+class DetectorBoilerplate:
+    """
+    Aprende qué bloques se repiten entre páginas en una sola pasada sobre el corpus.
+
+    Cada bloque se cuenta una vez por página (frecuencia documental), y cada URL
+    se cuenta una sola vez aunque el dataset la repita.
+    """
+
+    def __init__(self, fraccion_paginas=BOILERPLATE_FRACCION_PAGINAS,
+                 min_paginas=BOILERPLATE_MIN_PAGINAS,
+                 conservar_primera=CONSERVAR_PRIMERA_APARICION):
+        self.fraccion_paginas = fraccion_paginas
+        self.min_paginas = min_paginas
+        self.conservar_primera = conservar_primera
+        self.sketch = CountMinSketch()
+        self.total_paginas = 0
+        self._urls_vistas = set()
+        self._bloques_emitidos = set()
+
+    @staticmethod
+    def _clave(bloque):
+        return normalizar_bloque(bloque).encode('utf-8')
+
+    def entrenar(self, items):
+        """Cuenta en cuántas páginas distintas aparece cada bloque."""
+        for item in items:
+            url = item.get('url', 'N/A')
+            if url in self._urls_vistas:
+                continue
+            self._urls_vistas.add(url)
+            self.total_paginas += 1
+
+            claves = {self._clave(linea) for linea in item.get('text', '').split('\n') if linea.strip()}
+            for clave in claves:
+                self.sketch.agregar(clave)
+        return self
+
+    @property
+    def umbral(self):
+        """Número de páginas a partir del cual un bloque se considera boilerplate."""
+        return max(self.min_paginas, int(self.total_paginas * self.fraccion_paginas) + 1)
+
+    def es_boilerplate(self, bloque):
+        return self.sketch.estimar(self._clave(bloque)) >= self.umbral
+
+    def filtrar_texto(self, texto):
+        """
+        Elimina del texto los bloques de boilerplate.
+
+        Args:
+            texto: Texto crudo de una página (bloques separados por salto de línea)
+
+        Returns:
+            Tupla (texto filtrado, cantidad de bloques eliminados)
+        """
+        conservadas = []
+        eliminados = 0
+        for linea in texto.split('\n'):
+            if linea.strip() and self.es_boilerplate(linea):
+                clave = self._clave(linea)
+                if self.conservar_primera and clave not in self._bloques_emitidos:
+                    self._bloques_emitidos.add(clave)
+                else:
+                    eliminados += 1
+                    continue
+            conservadas.append(linea)
+        return '\n'.join(conservadas), eliminados
+
+
 def limpiar_texto(texto):
     """
     Limpia el texto crudo del scraper.
@@ -40,16 +152,34 @@ def limpiar_texto(texto):
     return texto
 
 def procesar_y_chunkear(input_path, output_path):
+    """
+    Limpia las páginas y escribe un chunk por párrafo.
+
+    Returns:
+        {'leidos', 'escritos', 'errores'} (páginas leídas y chunks escritos), o None
+        si falta la entrada o el proceso se interrumpió (la salida quedaría incompleta)
+    """
     print(f"Iniciando limpieza y 'chunking' de '{input_path}'...")
     
     total_chunks = 0
     if not os.path.exists(input_path):
         print(f"Error: No se encontró el archivo '{input_path}'. Ejecuta 'filtrar.py' primero.")
-        return
+        return None
 
     try:
-        with open(input_path, 'r', encoding='utf-8') as f_in:
-            data = json.load(f_in)
+        if input_path.endswith(STORE_EXTENSION):
+            # Store compacto: solo se leen las columnas que usa esta etapa
+            data = list(read_records(input_path, fields=['url', 'title', 'text']))
+        else:
+            with open(input_path, 'r', encoding='utf-8') as f_in:
+                data = json.load(f_in)
+
+        detector = None
+        bloques_eliminados = 0
+        if DETECTAR_BOILERPLATE:
+            detector = DetectorBoilerplate().entrenar(data)
+            print(f"Boilerplate: {detector.total_paginas} páginas únicas, "
+                  f"umbral {detector.umbral} páginas por bloque.")
         
         with open(output_path, 'w', encoding='utf-8') as f_out:
             for item in data:
@@ -59,6 +189,10 @@ def procesar_y_chunkear(input_path, output_path):
                 
                 if not texto_sucio:
                     continue
+
+                if detector:
+                    texto_sucio, eliminados = detector.filtrar_texto(texto_sucio)
+                    bloques_eliminados += eliminados
                     
                 texto_limpio_completo = limpiar_texto(texto_sucio)
                 parrafos = texto_limpio_completo.split('\n')
@@ -82,10 +216,14 @@ def procesar_y_chunkear(input_path, output_path):
 
         print("\n--- ¡Procesamiento completado! ---")
         print(f"Se generaron {total_chunks} chunks (párrafos).")
+        if detector:
+            print(f"Bloques de boilerplate eliminados: {bloques_eliminados}")
         print(f"Archivo listo para IA guardado en: '{output_path}'")
+        return {'leidos': len(data), 'escritos': total_chunks, 'errores': 0}
 
     except Exception as e:
         print(f"Ocurrió un error inesperado: {e}")
+        return None
 
 if __name__ == "__main__":
     procesar_y_chunkear(INPUT_FILE, OUTPUT_JSONL)
\ No newline at end of file
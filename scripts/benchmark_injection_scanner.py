@@ -0,0 +1,177 @@
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+
+# --- Configuración ---
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAMBDA_DIR = os.path.join(REPO_DIR, 'lambda')
+SCRIPTS_DIR = os.path.join(REPO_DIR, 'scripts')
+DEFAULT_MODEL_DIR = os.path.join(LAMBDA_DIR, 'data', 'prompt_injection')
+DEFAULT_BACKENDS = 'llm_guard,onnx-int8'
+# ---------------------
+
+for path in (SCRIPTS_DIR, LAMBDA_DIR, REPO_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from benchmark_handler import ENRICHED_DATASET, INJECTION_QUERIES, read_jsonl, summarize
+from convert_to_md import record_text
+from evaluate_prompts import load_cases
+
+
+def build_conversations(count: int, turns: int) -> List[List[Dict[str, str]]]:
+    """
+    Conversaciones sintéticas de `turns` turnos: preguntas etiquetadas (y algunas
+    injections) con respuestas del dataset como mensajes del asistente.
+
+    Returns:
+        Lista de conversaciones; cada una es la lista de turnos {'query', 'answer'}
+    """
+    queries = [case['query'] for case in load_cases()]
+    answers = [record_text(data)[:600] for data in read_jsonl(ENRICHED_DATASET)] or ['Respuesta de ejemplo.']
+    conversations = []
+    for index in range(count):
+        conversation = []
+        for turn in range(turns):
+            position = index * turns + turn
+            query = queries[position % len(queries)]
+            if position % 10 == 9:
+                query = INJECTION_QUERIES[position % len(INJECTION_QUERIES)]
+            conversation.append({'query': query, 'answer': answers[position % len(answers)]})
+        conversations.append(conversation)
+    return conversations
+
+
+def create_scanner(backend: str, model_dir: str, threshold: float, threads: int) -> Any:
+    """
+    Scanner con la interfaz de LLM Guard para cada backend:
+    - llm_guard: PromptInjection actual (transformers + torch)
+    - llm_guard-onnx: PromptInjection de LLM Guard con use_onnx=True (optimum)
+    - onnx-fp32 / onnx-int8: OnnxPromptInjectionScanner de lambda/injection_scanner.py
+    """
+    if backend.startswith('llm_guard'):
+        from llm_guard.input_scanners import PromptInjection
+        from llm_guard.input_scanners.prompt_injection import MatchType
+
+        return PromptInjection(threshold=threshold, match_type=MatchType.FULL, use_onnx=backend == 'llm_guard-onnx')
+
+    from injection_scanner import OnnxPromptInjectionScanner
+
+    return OnnxPromptInjectionScanner(model_dir, threshold=threshold, quantized=backend == 'onnx-int8', threads=threads)
+
+
+def scan_turn(scanner: Any, query: str, history: List[Dict[str, str]]) -> List[bool]:
+    """Mismo recorrido que el injection scan de ask_handler: query y luego cada mensaje del historial."""
+    if hasattr(scanner, 'scan_batch'):
+        scanner.scan_batch([query] + [msg['content'] for msg in history])
+    flags = [not scanner.scan(query)[1]]
+    flags += [not scanner.scan(msg['content'])[1] for msg in history]
+    return flags
+
+
+def run_backend(backend: str, conversations: List[List[Dict[str, str]]], model_dir: str, threshold: float,
+                threads: int, max_history: int) -> Dict[str, Any]:
+    """
+    Recorre las conversaciones turno a turno con un backend (proceso propio: la carga
+    del modelo y la memoria se miden sin interferencia de los otros backends).
+
+    Returns:
+        Carga (ms), latencia por turno y por mensaje escaneado, memoria y detecciones
+    """
+    if threads:
+        # Antes de importar torch / onnxruntime: acota los hilos como en Lambda
+        os.environ['OMP_NUM_THREADS'] = str(threads)
+    start = time.perf_counter()
+    scanner = create_scanner(backend, model_dir, threshold, threads)
+    scan_turn(scanner, 'hola', [])
+    cold_ms = (time.perf_counter() - start) * 1000
+
+    turn_ms = []
+    flagged = []
+    messages = 0
+    for conversation in conversations:
+        history: List[Dict[str, str]] = []
+        for turn in conversation:
+            window = history[-max_history:] if max_history else []
+            begin = time.perf_counter()
+            flags = scan_turn(scanner, turn['query'], window)
+            elapsed = (time.perf_counter() - begin) * 1000
+            turn_ms.append(elapsed)
+            messages += len(flags)
+            flagged.append(flags[0])
+            history += [{'role': 'user', 'content': turn['query']}, {'role': 'assistant', 'content': turn['answer']}]
+
+    return {
+        'backend': backend,
+        'cold_ms': round(cold_ms, 1),
+        'turn_ms': summarize(turn_ms),
+        'ms_per_message': round(sum(turn_ms) / (messages or 1), 3),
+        'messages_scanned': messages,
+        'max_rss_mib': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'flagged_queries': flagged,
+    }
+
+
+def agreement(baseline: List[bool], candidate: List[bool]) -> float:
+    return round(sum(a == b for a, b in zip(baseline, candidate)) / (len(baseline) or 1), 4)
+
+
+def run(backends: List[str], conversations: List[List[Dict[str, str]]], model_dir: str, threshold: float,
+        threads: int, max_history: int) -> List[Dict[str, Any]]:
+    """Un proceso por backend, de a uno (medición de CPU sin competencia)."""
+    results = []
+    for backend in backends:
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            results.append(executor.submit(
+                run_backend, backend, conversations, model_dir, threshold, threads, max_history
+            ).result())
+    baseline = results[0]['flagged_queries']
+    for result in results:
+        result['agreement_vs_first'] = agreement(baseline, result['flagged_queries'])
+        result['flagged'] = sum(result.pop('flagged_queries'))
+    return results
+
+
+def print_report(results: List[Dict[str, Any]]) -> None:
+    print("\n--- Prompt injection scan (CPU) ---")
+    print(f"{'backend':<15} {'carga ms':>9} {'turno p50':>10} {'turno p95':>10} {'ms/msg':>8} "
+          f"{'RSS MiB':>8} {'detect.':>8} {'acuerdo':>8}")
+    for result in results:
+        print(f"{result['backend']:<15} {result['cold_ms']:>9} {result['turn_ms']['p50']:>10} {result['turn_ms']['p95']:>10} "
+              f"{result['ms_per_message']:>8} {result['max_rss_mib']:>8} {result['flagged']:>8} "
+              f"{result['agreement_vs_first']:>8.2%}")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description='Compara en CPU el detector de prompt injection de LLM Guard con el backend ONNX de ask_handler.'
+    )
+    parser.add_argument('--backends', default=DEFAULT_BACKENDS,
+                        help='llm_guard, llm_guard-onnx, onnx-fp32, onnx-int8 (el primero es la base del acuerdo)')
+    parser.add_argument('--model-dir', default=DEFAULT_MODEL_DIR, help='Modelo de scripts/build_injection_model.py')
+    parser.add_argument('--threshold', type=float, default=0.5)
+    parser.add_argument('--conversations', type=int, default=30)
+    parser.add_argument('--turns', type=int, default=5)
+    parser.add_argument('--max-history', type=int, default=10, help='Mensajes de historial por turno (MAX_CONTEXT_MESSAGES)')
+    parser.add_argument('--threads', type=int, default=2, help='Hilos de CPU por backend (Lambda de 3 GB ~ 2 vCPU)')
+    parser.add_argument('--output', help='Guardar el reporte JSON en esta ruta')
+    args = parser.parse_args(argv)
+
+    backends = [backend.strip() for backend in args.backends.split(',') if backend.strip()]
+    conversations = build_conversations(args.conversations, args.turns)
+    results = run(backends, conversations, args.model_dir, args.threshold, args.threads, args.max_history)
+    print_report(results)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\nReporte guardado en: '{args.output}'")
+
+
+if __name__ == '__main__':
+    main()
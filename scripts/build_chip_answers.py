@@ -0,0 +1,111 @@
+import argparse
+import hashlib
+import html
+import json
+import os
+import re
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+# --- Configuración ---
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAMBDA_DIR = os.path.join(REPO_DIR, 'lambda')
+SCRIPTS_DIR = os.path.join(REPO_DIR, 'scripts')
+FRONTEND_INDEX = os.path.join(REPO_DIR, 'frontend', 'index.html')
+DEFAULT_OUTPUT = os.path.join(REPO_DIR, 'frontend', 'data', 'chip-answers.json')  # Se sube al sitio S3 junto a index.html
+CHIP_PATTERN = re.compile(r'<button[^>]*class="[^"]*\bchip\b[^"]*"[^>]*>(.*?)</button>', re.DOTALL)
+BUNDLE_FORMAT = 1
+# ---------------------
+
+for path in (SCRIPTS_DIR, LAMBDA_DIR, REPO_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from benchmark_handler import ENRICHED_DATASET, FakeLambdaContext, build_event, import_handler_module, read_jsonl
+from evaluate_prompts import configure_bedrock
+
+
+def chip_questions(index_path: str = FRONTEND_INDEX) -> List[str]:
+    """Textos de los botones `.chip` de index.html (lo que envía chatbot.js al hacer clic)."""
+    with open(index_path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    return [' '.join(html.unescape(match).split()) for match in CHIP_PATTERN.findall(content)]
+
+
+def faq_questions(limit: int, path: str = ENRICHED_DATASET) -> List[str]:
+    """Preguntas curadas del dataset (registros con 'question' y 'answer'), en orden."""
+    questions = []
+    for data in read_jsonl(path):
+        if limit <= len(questions):
+            break
+        if data.get('question') and data.get('answer'):
+            questions.append(' '.join(data['question'].split()))
+    return questions
+
+
+def answer_questions(questions: List[str], backend: str, cassette: Optional[str]) -> List[Dict[str, Any]]:
+    """
+    Respuestas del handler completo, sin historial (como el primer mensaje de una conversación).
+    Se descartan las respuestas con error y las degradadas.
+    """
+    ask_handler = import_handler_module()
+    ask_handler.logger.setLevel('ERROR')
+    configure_bedrock(ask_handler, backend, cassette)
+
+    answers = []
+    for question in questions:
+        response = ask_handler.handler(build_event(question), FakeLambdaContext())
+        body = json.loads(response['body'])
+        if response['statusCode'] != 200 or body.get('degraded') or not body.get('answer'):
+            print(f"  ⚠️  Sin respuesta ({response['statusCode']}): {question}")
+            continue
+        answers.append({'question': question, 'answer': body['answer'], 'sources': body.get('sources') or []})
+    return answers
+
+
+def build_bundle(answers: List[Dict[str, Any]], ttl_seconds: int) -> Dict[str, Any]:
+    """
+    Bundle versionado: la versión es el hash del contenido, así chatbot.js reemplaza
+    sus respuestas cacheadas solo cuando las respuestas cambian.
+    """
+    canonical = json.dumps(answers, sort_keys=True, ensure_ascii=False)
+    return {
+        'format': BUNDLE_FORMAT,
+        'version': hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:12],
+        'generated_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'ttl_seconds': ttl_seconds,
+        'answers': answers,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description='Precalcula las respuestas de los suggestion chips (y FAQ frecuentes) para el frontend.'
+    )
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help='Bundle JSON a subir al sitio S3')
+    parser.add_argument('--faq-limit', type=int, default=0, help='Agregar las primeras N preguntas curadas del dataset')
+    parser.add_argument('--backend', choices=['live', 'record', 'replay'], default='live',
+                        help='Bedrock real, real grabando en --cassette, o replay de --cassette')
+    parser.add_argument('--cassette', help='Cassette de Bedrock (.jsonl.gz)')
+    parser.add_argument('--ttl-hours', type=float, default=24.0, help='Vigencia de las respuestas en el navegador')
+    args = parser.parse_args(argv)
+
+    if args.backend in ('record', 'replay') and not args.cassette:
+        parser.error(f'--backend {args.backend} requiere --cassette')
+
+    questions = list(dict.fromkeys(chip_questions() + faq_questions(args.faq_limit)))
+    print(f"🔄 Generando respuestas para {len(questions)} preguntas...")
+    bundle = build_bundle(answer_questions(questions, args.backend, args.cassette), int(args.ttl_hours * 3600))
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(bundle, f, ensure_ascii=False, separators=(',', ':'))
+    print(f"✅ Bundle {bundle['version']}: {len(bundle['answers'])} respuestas, "
+          f"{os.path.getsize(args.output) / 1024:.1f} KiB en '{args.output}'")
+    print("   Subir con Cache-Control corto (el navegador revalida la versión al abrir el chat), por ejemplo:")
+    print("   aws s3 cp frontend/data/chip-answers.json s3://<bucket>/data/chip-answers.json --cache-control max-age=300")
+
+
+if __name__ == '__main__':
+    main()
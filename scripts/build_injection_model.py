@@ -0,0 +1,145 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+from typing import Any, Dict, List
+
+# --- Configuración ---
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAMBDA_DIR = os.path.join(REPO_DIR, 'lambda')
+SCRIPTS_DIR = os.path.join(REPO_DIR, 'scripts')
+DEFAULT_MODEL = 'protectai/deberta-v3-base-prompt-injection-v2'  # Modelo por defecto de PromptInjection en LLM Guard
+DEFAULT_OUTPUT = os.path.join(LAMBDA_DIR, 'data', 'prompt_injection')  # Se empaqueta junto a ask_handler.py
+# ---------------------
+
+for path in (SCRIPTS_DIR, LAMBDA_DIR, REPO_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from injection_scanner import MANIFEST_FILE, MODEL_FILE, QUANTIZED_MODEL_FILE, TOKENIZER_FILE, OnnxPromptInjectionScanner
+
+
+def export_model(model: str, output_dir: str, revision: str = None) -> Dict[str, Any]:
+    """
+    Deja en `output_dir` el modelo ONNX (fp32), tokenizer.json y config.json.
+
+    Usa la exportación ONNX publicada en el repositorio del modelo (carpeta `onnx/`);
+    si no existe, exporta con optimum.
+
+    Returns:
+        config.json del modelo
+    """
+    from huggingface_hub import snapshot_download
+
+    os.makedirs(output_dir, exist_ok=True)
+    snapshot = snapshot_download(model, revision=revision, allow_patterns=['onnx/*', '*.json'])
+    onnx_dir = os.path.join(snapshot, 'onnx')
+    if os.path.exists(os.path.join(onnx_dir, MODEL_FILE)):
+        shutil.copy(os.path.join(onnx_dir, MODEL_FILE), os.path.join(output_dir, MODEL_FILE))
+        for name in (TOKENIZER_FILE, 'config.json'):
+            source = os.path.join(onnx_dir, name) if os.path.exists(os.path.join(onnx_dir, name)) else os.path.join(snapshot, name)
+            shutil.copy(source, os.path.join(output_dir, name))
+    else:
+        from optimum.onnxruntime import ORTModelForSequenceClassification
+        from transformers import AutoTokenizer
+
+        ORTModelForSequenceClassification.from_pretrained(model, revision=revision, export=True).save_pretrained(output_dir)
+        AutoTokenizer.from_pretrained(model, revision=revision).save_pretrained(output_dir)
+
+    with open(os.path.join(output_dir, 'config.json'), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def quantize_model(output_dir: str) -> None:
+    """Cuantización dinámica int8 de los pesos (las activaciones se cuantizan en ejecución)."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(
+        os.path.join(output_dir, MODEL_FILE),
+        os.path.join(output_dir, QUANTIZED_MODEL_FILE),
+        weight_type=QuantType.QInt8,
+    )
+
+
+def injection_index(config: Dict[str, Any]) -> int:
+    """Índice de la clase de injection según id2label (INJECTION en los modelos de ProtectAI)."""
+    for index, label in (config.get('id2label') or {}).items():
+        if 'injection' in str(label).lower():
+            return int(index)
+    return 1
+
+
+def verify(output_dir: str, texts: List[str], threshold: float) -> Dict[str, Any]:
+    """
+    Compara el modelo int8 con el fp32 sobre los mismos textos.
+
+    Returns:
+        Diferencia máxima de probabilidad y acuerdo de la decisión (threshold)
+    """
+    full = OnnxPromptInjectionScanner(output_dir, threshold=threshold, quantized=False, cache_size=0)
+    quantized = OnnxPromptInjectionScanner(output_dir, threshold=threshold, quantized=True, cache_size=0)
+    full_scores = full.scores(texts)
+    quantized_scores = quantized.scores(texts)
+    agree = sum((a > threshold) == (b > threshold) for a, b in zip(full_scores, quantized_scores))
+    return {
+        'texts': len(texts),
+        'max_abs_diff': round(max(abs(a - b) for a, b in zip(full_scores, quantized_scores)), 4) if texts else 0.0,
+        'decision_agreement': round(agree / len(texts), 4) if texts else 1.0,
+        'flagged_fp32': sum(score > threshold for score in full_scores),
+        'flagged_int8': sum(score > threshold for score in quantized_scores),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Exporta el detector de prompt injection de LLM Guard a ONNX (fp32 + int8) para ask_handler"
+    )
+    parser.add_argument('--model', default=DEFAULT_MODEL, help="Modelo de Hugging Face")
+    parser.add_argument('--revision', help="Revisión del modelo (commit o tag)")
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help="Directorio de salida (LLM_GUARD_ONNX_MODEL_DIR)")
+    parser.add_argument('--no-quantize', action='store_true', help="Solo el modelo fp32")
+    parser.add_argument('--keep-fp32', action='store_true', help="Conservar model.onnx junto al int8 (artefacto más grande)")
+    parser.add_argument('--threshold', type=float, default=0.5, help="Threshold para comparar decisiones fp32/int8")
+    parser.add_argument('--verify-limit', type=int, default=300, help="Consultas del dataset para verificar el int8 (0 = no)")
+    args = parser.parse_args()
+
+    start = time.time()
+    config = export_model(args.model, args.output, args.revision)
+    if not args.no_quantize:
+        quantize_model(args.output)
+
+    report = None
+    if not args.no_quantize and args.verify_limit:
+        from benchmark_handler import INJECTION_QUERIES
+        from evaluate_prompts import load_cases
+
+        texts = [case['query'] for case in load_cases()[:args.verify_limit]] + INJECTION_QUERIES
+        report = verify(args.output, texts, args.threshold)
+
+    if not args.no_quantize and not args.keep_fp32:
+        os.remove(os.path.join(args.output, MODEL_FILE))
+
+    manifest = {
+        'version': 1,
+        'model': args.model,
+        'revision': args.revision,
+        'labels': config.get('id2label'),
+        'injection_index': injection_index(config),
+        'quantized': not args.no_quantize,
+        'verification': report,
+    }
+    with open(os.path.join(args.output, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    print(f"✅ Modelo de prompt injection en {args.output} ({time.time() - start:.1f}s)")
+    for name in sorted(os.listdir(args.output)):
+        print(f"   • {name}: {os.path.getsize(os.path.join(args.output, name)) / 1024 / 1024:.1f} MiB")
+    if report:
+        print(f"   int8 vs fp32: acuerdo {report['decision_agreement']:.2%} en {report['texts']} textos, "
+              f"diferencia máxima {report['max_abs_diff']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List
+
+# --- Configuración ---
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAMBDA_DIR = os.path.join(REPO_DIR, 'lambda')
+FAQ_DATASET = os.path.join(REPO_DIR, 'dataset', 'dataset_enriquecido.jsonl')
+CORPUS_DATASET = os.path.join(REPO_DIR, 'scraping', 'datasets', 'dataset_final_scraper.jsonl')
+DEFAULT_OUTPUT = os.path.join(LAMBDA_DIR, 'data', 'semantic_index')  # Se empaqueta junto a ask_handler.py
+# ---------------------
+
+for path in (LAMBDA_DIR, REPO_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from convert_to_md import record_text, record_url
+from semantic_index import HashingEmbedder, TitanEmbedder, build_index
+
+
+def read_jsonl(path: str):
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def load_items(faq_path: str = FAQ_DATASET, corpus_path: str = CORPUS_DATASET) -> List[Dict[str, Any]]:
+    """
+    Ítems del índice:
+    - 'faq': pregunta curada + preguntas alternativas, con su respuesta (deflexión sin RAG)
+    - 'chunk': fragmentos del corpus, indexados por su texto y sus preguntas generadas
+    """
+    items = []
+    seen_chunks = set()
+
+    if os.path.exists(faq_path):
+        for data in read_jsonl(faq_path):
+            answer = record_text(data)
+            url = record_url(data, answer)
+            if data.get('question') and data.get('answer'):
+                items.append({
+                    'kind': 'faq',
+                    'id': data['id'],
+                    'question': data['question'],
+                    'answer': answer,
+                    'url': url,
+                    'texts': [data['question']] + list(data.get('alternative_questions') or []),
+                })
+            elif answer:
+                items.append({'kind': 'chunk', 'id': data['id'], 'answer': answer, 'url': url, 'texts': [answer]})
+
+    if os.path.exists(corpus_path):
+        for data in read_jsonl(corpus_path):
+            answer = record_text(data)
+            url = record_url(data, answer)
+            if not answer or (answer, url) in seen_chunks:
+                continue  # El crawler repite páginas entre secciones
+            seen_chunks.add((answer, url))
+            items.append({
+                'kind': 'chunk',
+                'id': data['id'],
+                'answer': answer,
+                'url': url,
+                'texts': [answer] + list(data.get('questions') or []),
+            })
+    return items
+
+
+def build(output_prefix: str = DEFAULT_OUTPUT, embedder=None, faq_path: str = FAQ_DATASET,
+          corpus_path: str = CORPUS_DATASET) -> Dict[str, Any]:
+    embedder = embedder or HashingEmbedder()
+    os.makedirs(os.path.dirname(output_prefix), exist_ok=True)
+    items = load_items(faq_path, corpus_path)
+    start = time.perf_counter()
+    rows = build_index(items, embedder, output_prefix)
+    return {
+        'items': len(items),
+        'faq_items': sum(1 for item in items if item['kind'] == 'faq'),
+        'rows': rows,
+        'seconds': time.perf_counter() - start,
+        'bytes': os.path.getsize(output_prefix + '.npy'),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Construye el índice semántico (float16 .npy) para ask_handler")
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help="Ruta sin extensión (.npy y .json)")
+    parser.add_argument('--embedder', choices=['hashing', 'titan'], default='hashing')
+    parser.add_argument('--dim', type=int, help="Dimensión (hashing: 512, titan: 256)")
+    parser.add_argument('--faq', default=FAQ_DATASET)
+    parser.add_argument('--corpus', default=CORPUS_DATASET)
+    args = parser.parse_args()
+
+    if args.embedder == 'titan':
+        embedder = TitanEmbedder(dim=args.dim or 256)
+    else:
+        embedder = HashingEmbedder(dim=args.dim or 512)
+
+    stats = build(args.output, embedder, args.faq, args.corpus)
+    print(f"✅ Índice semántico: {stats['items']} ítems ({stats['faq_items']} FAQ), {stats['rows']} filas, "
+          f"{stats['bytes'] / 1024:.0f} KiB en {stats['seconds']:.2f}s")
+    print(f"   • {args.output}.npy / {args.output}.json")
+
+
+if __name__ == '__main__':
+    main()
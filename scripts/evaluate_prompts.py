@@ -0,0 +1,224 @@
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+# --- Configuración ---
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAMBDA_DIR = os.path.join(REPO_DIR, 'lambda')
+SCRIPTS_DIR = os.path.join(REPO_DIR, 'scripts')
+NO_INFO_PATTERN = re.compile(r'no (tengo|cuento con|dispongo de|encontr[ée])', re.IGNORECASE)
+# ---------------------
+
+for path in (SCRIPTS_DIR, LAMBDA_DIR, REPO_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from benchmark_handler import FakeLambdaContext, build_event, import_handler_module, read_jsonl, summarize
+from convert_to_md import record_text, record_url
+from evaluate_retrieval import LABELED_DATASET
+from prompt_templates import DEFAULT_VERSION, TEMPLATES
+
+
+def template_footprint(versions: List[str], monthly_requests: int = 0) -> List[Dict[str, Any]]:
+    """
+    Tamaño de cada versión de templates: caracteres y tokens estimados (misma
+    heurística que la contabilidad del handler). Ambos templates se cobran como
+    entrada en cada llamada RAG.
+
+    Returns:
+        Lista de {'version', 'orchestration_tokens', 'generation_tokens', 'tokens_per_call', ...}
+    """
+    ask_handler = import_handler_module()
+    baseline = None
+    rows = []
+    for version in versions:
+        templates = TEMPLATES[version]
+        orchestration = ask_handler.estimate_tokens(templates['orchestration'])
+        generation = ask_handler.estimate_tokens(templates['generation'])
+        per_call = orchestration + generation
+        if baseline is None:
+            baseline = per_call
+        rows.append({
+            'version': version,
+            'orchestration_chars': len(templates['orchestration']),
+            'orchestration_tokens': orchestration,
+            'generation_chars': len(templates['generation']),
+            'generation_tokens': generation,
+            'tokens_per_call': per_call,
+            'saved_vs_first': round(1 - per_call / baseline, 3) if baseline else 0.0,
+            'monthly_tokens': per_call * monthly_requests,
+            'monthly_cost_usd': round(per_call * monthly_requests * ask_handler.INPUT_TOKEN_PRICE_PER_1K / 1000, 2),
+        })
+    return rows
+
+
+def load_cases(path: str = LABELED_DATASET) -> List[Dict[str, str]]:
+    """Preguntas alternativas con la URL de su registro (una respuesta correcta la cita)."""
+    cases = []
+    for data in read_jsonl(path):
+        url = record_url(data, record_text(data))
+        for question in data.get('alternative_questions') or []:
+            if question.strip():
+                cases.append({'query': question, 'id': str(data['id']), 'url': url})
+    return cases
+
+
+def configure_bedrock(ask_handler, backend: str, cassette: Optional[str]) -> Any:
+    """
+    Conecta el handler a Bedrock real, grabando (record) o reproduciendo (replay) un cassette.
+    El replay exige la solicitud idéntica: cada versión de templates es otra solicitud.
+    """
+    from bedrock_cassette import CassetteStore, RecordingClient, ReplayClient
+
+    if backend == 'live':
+        return None
+    store = CassetteStore(cassette)
+    if backend == 'record':
+        manager = ask_handler.BedrockClientManager()
+        create_client = manager._create_client
+        manager._client_factory = lambda timeout: RecordingClient(create_client(timeout), store)
+        ask_handler.bedrock_client_manager = manager
+        return None
+    replay = ReplayClient(store, latency_scale=0.0, exact=True)
+    ask_handler.bedrock_client_manager = ask_handler.BedrockClientManager(client_factory=lambda timeout: replay)
+    return replay
+
+
+def run_version(version: str, cases: List[Dict[str, str]], backend: str, cassette: Optional[str],
+                threads: int) -> Dict[str, Any]:
+    """
+    Pasa las consultas etiquetadas por el handler completo con una versión de templates.
+
+    Returns:
+        Métricas de la versión: respuestas 200, cita de la URL correcta, respuestas
+        "sin información", tokens estimados y latencia
+    """
+    ask_handler = import_handler_module()
+    ask_handler.logger.setLevel('ERROR')
+    ask_handler.prompt_templates = ask_handler.load_prompt_templates(version)
+    ask_handler.rag_configuration_template.cache_clear()
+    ask_handler.semantic_index = ask_handler.semantic_answer_cache = None  # Todas las consultas van a RAG
+    ask_handler.request_coalescer = None
+    replay = configure_bedrock(ask_handler, backend, cassette)
+
+    usage_by_request: Dict[str, Dict[str, Any]] = {}
+
+    def capture_metrics(dimensions, metrics, properties=None):
+        if 'Route' in dimensions and properties and properties.get('usage'):
+            usage_by_request[properties['request_id']] = properties['usage']
+
+    ask_handler.emit_metrics = capture_metrics
+
+    def run(case: Dict[str, str]) -> Dict[str, Any]:
+        event = build_event(case['query'])
+        start = time.perf_counter()
+        response = ask_handler.handler(event, FakeLambdaContext())
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        body = json.loads(response['body'])
+        answer = body.get('answer', '')
+        urls = [source.get('url') for source in body.get('sources') or []]
+        return {
+            'status': response['statusCode'],
+            'cited_gold': bool(case['url']) and case['url'] in urls,
+            'no_info': bool(NO_INFO_PATTERN.search(answer)),
+            'answer_chars': len(answer),
+            'latency_ms': elapsed_ms,
+            'request_id': event['requestContext']['requestId'],
+        }
+
+    with ThreadPoolExecutor(max_workers=max(1, threads)) as executor:
+        results = list(executor.map(run, cases))
+
+    answered = [result for result in results if result['status'] == 200]
+    usages = [usage_by_request[result['request_id']] for result in answered if result['request_id'] in usage_by_request]
+    total = len(results) or 1
+    count = len(answered) or 1
+    return {
+        'version': version,
+        'queries': len(results),
+        'ok_rate': round(len(answered) / total, 4),
+        'cited_gold_rate': round(sum(result['cited_gold'] for result in answered) / count, 4),
+        'no_info_rate': round(sum(result['no_info'] for result in answered) / count, 4),
+        'avg_answer_chars': round(sum(result['answer_chars'] for result in answered) / count, 1),
+        'avg_input_tokens': round(sum(usage['input_tokens'] for usage in usages) / (len(usages) or 1), 1),
+        'avg_output_tokens': round(sum(usage['output_tokens'] for usage in usages) / (len(usages) or 1), 1),
+        'latency_ms': summarize([result['latency_ms'] for result in answered]),
+        'cassette_misses': replay.misses if replay is not None else None,
+    }
+
+
+def run_ab(versions: List[str], backend: str, cassette: Optional[str], threads: int = 1,
+           limit: int = None, workers: int = None) -> List[Dict[str, Any]]:
+    """Evalúa las versiones en paralelo (un proceso por versión) con las mismas consultas."""
+    cases = load_cases()[:limit]
+    workers = 1 if backend == 'record' else (workers or min(len(versions), os.cpu_count() or 1))
+    with ProcessPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = [executor.submit(run_version, version, cases, backend, cassette, threads) for version in versions]
+        return [future.result() for future in futures]
+
+
+def print_footprint(rows: List[Dict[str, Any]], monthly_requests: int) -> None:
+    print("\n--- Tamaño de prompt templates (tokens estimados, ~4 caracteres por token) ---")
+    print(f"{'versión':<12} {'orquestación':>13} {'generación':>11} {'por llamada':>12} {'ahorro':>7}"
+          + (f" {'tokens/mes':>13} {'USD/mes':>9}" if monthly_requests else ''))
+    for row in rows:
+        line = (f"{row['version']:<12} {row['orchestration_tokens']:>13} {row['generation_tokens']:>11} "
+                f"{row['tokens_per_call']:>12} {row['saved_vs_first']:>7.1%}")
+        if monthly_requests:
+            line += f" {row['monthly_tokens']:>13,} {row['monthly_cost_usd']:>9}"
+        print(line)
+
+
+def print_ab(results: List[Dict[str, Any]]) -> None:
+    print("\n--- A/B de prompt templates (handler completo) ---")
+    print(f"{'versión':<12} {'n':>4} {'ok':>6} {'cita ok':>8} {'sin info':>9} {'chars':>7} "
+          f"{'tok in':>8} {'tok out':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    for result in results:
+        print(f"{result['version']:<12} {result['queries']:>4} {result['ok_rate']:>6.3f} {result['cited_gold_rate']:>8.3f} "
+              f"{result['no_info_rate']:>9.3f} {result['avg_answer_chars']:>7} {result['avg_input_tokens']:>8} "
+              f"{result['avg_output_tokens']:>8} {result['latency_ms']['p50']:>8} {result['latency_ms']['p95']:>8}")
+        if result.get('cassette_misses'):
+            print(f"  ⚠️  {result['cassette_misses']} consultas sin respuesta grabada para {result['version']}")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description='Mide el tamaño de los prompt templates y compara versiones (A/B) con preguntas etiquetadas.'
+    )
+    parser.add_argument('--versions', default=','.join(TEMPLATES), help=f"Versiones (la primera es la base: {DEFAULT_VERSION})")
+    parser.add_argument('--monthly-requests', type=int, default=0, help='Proyectar tokens/costo mensual de templates')
+    parser.add_argument('--ab', choices=['replay', 'record', 'live'],
+                        help='Correr las consultas por el handler: replay de --cassette, record (Bedrock real) o live')
+    parser.add_argument('--cassette', help='Cassette de Bedrock (.jsonl.gz)')
+    parser.add_argument('--threads', type=int, default=1, help='Consultas concurrentes por versión')
+    parser.add_argument('--workers', type=int, help='Versiones en paralelo (procesos)')
+    parser.add_argument('--limit', type=int, help='Usar solo las primeras N consultas')
+    parser.add_argument('--output', help='Guardar el reporte JSON en esta ruta')
+    args = parser.parse_args(argv)
+
+    versions = [version.strip() for version in args.versions.split(',') if version.strip()]
+    unknown = [version for version in versions if version not in TEMPLATES]
+    if unknown:
+        parser.error(f"Versiones no registradas: {', '.join(unknown)}")
+    if args.ab in ('replay', 'record') and not args.cassette:
+        parser.error(f'--ab {args.ab} requiere --cassette')
+
+    report = {'footprint': template_footprint(versions, args.monthly_requests)}
+    print_footprint(report['footprint'], args.monthly_requests)
+    if args.ab:
+        report['ab'] = run_ab(versions, args.ab, args.cassette, args.threads, args.limit, args.workers)
+        print_ab(report['ab'])
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nReporte guardado en: '{args.output}'")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,349 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# --- Configuración ---
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAMBDA_DIR = os.path.join(REPO_DIR, 'lambda')
+SCRIPTS_DIR = os.path.join(REPO_DIR, 'scripts')
+LABELED_DATASET = os.path.join(REPO_DIR, 'dataset', 'dataset_enriquecido.jsonl')
+DISTRACTOR_DATASET = os.path.join(REPO_DIR, 'scraping', 'datasets', 'dataset_final_scraper.jsonl')
+DEFAULT_K = (1, 3, 5, 10)
+
+# Configuraciones por defecto: cada una fija las variables de entorno de QueryOptimizer
+DEFAULT_CONFIGS = {
+    'sin_optimizar': {'QUERY_OPTIMIZATION_ENABLED': False},
+    'expansion': {'QUERY_EXPANSION_ENABLED': True, 'HYBRID_SEARCH_ENABLED': False},
+    'hibrida': {'QUERY_EXPANSION_ENABLED': False, 'HYBRID_SEARCH_ENABLED': True},
+    'expansion+hibrida': {'QUERY_EXPANSION_ENABLED': True, 'HYBRID_SEARCH_ENABLED': True},
+    'expansion_max1': {'QUERY_EXPANSION_ENABLED': True, 'HYBRID_SEARCH_ENABLED': True, 'MAX_QUERY_EXPANSIONS': 1},
+    'expansion_max5': {'QUERY_EXPANSION_ENABLED': True, 'HYBRID_SEARCH_ENABLED': True, 'MAX_QUERY_EXPANSIONS': 5},
+}
+CONFIG_KEYS = {
+    'QUERY_OPTIMIZATION_ENABLED': bool,
+    'QUERY_EXPANSION_ENABLED': bool,
+    'HYBRID_SEARCH_ENABLED': bool,
+    'MAX_QUERY_EXPANSIONS': int,
+    'QUERY_TABLES_ENABLED': bool,
+}
+# ---------------------
+
+for path in (SCRIPTS_DIR, REPO_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from benchmark_handler import import_handler_module, read_jsonl, summarize
+from convert_to_md import record_text
+from mine_query_tables import BM25
+
+
+def load_documents(labeled_path: str = LABELED_DATASET,
+                   distractor_path: Optional[str] = DISTRACTOR_DATASET) -> List[Dict[str, str]]:
+    """
+    Documentos indexables para los retrievers locales, con el mismo contenido que
+    los documentos de la KB (texto, pregunta principal, keywords y preguntas).
+
+    Las `alternative_questions` de los registros etiquetados NO se indexan: son las
+    consultas de prueba, y si estuvieran en el documento la evaluación sería trivial.
+    Los chunks del scraper se agregan como distractores.
+
+    Returns:
+        Lista de {'id', 'text'}
+    """
+    documents = []
+    for data in read_jsonl(labeled_path):
+        parts = [data.get('question') or '', record_text(data), ' '.join(data.get('keywords') or [])]
+        documents.append({'id': str(data['id']), 'text': '\n'.join(part for part in parts if part)})
+
+    if distractor_path:
+        seen = set()
+        for data in read_jsonl(distractor_path):
+            text = record_text(data)
+            if not text or (text, data.get('url')) in seen:
+                continue  # El crawler repite páginas entre secciones
+            seen.add((text, data.get('url')))
+            parts = [text, ' '.join(data.get('keywords') or [])] + list(data.get('questions') or [])
+            documents.append({'id': str(data['id']), 'text': '\n'.join(part for part in parts if part)})
+    return documents
+
+
+def load_labeled_queries(path: str = LABELED_DATASET) -> List[Tuple[str, str]]:
+    """
+    Consultas etiquetadas: cada pregunta alternativa tiene como documento correcto
+    el `id` de su registro.
+
+    Returns:
+        Lista de (consulta, id del documento correcto)
+    """
+    queries = []
+    for data in read_jsonl(path):
+        for question in data.get('alternative_questions') or []:
+            if question.strip():
+                queries.append((question, str(data['id'])))
+    return queries
+
+
+class LocalBM25Retriever:
+    """Búsqueda léxica (BM25) en memoria: aproxima la parte por keywords de la búsqueda híbrida."""
+
+    name = 'bm25'
+
+    def __init__(self, documents: List[Dict[str, str]]):
+        self.ids = [document['id'] for document in documents]
+        self.bm25 = BM25([document['text'] for document in documents])
+
+    def retrieve(self, query: str, k: int) -> List[str]:
+        scores = self.bm25.scores(query)
+        top = np.argsort(-scores, kind='stable')[:k]
+        return [self.ids[index] for index in top if scores[index] > 0]
+
+
+class LocalSemanticRetriever:
+    """Búsqueda vectorial en memoria con el embedder del índice semántico (hashing por defecto)."""
+
+    name = 'semantic'
+
+    def __init__(self, documents: List[Dict[str, str]], embedder=None):
+        from semantic_index import HashingEmbedder
+
+        self.ids = [document['id'] for document in documents]
+        self.embedder = embedder or HashingEmbedder()
+        self.matrix = self.embedder.embed([document['text'] for document in documents])
+
+    def retrieve(self, query: str, k: int) -> List[str]:
+        scores = self.matrix @ self.embedder.embed([query])[0]
+        top = np.argsort(-scores, kind='stable')[:k]
+        return [self.ids[index] for index in top if scores[index] > 0]
+
+
+class BedrockRetriever:
+    """
+    Retrieve de la Knowledge Base (sin generación). El id del documento se lee del
+    sidecar de metadata que escribe convert_to_md (`id`).
+    """
+
+    name = 'bedrock'
+
+    def __init__(self, client, knowledge_base_id: str, search_type: str = 'HYBRID'):
+        self.client = client
+        self.knowledge_base_id = knowledge_base_id
+        self.search_type = search_type
+
+    def retrieve(self, query: str, k: int) -> List[str]:
+        response = self.client.retrieve(
+            knowledgeBaseId=self.knowledge_base_id,
+            retrievalQuery={'text': query},
+            retrievalConfiguration={
+                'vectorSearchConfiguration': {'numberOfResults': k, 'overrideSearchType': self.search_type}
+            },
+        )
+        ids = []
+        for result in response.get('retrievalResults', []):
+            doc_id = (result.get('metadata') or {}).get('id')
+            if doc_id is not None and str(doc_id) not in ids:
+                ids.append(str(doc_id))
+        return ids
+
+
+def create_retriever(spec: Dict[str, Any]):
+    """Construye el retriever dentro de cada proceso (los índices y clientes no se serializan)."""
+    kind = spec['retriever']
+    if kind in ('bm25', 'semantic'):
+        documents = load_documents(spec['labeled'], spec.get('distractors'))
+        return LocalBM25Retriever(documents) if kind == 'bm25' else LocalSemanticRetriever(documents)
+    if kind == 'bedrock':
+        from bedrock_cassette import CassetteStore, RecordingClient, ReplayClient
+
+        client = None
+        if spec.get('record') or not spec.get('cassette'):
+            import boto3
+            client = boto3.client('bedrock-agent-runtime', region_name=spec.get('region'))
+        if spec.get('cassette'):
+            store = CassetteStore(spec['cassette'])
+            client = RecordingClient(client, store) if spec.get('record') else ReplayClient(store)
+        return BedrockRetriever(client, spec['knowledge_base_id'], spec.get('search_type', 'HYBRID'))
+    raise ValueError(f"Retriever desconocido: {kind}")
+
+
+_handler_defaults: Dict[str, Any] = {}
+
+
+def apply_config(ask_handler, config: Dict[str, Any]):
+    """
+    Fija las variables de QueryOptimizer en el módulo. Cada configuración corre en
+    su propio proceso, así cambiar los globales no afecta a las demás.
+
+    Returns:
+        QueryOptimizer para la configuración, o None si la optimización está desactivada
+    """
+    if not _handler_defaults:
+        _handler_defaults.update({key: getattr(ask_handler, key) for key in CONFIG_KEYS})
+    for key in config:
+        if key not in CONFIG_KEYS:
+            raise ValueError(f"Variable de configuración no soportada: {key}")
+    # Los procesos del pool se reutilizan: partir siempre de los valores del entorno
+    for key, value in {**_handler_defaults, **config}.items():
+        setattr(ask_handler, key, CONFIG_KEYS[key](value))
+    if not ask_handler.QUERY_OPTIMIZATION_ENABLED:
+        return None
+    return ask_handler.QueryOptimizer(ask_handler.load_query_tables(ask_handler.QUERY_TABLES_PATH))
+
+
+def evaluate_config(name: str, config: Dict[str, Any], queries: List[Tuple[str, str]],
+                    spec: Dict[str, Any], ks: Tuple[int, ...], threads: int) -> Dict[str, Any]:
+    """
+    Evalúa una configuración: optimiza cada consulta, recupera los max(ks) primeros
+    documentos y mide posición del documento correcto y latencias.
+    """
+    ask_handler = import_handler_module()
+    ask_handler.logger.setLevel('ERROR')
+    optimizer = apply_config(ask_handler, config)
+    retriever = create_retriever(spec)
+    depth = max(ks)
+
+    def run(item: Tuple[str, str]) -> Tuple[Optional[int], float, float, int]:
+        query, gold = item
+        start = time.perf_counter()
+        text = optimizer.optimize_query(query) if optimizer else query
+        optimized = time.perf_counter()
+        ids = retriever.retrieve(text, depth)
+        retrieved = time.perf_counter()
+        rank = ids.index(gold) + 1 if gold in ids else None
+        return rank, (optimized - start) * 1000, (retrieved - optimized) * 1000, len(text.split())
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, threads)) as executor:
+        results = list(executor.map(run, queries))
+    wall_seconds = time.perf_counter() - wall_start
+
+    total = len(results) or 1
+    ranks = [rank for rank, _, _, _ in results]
+    metrics = {f'recall@{k}': sum(1 for rank in ranks if rank and rank <= k) / total for k in ks}
+    metrics['mrr'] = sum(1.0 / rank for rank in ranks if rank) / total
+    return {
+        'name': name,
+        'config': config,
+        'queries': len(results),
+        'metrics': {key: round(value, 4) for key, value in metrics.items()},
+        'avg_query_words': round(sum(words for _, _, _, words in results) / total, 2),
+        'optimize_ms': summarize([value for _, value, _, _ in results]),
+        'retrieve_ms': summarize([value for _, _, value, _ in results]),
+        'wall_seconds': round(wall_seconds, 3),
+    }
+
+
+def run_evaluation(configs: Dict[str, Dict[str, Any]], spec: Dict[str, Any], ks: Tuple[int, ...] = DEFAULT_K,
+                   workers: int = None, threads: int = 1, limit: int = None) -> Dict[str, Any]:
+    """
+    Ejecuta todas las configuraciones en paralelo (un proceso por configuración).
+
+    Args:
+        configs: nombre -> variables de QueryOptimizer
+        spec: Retriever y datasets (ver create_retriever)
+        ks: Cortes para recall@k
+        workers: Procesos en paralelo (por defecto uno por configuración)
+        threads: Consultas concurrentes dentro de cada configuración (útil con Bedrock)
+        limit: Usar solo las primeras N consultas
+
+    Returns:
+        Reporte con las métricas por configuración
+    """
+    queries = load_labeled_queries(spec['labeled'])[:limit]
+    workers = workers or min(len(configs), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = [
+            executor.submit(evaluate_config, name, config, queries, spec, ks, threads)
+            for name, config in configs.items()
+        ]
+        results = [future.result() for future in futures]
+    return {
+        'retriever': spec['retriever'],
+        'queries': len(queries),
+        'k': list(ks),
+        'configs': results,
+    }
+
+
+def parse_config(value: str) -> Tuple[str, Dict[str, Any]]:
+    """Parsea 'nombre:VAR=valor,VAR=valor' (booleanos como true/false)."""
+    name, _, assignments = value.partition(':')
+    config = {}
+    for part in assignments.split(','):
+        if not part.strip():
+            continue
+        key, _, raw = part.partition('=')
+        key = key.strip().upper()
+        if key not in CONFIG_KEYS:
+            raise argparse.ArgumentTypeError(f"Variable no soportada: {key}")
+        config[key] = raw.strip().lower() == 'true' if CONFIG_KEYS[key] is bool else int(raw)
+    return name.strip(), config
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"\n--- Evaluación de recuperación ({report['retriever']}, {report['queries']} consultas) ---")
+    metric_names = [f'recall@{k}' for k in report['k']] + ['mrr']
+    header = ' '.join(f"{name:>9}" for name in metric_names)
+    print(f"{'configuración':<20} {header} {'palabras':>8} {'opt p95':>9} {'ret p50':>9} {'ret p95':>9}")
+    for result in report['configs']:
+        values = ' '.join(f"{result['metrics'][name]:>9.3f}" for name in metric_names)
+        print(f"{result['name']:<20} {values} {result['avg_query_words']:>8} "
+              f"{result['optimize_ms']['p95']:>9} {result['retrieve_ms']['p50']:>9} {result['retrieve_ms']['p95']:>9}")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description='Evalúa recall@k, MRR y latencia de configuraciones de QueryOptimizer con preguntas etiquetadas.'
+    )
+    parser.add_argument('--retriever', choices=['bm25', 'semantic', 'bedrock'], default='bm25')
+    parser.add_argument('--config', action='append', type=parse_config, metavar='NOMBRE:VAR=valor,...',
+                        help='Configuración a evaluar (repetible); por defecto un set de combinaciones')
+    parser.add_argument('--k', default=','.join(str(k) for k in DEFAULT_K), help='Cortes de recall@k')
+    parser.add_argument('--labeled', default=LABELED_DATASET, help='JSONL con alternative_questions')
+    parser.add_argument('--distractors', default=DISTRACTOR_DATASET, help="JSONL de distractores ('' para omitir)")
+    parser.add_argument('--knowledge-base-id', default=os.environ.get('KNOWLEDGE_BASE_ID'))
+    parser.add_argument('--region', default=os.environ.get('AWS_REGION'))
+    parser.add_argument('--search-type', choices=['HYBRID', 'SEMANTIC'], default='HYBRID')
+    parser.add_argument('--cassette', help='Cassette de Bedrock retrieve (.jsonl.gz, ver lambda/bedrock_cassette.py)')
+    parser.add_argument('--record', action='store_true', help='Llamar a Bedrock real y grabar en --cassette')
+    parser.add_argument('--workers', type=int, help='Configuraciones en paralelo (procesos)')
+    parser.add_argument('--threads', type=int, default=1, help='Consultas concurrentes por configuración')
+    parser.add_argument('--limit', type=int, help='Evaluar solo las primeras N consultas')
+    parser.add_argument('--output', help='Guardar el reporte JSON en esta ruta')
+    args = parser.parse_args(argv)
+
+    if args.retriever == 'bedrock' and not args.knowledge_base_id:
+        parser.error('--retriever bedrock requiere --knowledge-base-id o KNOWLEDGE_BASE_ID')
+    if args.record and not args.cassette:
+        parser.error('--record requiere --cassette')
+    if args.record and args.workers != 1:
+        args.workers = 1  # Un solo proceso escribe el cassette
+
+    spec = {
+        'retriever': args.retriever,
+        'labeled': args.labeled,
+        'distractors': args.distractors or None,
+        'knowledge_base_id': args.knowledge_base_id,
+        'region': args.region,
+        'search_type': args.search_type,
+        'cassette': args.cassette,
+        'record': args.record,
+    }
+    configs = dict(args.config) if args.config else DEFAULT_CONFIGS
+    ks = tuple(sorted({int(k) for k in args.k.split(',') if k.strip()}))
+
+    report = run_evaluation(configs, spec, ks, args.workers, args.threads, args.limit)
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nReporte guardado en: '{args.output}'")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,412 @@
+import argparse
+import hashlib
+import json
+import math
+import os
+import re
+import sys
+import unicodedata
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+# --- Configuración ---
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAMBDA_DIR = os.path.join(REPO_DIR, 'lambda')
+DEFAULT_INPUTS = [
+    os.path.join(REPO_DIR, 'dataset', 'dataset_enriquecido.jsonl'),
+    os.path.join(REPO_DIR, 'scraping', 'datasets', 'dataset_final_scraper.jsonl'),
+]
+DEFAULT_OUTPUT = os.path.join(LAMBDA_DIR, 'data', 'query_tables.json')  # Se empaqueta junto a ask_handler.py
+TABLES_VERSION = 1
+
+MIN_TERM_LENGTH = 3
+MIN_DOC_FREQ = 2            # Apariciones mínimas (en registros) de cada término
+MIN_CO_FREQ = 2             # Registros mínimos en que deben coincidir dos términos
+MIN_NPMI = 0.3              # PMI normalizado mínimo para considerar la relación
+MAX_DOC_RATIO = 0.15        # Términos en más registros que esto son ruido de dominio ("duoc", "carrera")
+MAX_CANDIDATES = 8          # Candidatos por término que pasan a validación
+MAX_ENTRIES = 3             # Entradas por término en la tabla final
+HOLDOUT_EVERY = 4           # Evaluación: 1 de cada N preguntas de cada registro queda fuera del minado
+EVAL_K = 5
+# ---------------------
+
+WORD_PATTERN = re.compile(r'\b\w+\b')  # Misma tokenización que QueryOptimizer
+
+STOPWORDS = frozenset("""
+a al algo algun alguna algunas alguno algunos ante antes aquí así aun aunque cada como cómo con contra cual
+cuál cuales cuáles cualquier cuando cuándo cuanto cuánto cuanta cuánta cuantos cuántos cuantas cuántas de del
+desde donde dónde durante e el él ella ellas ellos en entre era es esa esas ese eso esos esta está están estar
+estas este esto estos estoy fue fueron ha han hasta hay la las le les lo los más me mi mis mucho muy nada ni no
+nos nuestra nuestro nuestros nuestras o os otra otras otro otros para pero poco por porque puede pueden puedo
+que qué quien quién quienes se sea según ser si sí sin sobre son su sus también tan tanto te tengo tiene tienen
+toda todas todo todos tu tú tus un una uno unos usted ustedes y ya yo debo debe deben hacer hace existe existen
+saber quiero necesito cuales hay cual otro mismo misma estos estas dicho cómo podría pueda tener algún
+""".split())
+
+
+def read_jsonl(path: str) -> Iterable[Dict[str, Any]]:
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def strip_accents(text: str) -> str:
+    text = unicodedata.normalize('NFKD', text)
+    return ''.join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def content_terms(text: str) -> List[str]:
+    """Tokens en minúsculas sin stopwords, números ni palabras cortas."""
+    return [
+        token for token in WORD_PATTERN.findall(text.lower())
+        if len(token) >= MIN_TERM_LENGTH and not token.isdigit() and token not in STOPWORDS
+    ]
+
+
+def load_records(paths: List[str]) -> List[Dict[str, Any]]:
+    """
+    Registros con su texto indexable, preguntas y keywords. Los registros con el
+    mismo contenido (el crawler repite páginas) se unen en uno.
+
+    Returns:
+        Lista de {'id', 'body', 'questions', 'keywords'}
+    """
+    records: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        for data in read_jsonl(path):
+            body = data.get('answer') or data.get('text') or ''
+            if not body:
+                continue
+            key = (body, data.get('url') or '')
+            record = records.setdefault(key, {'id': str(data['id']), 'body': body, 'questions': [], 'keywords': []})
+            questions = ([data['question']] if data.get('question') else []) + \
+                list(data.get('alternative_questions') or []) + list(data.get('questions') or [])
+            record['questions'].extend(q for q in questions if q not in record['questions'])
+            record['keywords'].extend(k for k in data.get('keywords') or [] if k not in record['keywords'])
+    return list(records.values())
+
+
+def split_questions(records: List[Dict[str, Any]], holdout_every: int) -> Tuple[List[Dict[str, Any]], List[Tuple[str, int]]]:
+    """
+    Separa una de cada `holdout_every` preguntas de cada registro para evaluar.
+
+    Returns:
+        Tupla (registros de entrenamiento, [(pregunta de prueba, índice del registro)])
+    """
+    train, test = [], []
+    for index, record in enumerate(records):
+        kept = []
+        for position, question in enumerate(record['questions']):
+            if holdout_every and position % holdout_every == holdout_every - 1:
+                test.append((question, index))
+            else:
+                kept.append(question)
+        train.append({**record, 'questions': kept})
+    return train, test
+
+
+class BM25:
+    """
+    BM25 sobre los documentos de la KB (texto + preguntas + keywords, como los
+    documentos que genera convert_to_md). Aproxima la parte léxica de la búsqueda
+    híbrida para medir expansiones sin llamar a Bedrock. El score es aditivo por
+    token, así el efecto de agregar un término es sumar su vector.
+    """
+
+    def __init__(self, documents: List[str], k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.count = len(documents)
+        self.postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        lengths = []
+        for doc_id, text in enumerate(documents):
+            tokens = WORD_PATTERN.findall(text.lower())
+            lengths.append(len(tokens))
+            for token, count in Counter(tokens).items():
+                self.postings[token][doc_id] = count
+        self.lengths = np.asarray(lengths, dtype=np.float64)
+        self.avg_length = float(self.lengths.mean()) if self.count else 0.0
+        self._term_vectors: Dict[str, np.ndarray] = {}
+
+    def term_vector(self, token: str) -> np.ndarray:
+        vector = self._term_vectors.get(token)
+        if vector is None:
+            vector = np.zeros(self.count)
+            docs = self.postings.get(token)
+            if docs:
+                idf = math.log(1 + (self.count - len(docs) + 0.5) / (len(docs) + 0.5))
+                doc_ids = np.fromiter(docs.keys(), dtype=np.int64)
+                tf = np.fromiter(docs.values(), dtype=np.float64)
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[doc_ids] / self.avg_length)
+                vector[doc_ids] = idf * tf * (self.k1 + 1) / (tf + norm)
+            self._term_vectors[token] = vector
+        return vector
+
+    def scores(self, query: str) -> np.ndarray:
+        scores = np.zeros(self.count)
+        for token in WORD_PATTERN.findall(query.lower()):
+            scores += self.term_vector(token)
+        return scores
+
+    @staticmethod
+    def rank_in(scores: np.ndarray, gold: int) -> Optional[int]:
+        """Posición (1 = primero) del documento correcto, o None si no tiene score."""
+        gold_score = scores[gold]
+        if gold_score <= 0:
+            return None
+        return 1 + int(np.count_nonzero(scores > gold_score)) + int(np.count_nonzero(scores[:gold] == gold_score))
+
+    def rank_of(self, query: str, gold: int) -> Optional[int]:
+        return self.rank_in(self.scores(query), gold)
+
+
+def kb_documents(records: List[Dict[str, Any]]) -> List[str]:
+    return ['\n'.join([record['body'], ' '.join(record['keywords'])] + record['questions']) for record in records]
+
+
+def association_candidates(left: List[Set[str]], right: List[Set[str]],
+                           same_space: bool) -> Dict[str, List[Tuple[str, float, Set[int]]]]:
+    """
+    Relaciona términos por PMI normalizado de co-ocurrencia en el mismo registro.
+
+    Args:
+        left: Términos de consulta de cada registro (palabras de las preguntas)
+        right: Términos asociados de cada registro (preguntas o keywords)
+        same_space: True si left y right son el mismo espacio (sinónimos)
+
+    Returns:
+        término -> [(término relacionado, npmi, registros donde coinciden)] de mayor a menor npmi
+    """
+    total = len(left)
+    df_left = Counter(term for terms in left for term in terms)
+    df_right = df_left if same_space else Counter(term for terms in right for term in terms)
+    co_records: Dict[Tuple[str, str], Set[int]] = defaultdict(set)
+    for index, (left_terms, right_terms) in enumerate(zip(left, right)):
+        for a in left_terms:
+            for b in right_terms:
+                if a != b:
+                    co_records[(a, b)].add(index)
+
+    max_df = max(MIN_DOC_FREQ, int(total * MAX_DOC_RATIO))
+    candidates: Dict[str, List[Tuple[str, float, Set[int]]]] = defaultdict(list)
+    for (a, b), records in co_records.items():
+        together = len(records)
+        if together < MIN_CO_FREQ:
+            continue
+        if not (MIN_DOC_FREQ <= df_left[a] <= max_df and MIN_DOC_FREQ <= df_right[b] <= max_df):
+            continue
+        if strip_accents(a) == strip_accents(b):
+            continue  # Variantes ortográficas: no aportan a la búsqueda léxica
+        p_ab = together / total
+        npmi = math.log(p_ab / ((df_left[a] / total) * (df_right[b] / total))) / -math.log(p_ab)
+        if npmi >= MIN_NPMI:
+            candidates[a].append((b, npmi, records))
+
+    return {
+        term: sorted(related, key=lambda item: (-item[1], item[0]))[:MAX_CANDIDATES]
+        for term, related in candidates.items()
+    }
+
+
+def shorten(question: str) -> str:
+    """Consulta corta estilo buscador: las dos primeras palabras con contenido."""
+    return ' '.join(content_terms(question)[:2])
+
+
+def validate(candidates: Dict[str, List[Tuple[str, float, Set[int]]]], queries: List[Tuple[str, int]],
+             bm25: BM25) -> Dict[str, List[str]]:
+    """
+    Conserva solo los términos que mejoran el ranking BM25 de las consultas que
+    contienen la clave. Cada par se mide con consultas de *otros* registros (no de
+    los que originaron la co-ocurrencia) para no premiar que el término ya esté en
+    las preguntas del documento correcto, y debe ayudar en al menos MIN_CO_FREQ
+    registros distintos sin empeorar más consultas de las que mejora.
+
+    Returns:
+        término -> términos relacionados validados (mejor ganancia primero)
+    """
+    by_term: Dict[str, List[int]] = defaultdict(list)
+    for position, (query, _) in enumerate(queries):
+        for token in set(WORD_PATTERN.findall(query.lower())):
+            if token in candidates:
+                by_term[token].append(position)
+
+    base_scores: Dict[int, np.ndarray] = {}
+    table = {}
+    for term, related in candidates.items():
+        positions = by_term.get(term)
+        if not positions:
+            continue
+        for position in positions:
+            if position not in base_scores:
+                base_scores[position] = bm25.scores(queries[position][0])
+
+        gains = []
+        for candidate, _, source_records in related:
+            extra = bm25.term_vector(candidate)
+            gain, better, worse, helped_records = 0.0, 0, 0, set()
+            for position in positions:
+                gold = queries[position][1]
+                if gold in source_records:
+                    continue
+                before = bm25.rank_in(base_scores[position], gold)
+                after = bm25.rank_in(base_scores[position] + extra, gold)
+                delta = (1.0 / after if after else 0.0) - (1.0 / before if before else 0.0)
+                gain += delta
+                if delta > 0:
+                    better += 1
+                    helped_records.add(gold)
+                elif delta < 0:
+                    worse += 1
+            if gain > 0 and better > worse and len(helped_records) >= MIN_CO_FREQ:
+                gains.append((gain, candidate))
+        if gains:
+            table[term] = [candidate for _, candidate in sorted(gains, key=lambda item: (-item[0], item[1]))[:MAX_ENTRIES]]
+    return table
+
+
+def with_accent_aliases(table: Dict[str, List[str]]) -> Dict[str, List[str]]:
+    """Agrega la clave sin tildes ("matricula") cuando no existe, porque muchos usuarios no las escriben."""
+    result = dict(table)
+    for term, related in table.items():
+        alias = strip_accents(term)
+        if alias != term and alias not in result:
+            result[alias] = related
+    return dict(sorted(result.items()))
+
+
+def mine_tables(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Mina las tablas de sinónimos (expansión) y de boost (queries cortos).
+
+    Returns:
+        Diccionario {'synonyms', 'boost', 'stats'}
+    """
+    question_terms = [set(content_terms(' '.join(record['questions']))) for record in records]
+    keyword_terms = [set(content_terms(' '.join(record['keywords']))) for record in records]
+    bm25 = BM25(kb_documents(records))
+
+    train_queries = [(question, index) for index, record in enumerate(records) for question in record['questions']]
+    short_queries = [(shorten(question), gold) for question, gold in train_queries if shorten(question)]
+
+    synonym_candidates = association_candidates(question_terms, question_terms, same_space=True)
+    boost_candidates = association_candidates(question_terms, keyword_terms, same_space=False)
+    synonyms = validate(synonym_candidates, train_queries, bm25)
+    boost = validate(boost_candidates, short_queries, bm25)
+    return {
+        'synonyms': with_accent_aliases(synonyms),
+        'boost': with_accent_aliases(boost),
+        'stats': {
+            'records': len(records),
+            'questions': len(train_queries),
+            'synonym_candidates': len(synonym_candidates),
+            'boost_candidates': len(boost_candidates),
+            'synonym_terms': len(synonyms),
+            'boost_terms': len(boost),
+        },
+    }
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def build_table_document(mined: Dict[str, Any], inputs: List[str]) -> Dict[str, Any]:
+    return {
+        'version': TABLES_VERSION,
+        'generated_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'sources': {os.path.relpath(path, REPO_DIR): file_digest(path) for path in inputs if os.path.exists(path)},
+        'params': {
+            'min_doc_freq': MIN_DOC_FREQ, 'min_co_freq': MIN_CO_FREQ, 'min_npmi': MIN_NPMI,
+            'max_doc_ratio': MAX_DOC_RATIO, 'max_entries': MAX_ENTRIES,
+        },
+        'stats': mined['stats'],
+        'synonyms': mined['synonyms'],
+        'boost': mined['boost'],
+        'keyword_boost_terms': [],  # Sin keywords genéricas ("qué", "cuánto"): solo boosts por término
+    }
+
+
+def import_query_optimizer():
+    sys.path.insert(0, os.path.join(REPO_DIR, 'scripts'))
+    from benchmark_handler import import_handler_module
+
+    return import_handler_module()
+
+
+def evaluate(records: List[Dict[str, Any]], k: int = EVAL_K) -> Dict[str, Dict[str, float]]:
+    """
+    Evaluación con preguntas retenidas: las tablas se minan sin ellas y los
+    documentos de la KB tampoco las incluyen.
+
+    Returns:
+        modo -> {'hit@1', 'hit@k', 'mrr', 'avg_tokens'} para preguntas completas y cortas
+    """
+    ask_handler = import_query_optimizer()
+    train, test = split_questions(records, HOLDOUT_EVERY)
+    mined = build_table_document(mine_tables(train), [])
+    bm25 = BM25(kb_documents(train))
+
+    optimizers = {
+        'sin optimizar': None,
+        'tabla fija': ask_handler.QueryOptimizer(),
+        'tabla minada': ask_handler.QueryOptimizer(tables=mined),
+    }
+    query_sets = {
+        'completas': test,
+        'cortas': [(shorten(question), gold) for question, gold in test if shorten(question)],
+    }
+
+    report = {}
+    for query_kind, queries in query_sets.items():
+        for name, optimizer in optimizers.items():
+            texts = [query for query, _ in queries]
+            if optimizer is not None:
+                texts = optimizer.optimize_queries(texts)
+            ranks = [bm25.rank_of(text, gold) for text, (_, gold) in zip(texts, queries)]
+            total = len(ranks) or 1
+            report[f"{query_kind} / {name}"] = {
+                'queries': len(ranks),
+                'hit@1': sum(1 for rank in ranks if rank == 1) / total,
+                f'hit@{k}': sum(1 for rank in ranks if rank and rank <= k) / total,
+                'mrr': sum(1.0 / rank for rank in ranks if rank) / total,
+                'avg_tokens': sum(len(WORD_PATTERN.findall(text)) for text in texts) / total,
+            }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mina tablas de sinónimos y boost (PMI) para QueryOptimizer")
+    parser.add_argument('inputs', nargs='*', default=DEFAULT_INPUTS, help="JSONL enriquecidos")
+    parser.add_argument('--output', default=DEFAULT_OUTPUT)
+    parser.add_argument('--evaluate', action='store_true', help="Medir con preguntas retenidas antes de escribir")
+    args = parser.parse_args()
+
+    records = load_records(args.inputs)
+    if args.evaluate:
+        print(f"📊 Evaluación (1 de cada {HOLDOUT_EVERY} preguntas retenida, BM25 sobre documentos de la KB):")
+        for name, metrics in evaluate(records).items():
+            values = ' | '.join(f"{key}: {value:.3f}" if isinstance(value, float) else f"{key}: {value}"
+                                for key, value in metrics.items())
+            print(f"   • {name:<26} {values}")
+
+    table = build_table_document(mine_tables(records), args.inputs)
+    os.makedirs(os.path.dirname(args.output), exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(table, f, ensure_ascii=False, indent=1)
+    print(f"✅ Tablas v{TABLES_VERSION}: {len(table['synonyms'])} términos con sinónimos, "
+          f"{len(table['boost'])} con boost -> {args.output} ({os.path.getsize(args.output) / 1024:.1f} KiB)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+import argparse
+import filecmp
+import os
+import shutil
+import sys
+from typing import List, Optional
+
+# --- Configuración ---
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCE_DATASET = os.path.join(REPO_DIR, 'dataset', 'dataset_enriquecido.jsonl')
+LAMBDA_COPY = os.path.join(REPO_DIR, 'lambda', 'dataset_enriquecido.jsonl')  # Se empaqueta junto a ask_handler.py
+# ---------------------
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description='Copia las FAQ curadas dentro de lambda/ (respaldo léxico del admission control).'
+    )
+    parser.add_argument('--check', action='store_true',
+                        help='Solo verificar que la copia de lambda/ está al día (código 1 si no)')
+    args = parser.parse_args(argv)
+
+    in_sync = os.path.exists(LAMBDA_COPY) and filecmp.cmp(SOURCE_DATASET, LAMBDA_COPY, shallow=False)
+    if args.check:
+        if not in_sync:
+            print(f"❌ {os.path.relpath(LAMBDA_COPY, REPO_DIR)} no coincide con "
+                  f"{os.path.relpath(SOURCE_DATASET, REPO_DIR)}: ejecutar scripts/sync_lambda_faq.py")
+            sys.exit(1)
+        print("✅ FAQ de respaldo de lambda/ al día")
+        return
+
+    if in_sync:
+        print("✅ FAQ de respaldo de lambda/ ya estaba al día")
+        return
+    shutil.copyfile(SOURCE_DATASET, LAMBDA_COPY)
+    print(f"✅ Copiado {os.path.relpath(SOURCE_DATASET, REPO_DIR)} -> {os.path.relpath(LAMBDA_COPY, REPO_DIR)}")
+
+
+if __name__ == '__main__':
+    main()
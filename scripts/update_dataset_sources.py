@@ -0,0 +1,294 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# --- Configuración ---
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_INPUTS = [
+    os.path.join(REPO_DIR, 'dataset', 'dataset_enriquecido.jsonl'),
+    os.path.join(REPO_DIR, 'scraping', 'datasets', 'dataset_final_scraper.jsonl'),
+]
+KB_TARGET = os.environ.get('KB_SYNC_TARGET')  # s3://bucket/prefijo/ o un directorio local
+KB_MANIFEST_KEY = os.environ.get('KB_SYNC_MANIFEST_KEY', 'kb-sync/manifest.json')  # Fuera del prefijo indexado
+KNOWLEDGE_BASE_ID = os.environ.get('KNOWLEDGE_BASE_ID')
+KB_DATA_SOURCE_ID = os.environ.get('KB_DATA_SOURCE_ID')
+AWS_REGION = os.environ.get('AWS_REGION', 'us-east-1')
+SYNC_WORKERS = int(os.environ.get('KB_SYNC_WORKERS', '8'))
+INGESTION_POLL_SECONDS = 10
+METADATA_SUFFIX = '.metadata.json'
+# ---------------------
+
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+
+from convert_to_md import kb_document_name, kb_metadata, render_markdown
+
+
+class DirectoryBackend:
+    """Backend local que imita el bucket: cada key es un archivo bajo `root`."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def describe(self) -> str:
+        return self.root
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split('/'))
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def put(self, key: str, body: bytes, content_type: str) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(body)
+        os.replace(tmp_path, path)
+
+    def delete(self, keys: List[str]) -> None:
+        for key in keys:
+            path = self._path(key)
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class S3Backend:
+    """Bucket S3 del data source de la Knowledge Base."""
+
+    def __init__(self, bucket: str, client=None):
+        self.bucket = bucket
+        if client is None:
+            import boto3
+            client = boto3.client('s3', region_name=AWS_REGION)
+        self.client = client
+
+    def describe(self) -> str:
+        return f"s3://{self.bucket}"
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=key)['Body'].read()
+        except self.client.exceptions.NoSuchKey:
+            return None
+
+    def put(self, key: str, body: bytes, content_type: str) -> None:
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=body, ContentType=content_type)
+
+    def delete(self, keys: List[str]) -> None:
+        # delete_objects acepta hasta 1000 keys por llamada
+        for start in range(0, len(keys), 1000):
+            batch = keys[start:start + 1000]
+            self.client.delete_objects(
+                Bucket=self.bucket,
+                Delete={'Objects': [{'Key': key} for key in batch], 'Quiet': True},
+            )
+
+
+def open_target(target: str) -> Tuple[object, str]:
+    """
+    Resuelve el destino de la sincronización.
+
+    Args:
+        target: 's3://bucket/prefijo/' o una ruta de directorio local
+
+    Returns:
+        Tupla (backend, prefijo de los documentos dentro del backend)
+    """
+    if target.startswith('s3://'):
+        bucket, _, prefix = target[len('s3://'):].partition('/')
+        return S3Backend(bucket), prefix.rstrip('/') + '/' if prefix else ''
+    return DirectoryBackend(target), 'documentos/'
+
+
+def build_documents(inputs: Iterable[str], prefix: str) -> Tuple[Dict[str, Dict], int]:
+    """
+    Construye los documentos de la KB (Markdown + sidecar) desde los JSONL enriquecidos.
+
+    Returns:
+        Tupla (key -> {hash, id, body, metadata}, registros leídos). Los registros
+        repetidos (mismo id y URL) se colapsan en un documento, gana el último.
+    """
+    documents = {}
+    records = 0
+    for path in inputs:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                data = json.loads(line)
+                records += 1
+                body = render_markdown(data).encode('utf-8')
+                metadata = json.dumps(kb_metadata(data), ensure_ascii=False, sort_keys=True).encode('utf-8')
+                key = prefix + kb_document_name(data)
+                documents[key] = {
+                    'id': str(data['id']),
+                    'hash': hashlib.sha256(body + b'\0' + metadata).hexdigest(),
+                    'body': body,
+                    'metadata': metadata,
+                }
+    return documents, records
+
+
+def load_manifest(backend, manifest_key: str) -> Dict:
+    raw = backend.get(manifest_key)
+    if not raw:
+        return {'version': 1, 'documents': {}}
+    return json.loads(raw.decode('utf-8'))
+
+
+def diff_documents(documents: Dict[str, Dict], manifest: Dict) -> Tuple[List[str], List[str], List[str]]:
+    """Devuelve (agregados, modificados, eliminados) comparando hashes con el manifiesto."""
+    previous = manifest.get('documents', {})
+    added = sorted(key for key in documents if key not in previous)
+    changed = sorted(key for key in documents if key in previous and previous[key]['hash'] != documents[key]['hash'])
+    removed = sorted(key for key in previous if key not in documents)
+    return added, changed, removed
+
+
+def upload_document(backend, key: str, document: Dict) -> str:
+    # Primero el sidecar: la KB nunca ve el documento nuevo con la metadata antigua
+    backend.put(key + METADATA_SUFFIX, document['metadata'], 'application/json')
+    backend.put(key, document['body'], 'text/markdown; charset=utf-8')
+    return key
+
+
+def start_ingestion(knowledge_base_id: str, data_source_id: str, summary: str, wait: bool = False) -> Dict:
+    """
+    Lanza un ingestion job del data source. Bedrock solo re-procesa los objetos
+    nuevos, modificados o eliminados desde la última ingesta.
+    """
+    import boto3
+    client = boto3.client('bedrock-agent', region_name=AWS_REGION)
+    job = client.start_ingestion_job(
+        knowledgeBaseId=knowledge_base_id,
+        dataSourceId=data_source_id,
+        description=summary[:200],
+    )['ingestionJob']
+
+    while wait and job['status'] in ('STARTING', 'IN_PROGRESS'):
+        time.sleep(INGESTION_POLL_SECONDS)
+        job = client.get_ingestion_job(
+            knowledgeBaseId=knowledge_base_id,
+            dataSourceId=data_source_id,
+            ingestionJobId=job['ingestionJobId'],
+        )['ingestionJob']
+    return job
+
+
+def sync(inputs: List[str], backend, prefix: str, manifest_key: str = KB_MANIFEST_KEY,
+         dry_run: bool = False, workers: int = SYNC_WORKERS) -> Dict:
+    """
+    Sincroniza el data source con los datasets: sube solo lo agregado o modificado
+    y elimina lo que ya no existe. El manifiesto se actualiza con lo que se aplicó
+    con éxito, así un reintento solo repite lo que falló.
+
+    Returns:
+        Resumen con los conteos, bytes subidos y errores
+    """
+    documents, records = build_documents(inputs, prefix)
+    manifest = load_manifest(backend, manifest_key)
+    added, changed, removed = diff_documents(documents, manifest)
+    to_upload = added + changed
+
+    summary = {
+        'records': records,
+        'documents': len(documents),
+        'added': len(added),
+        'changed': len(changed),
+        'removed': len(removed),
+        'unchanged': len(documents) - len(to_upload),
+        'upload_bytes': sum(len(documents[key]['body']) + len(documents[key]['metadata']) for key in to_upload),
+        'total_bytes': sum(len(doc['body']) + len(doc['metadata']) for doc in documents.values()),
+        'errors': [],
+    }
+    if dry_run or not (to_upload or removed):
+        return summary
+
+    entries = dict(manifest.get('documents', {}))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(upload_document, backend, key, documents[key]): key for key in to_upload}
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                future.result()
+                entries[key] = {'id': documents[key]['id'], 'hash': documents[key]['hash']}
+            except Exception as e:
+                summary['errors'].append(f"{key}: {e}")
+
+    if removed:
+        try:
+            backend.delete([key for name in removed for key in (name, name + METADATA_SUFFIX)])
+            for key in removed:
+                entries.pop(key, None)
+        except Exception as e:
+            summary['errors'].append(f"delete: {e}")
+
+    manifest = {
+        'version': 1,
+        'updated_at': datetime.now(timezone.utc).isoformat(),
+        'documents': dict(sorted(entries.items())),
+    }
+    backend.put(manifest_key, json.dumps(manifest, ensure_ascii=False, indent=1).encode('utf-8'), 'application/json')
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sincroniza solo los documentos modificados con el data source de la KB")
+    parser.add_argument('inputs', nargs='*', default=DEFAULT_INPUTS, help="JSONL enriquecidos")
+    parser.add_argument('--target', default=KB_TARGET, help="s3://bucket/prefijo/ o directorio local (KB_SYNC_TARGET)")
+    parser.add_argument('--manifest-key', default=KB_MANIFEST_KEY)
+    parser.add_argument('--dry-run', action='store_true', help="Solo mostrar el diff")
+    parser.add_argument('--no-ingest', action='store_true', help="No lanzar el ingestion job")
+    parser.add_argument('--wait', action='store_true', help="Esperar a que termine la ingesta")
+    args = parser.parse_args()
+
+    if not args.target:
+        parser.error("Falta --target (o la variable KB_SYNC_TARGET)")
+
+    backend, prefix = open_target(args.target)
+    summary = sync(args.inputs, backend, prefix, args.manifest_key, args.dry_run)
+
+    changed_ratio = summary['upload_bytes'] / summary['total_bytes'] if summary['total_bytes'] else 0.0
+    print(f"📚 {summary['records']} registros -> {summary['documents']} documentos en {backend.describe()}/{prefix}")
+    print(f"   • Agregados: {summary['added']} | Modificados: {summary['changed']} | "
+          f"Eliminados: {summary['removed']} | Sin cambios: {summary['unchanged']}")
+    print(f"   • A subir: {summary['upload_bytes'] / 1024:.1f} KiB "
+          f"({changed_ratio:.1%} del corpus, ~{summary['upload_bytes'] // 4} tokens a embeber)")
+    for error in summary['errors']:
+        print(f"❌ {error}")
+
+    if args.dry_run:
+        print("🔎 Dry run: no se modificó nada")
+        return
+    if summary['errors']:
+        sys.exit(1)
+
+    nothing_changed = not (summary['added'] or summary['changed'] or summary['removed'])
+    if nothing_changed:
+        print("✅ Data source al día, no se lanza ingesta")
+    elif args.no_ingest or not isinstance(backend, S3Backend):
+        print("✅ Sincronizado (sin ingestion job)")
+    elif not (KNOWLEDGE_BASE_ID and KB_DATA_SOURCE_ID):
+        print("⚠️  Sincronizado, pero faltan KNOWLEDGE_BASE_ID / KB_DATA_SOURCE_ID para lanzar la ingesta")
+    else:
+        description = f"sync +{summary['added']} ~{summary['changed']} -{summary['removed']}"
+        job = start_ingestion(KNOWLEDGE_BASE_ID, KB_DATA_SOURCE_ID, description, args.wait)
+        print(f"🚀 Ingestion job {job['ingestionJobId']}: {job['status']}")
+        if job.get('statistics'):
+            print(f"   • {json.dumps(job['statistics'])}")
+
+
+if __name__ == '__main__':
+    main()